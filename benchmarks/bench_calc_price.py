@@ -0,0 +1,73 @@
+"""
+集合競價結算價 (_calc_price) 的效能測試：比較新版 (累積和) 與舊版逐價位加總在不同訂單數下的耗時。
+兩者結果是否完全一致由 tests/test_orderbook.py 的差異比對負責。
+
+執行方式 (在專案根目錄)：
+    python -m benchmarks.bench_calc_price
+    python -m benchmarks.bench_calc_price --sizes 1000 10000 100000
+"""
+import argparse
+import random
+import time
+
+from core import orderbook
+from core.models import Order
+
+def legacy_calc_price(bids, asks, last_price):
+    """舊版 Phase4Settlement._calc_price (O(價位數 × 訂單數))，作為比對基準。"""
+    if not bids or not asks: return last_price, 0
+    prices = sorted(list(set([o.price for o in bids] + [o.price for o in asks])))
+    max_vol = 0
+    best_price = last_price
+    candidates = []
+    for p in prices:
+        demand = sum(o.quantity for o in bids if o.price >= p)
+        supply = sum(o.quantity for o in asks if o.price <= p)
+        vol = min(demand, supply)
+        if vol > max_vol:
+            max_vol = vol
+            candidates = [p]
+        elif vol == max_vol and vol > 0:
+            candidates.append(p)
+    if max_vol == 0:
+        return best_price, 0
+    candidates.sort(key=lambda x: abs(x - last_price))
+    return candidates[0], max_vol
+
+def random_book(rng: random.Random, n: int, spread: int):
+    """價位集中在少數整數附近，刻意製造大量同量、等距的平手情況。"""
+    center = rng.randint(50, 150)
+    orders = []
+    for _ in range(n):
+        side = rng.choice(("BID", "ASK"))
+        orders.append(Order(player_id="p", type=side, item_id="x",
+                            price=max(1, center + rng.randint(-spread, spread)),
+                            quantity=rng.randint(1, 5)))
+    bids = [o for o in orders if o.type == "BID"]
+    asks = [o for o in orders if o.type == "ASK"]
+    return bids, asks, center + rng.randint(-spread, spread)
+
+def timed(fn, *args) -> float:
+    start = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - start
+
+def bench(sizes, seed: int):
+    rng = random.Random(seed)
+    for n in sizes:
+        bids, asks, last = random_book(rng, n, 200)
+        line = f"{n:>8} 筆 ({len(set(o.price for o in bids + asks))} 個價位) | "
+        line += f"累積和 {timed(orderbook.clearing_price, bids, asks, last) * 1000:8.2f} ms"
+        if n <= 20000:  # 舊版在更大的訂單簿上要跑好幾分鐘
+            line += f" | 舊版 {timed(legacy_calc_price, bids, asks, last) * 1000:10.2f} ms"
+        print(line)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000, 100000])
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    bench(args.sizes, args.seed)
+
+if __name__ == "__main__":
+    main()
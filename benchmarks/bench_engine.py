@@ -0,0 +1,265 @@
+"""
+引擎熱點的微型效能測試：在可調整大小的合成狀態上，單獨計時各個結算 / 生產方法。
+
+每個測項每次重複前都重新建立狀態 (這些方法會修改玩家與訂單)，建立狀態的時間不計入。
+結果可存成 JSON，之後用 --compare 與舊的結果比較，優化前後各跑一次就有數據佐證。
+
+測項 (依「玩家數」或「訂單數」決定規模)：
+    calc_price / settle / match_market_orders / gov_auction   → 訂單數
+    production / production_omni / end_of_turn / game_set      → 玩家數
+    plan (生產規劃，快取清空後每位玩家各算一次)                → 玩家數
+
+計時前先做設施列表 (core.models.Factories) 的差異比對：隨機建造、替換 (含切片指派)、拆除、升級，
+id 索引與彙總值必須和一般 list 的線性搜尋 / 重新計算完全一致，不一致就直接中止。
+
+執行方式 (在專案根目錄)：
+    python -m benchmarks.bench_engine
+    python -m benchmarks.bench_engine --players 100 1000 --orders 10000 --json before.json
+    python -m benchmarks.bench_engine --json after.json --compare before.json
+    python -m benchmarks.bench_engine --only settle match_market_orders
+"""
+import argparse
+import json
+import platform
+import random
+import statistics
+import time
+from typing import Callable, Dict, List, Tuple
+
+import config
+from core.engine import GameEngine
+from core.inventory import TIER_ITEMS
+from core.models import Factories, Factory, Order, PlayerState
+from core.planner import plan_production
+
+ORDER_PLAYERS = 200  # 訂單類測項的玩家數 (訂單平均分給這些玩家)
+BENCH_ITEM = "silicon"
+GOV_EVENT_ID = "L-05"  # 收購目標最多、限額類型為 MIXED 的政府收購案
+DEFENSE_EVENT_ID = "EVT_03"  # 防禦檢定 (現金減半)，回合結算會走過事件懲罰分支
+
+# --- 合成狀態 ---
+def make_player(i: int, rng: random.Random, rich: bool = False) -> PlayerState:
+    inventory = {k: 10 ** 9 if rich else rng.randint(0, 30) for k in config.ITEMS}
+    return PlayerState(
+        id=f"p{i}", name=f"p{i}", money=10 ** 12 if rich else rng.randint(0, 200000),
+        inventory=inventory, locked_inventory=dict(inventory) if rich else {},
+        locked_money=10 ** 15 if rich else 0,
+        factories=[Factory(id=f"f{i}-{t}", tier=t, name="Miner" if t == 0 else f"Factory T{t}") for t in range(4)],
+    )
+
+def make_players(n: int, rng: random.Random, rich: bool = False) -> Dict[str, PlayerState]:
+    return {f"p{i}": make_player(i, rng, rich) for i in range(n)}
+
+def make_orders(n: int, rng: random.Random, item_ids=None) -> List[Order]:
+    """買價略低、賣價略高，約一半的訂單會落在可成交區間。"""
+    item_ids = item_ids or list(config.ITEMS)
+    orders = []
+    for i in range(n):
+        item = rng.choice(item_ids)
+        base = config.ITEMS[item]["base_price"] or 500
+        side = "BID" if rng.random() < 0.5 else "ASK"
+        price = int(base * rng.uniform(0.8, 1.05)) if side == "BID" else int(base * rng.uniform(0.95, 1.2))
+        orders.append(Order(player_id=f"p{rng.randrange(ORDER_PLAYERS)}", type=side, item_id=item,
+                            price=price, quantity=rng.randint(1, 20), timestamp=float(i)))
+    return orders
+
+def single_book(n: int, rng: random.Random) -> Tuple[GameEngine, List[Order], List[Order]]:
+    engine = GameEngine()
+    for o in make_orders(n, rng, [BENCH_ITEM]):
+        engine.orders.add(o)
+    book = engine.orders.book(BENCH_ITEM)
+    return engine, book.sorted_bids(), book.sorted_asks()
+
+# --- 測項：setup(n, rng) 回傳要計時的無參數函式 ---
+def case_calc_price(n, rng):
+    engine, bids, asks = single_book(n, rng)
+    return lambda: engine._calc_price(bids, asks, BENCH_ITEM)
+
+def case_settle(n, rng):
+    engine, bids, asks = single_book(n, rng)
+    players = make_players(ORDER_PLAYERS, rng, rich=True)
+    price, volume = engine._calc_price(bids, asks, BENCH_ITEM)
+    return lambda: engine._settle(players, bids, asks, price, volume, BENCH_ITEM)
+
+def case_match_market_orders(n, rng):
+    engine = GameEngine()
+    for o in make_orders(n, rng):
+        engine.orders.add(o)
+    players = make_players(ORDER_PLAYERS, rng, rich=True)
+    return lambda: engine.match_market_orders(players)
+
+def case_gov_auction(n, rng):
+    engine = GameEngine()
+    engine.active_gov_event = next(e for e in config.GOV_ACQUISITIONS if e["id"] == GOV_EVENT_ID)
+    targets = engine.active_gov_event["targets"]
+    engine.gov_orders = [Order(player_id=f"p{rng.randrange(ORDER_PLAYERS)}", type="GOV_ASK",
+                               item_id=rng.choice(targets), price=rng.randint(1000, 12000),
+                               quantity=rng.randint(1, 5), timestamp=float(i)) for i in range(n)]
+    players = make_players(ORDER_PLAYERS, rng, rich=True)
+    return lambda: engine._execute_gov_auction(players)
+
+def _production(n, rng, omni: bool):
+    engine = GameEngine()
+    players = list(make_players(n, rng).values())
+    jobs = []
+    for p in players:
+        if omni:
+            # 只給替代品：配方原料全部缺貨，必須走同階級替代的代扣邏輯
+            target = rng.choice(TIER_ITEMS[3]) # 萬能工廠是 T3，只能生產 T3 產品
+            recipe = config.ITEMS[target]["recipe"]
+            for ing in recipe: p.inventory[ing] = 0
+            for tier in {config.ITEMS[ing]["tier"] for ing in recipe}:
+                for sub in TIER_ITEMS[tier]:
+                    if sub not in recipe: p.inventory[sub] = 100
+            p.factories.append(Factory(id=f"omni-{p.id}", tier=3, name="Omni Factory"))
+            jobs.append((p, f"omni-{p.id}", target))
+        else:
+            target = rng.choice(TIER_ITEMS[1])
+            for ing in config.ITEMS[target]["recipe"]: p.inventory[ing] = 100
+            jobs.append((p, f"f{p.id[1:]}-1", target))
+
+    def run():
+        for p, factory_id, target in jobs:
+            ok, msg = engine.process_production(p, factory_id, target, 1)
+            assert ok, msg
+    return run
+
+def case_production(n, rng):
+    return _production(n, rng, omni=False)
+
+def case_production_omni(n, rng):
+    return _production(n, rng, omni=True)
+
+def case_end_of_turn(n, rng):
+    engine = GameEngine()
+    engine.current_event = next(e for e in config.EVENTS_DB if e["id"] == DEFENSE_EVENT_ID)
+    players = make_players(n, rng)
+    return lambda: engine.process_end_of_turn(players)
+
+def case_game_set(n, rng):
+    engine = GameEngine()
+    players = make_players(n, rng)
+    return lambda: engine.game_set(players)
+
+def case_plan(n, rng):
+    engine = GameEngine()
+    players = list(make_players(n, rng).values())
+    plan_production.cache_clear() # 量的是實際搜尋，不是快取命中
+    def run():
+        for p in players:
+            engine.plan_production(p)
+    return run
+
+# --- 設施列表的差異比對 ---
+def _random_factory(rng: random.Random) -> Factory:
+    # 代碼只從少數幾個中挑，刻意製造重複代碼
+    return Factory(id=f"f{rng.randrange(6)}", tier=rng.randint(0, 3),
+                   name=rng.choice(["Miner", "Factory T1", "Omni Factory", "Defense"]))
+
+def check_factories(cases: int, seed: int):
+    rng = random.Random(seed)
+    for case in range(cases):
+        fs, plain = Factories(), []
+        for step in range(30):
+            op = rng.choice(["append", "insert", "set", "set_slice", "del", "del_slice", "remove", "set_tier"])
+            f = _random_factory(rng)
+            if op == "append":
+                fs.append(f); plain.append(f)
+            elif op == "insert":
+                i = rng.randint(0, len(plain)); fs.insert(i, f); plain.insert(i, f)
+            elif op == "set_slice":
+                i, j = sorted((rng.randint(0, len(plain)), rng.randint(0, len(plain))))
+                new = [_random_factory(rng) for _ in range(rng.randint(0, 3))]
+                fs[i:j] = new; plain[i:j] = new
+            elif op == "del_slice":
+                i, j = sorted((rng.randint(0, len(plain)), rng.randint(0, len(plain))))
+                del fs[i:j]; del plain[i:j]
+            elif not plain:
+                continue
+            elif op == "set":
+                i = rng.randrange(len(plain)); fs[i] = f; plain[i] = f
+            elif op == "del":
+                i = rng.randrange(len(plain)); del fs[i]; del plain[i]
+            elif op == "remove":
+                g = rng.choice(plain); fs.remove(g); plain.remove(g)
+            else:
+                g = rng.choice(plain); fs.set_tier(g, rng.randint(0, 3))
+
+            assert list(fs) == plain, f"第 {case} 組第 {step} 步 ({op})：列表內容不一致"
+            for i in range(6):
+                expected = next((g for g in plain if g.id == f"f{i}"), None)
+                assert fs.get(f"f{i}") is expected, f"第 {case} 組第 {step} 步 ({op})：get('f{i}') 找到的設施不一致"
+            fresh = Factories(plain)
+            assert (fs.cp_total, fs.storage_points, fs.defenses, fs.counts) == \
+                   (fresh.cp_total, fresh.storage_points, fresh.defenses, fresh.counts), \
+                f"第 {case} 組第 {step} 步 ({op})：彙總值不一致"
+    print(f"差異比對通過：{cases} 組隨機設施操作，Factories 的索引與彙總值與一般 list 一致")
+
+# 測項名稱 -> (規模依據, setup)
+CASES: Dict[str, Tuple[str, Callable]] = {
+    "calc_price": ("orders", case_calc_price),
+    "settle": ("orders", case_settle),
+    "match_market_orders": ("orders", case_match_market_orders),
+    "gov_auction": ("orders", case_gov_auction),
+    "production": ("players", case_production),
+    "production_omni": ("players", case_production_omni),
+    "end_of_turn": ("players", case_end_of_turn),
+    "game_set": ("players", case_game_set),
+    "plan": ("players", case_plan),
+}
+
+def measure(setup: Callable, n: int, repeat: int, seed: int) -> List[float]:
+    times = []
+    for r in range(repeat):
+        fn = setup(n, random.Random(seed + r))
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return times
+
+def result_key(r: dict) -> Tuple[str, int]:
+    return r["case"], r["size"]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--players", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--orders", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=11)
+    parser.add_argument("--only", nargs="+", choices=list(CASES), help="只跑指定的測項")
+    parser.add_argument("--json", help="把結果寫成 JSON 檔")
+    parser.add_argument("--compare", help="與先前 --json 存下的結果比較")
+    args = parser.parse_args()
+    check_factories(300, args.seed)
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = {result_key(r): r for r in json.load(f)["results"]}
+
+    results = []
+    for name, (dimension, setup) in CASES.items():
+        if args.only and name not in args.only: continue
+        for n in (args.players if dimension == "players" else args.orders):
+            times = measure(setup, n, args.repeat, args.seed)
+            r = {
+                "case": name, "dimension": dimension, "size": n, "repeat": args.repeat,
+                "min_ms": min(times) * 1000, "median_ms": statistics.median(times) * 1000,
+                "mean_ms": statistics.mean(times) * 1000,
+            }
+            results.append(r)
+            line = f"{name:<20} {dimension:>7}={n:<7} | 最快 {r['min_ms']:9.2f} ms | 中位數 {r['median_ms']:9.2f} ms"
+            old = baseline.get(result_key(r))
+            if old:
+                line += f" | 對照 {old['median_ms']:9.2f} ms ({r['median_ms'] / old['median_ms']:5.2f}x)"
+            print(line)
+
+    if args.json:
+        meta = {"created_at": time.time(), "python": platform.python_version(),
+                "platform": platform.platform(), "seed": args.seed}
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"meta": meta, "results": results}, f, ensure_ascii=False, indent=2)
+        print(f"結果已寫入 {args.json}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+"""
+HTTP 壓力測試：在本機啟動 main:app，模擬 N 位玩家同時連線遊玩。
+
+每位模擬玩家會：
+- 註冊，之後像 game.js 的輪詢模式一樣每秒 GET /api/state 一次 (帶 since，只取回變動的區塊)
+- 行動階段每隔幾秒生產 / 建造 / 賣給銀行，交易階段在市價附近掛買賣單、偶爾撤單
+另有一個管理員客戶端每隔 --phase-seconds 秒呼叫 /admin/next_phase 推進階段。
+
+每個玩家人數各用一個新房間跑完，最後列出每個端點的吞吐量與 p50 / p95 / p99 延遲，
+以及 /admin/next_phase 的耗時隨玩家人數的變化。加上 --json 可把結果存檔，方便追蹤效能回歸。
+注意：模擬客戶端與伺服器跑在同一台機器上，人數很多時客戶端本身也會吃掉不少 CPU。
+
+執行方式 (在專案根目錄)：
+    python -m benchmarks.bench_http
+    python -m benchmarks.bench_http --players 10 50 --turns 1 --phase-seconds 2 --json bench_http.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional
+
+import httpx
+
+import config
+from core.inventory import TIER_ITEMS
+
+class Recorder:
+    """依端點收集每次請求的延遲 (秒) 與狀態碼。"""
+    def __init__(self):
+        self.latency: Dict[str, List[float]] = {}
+        self.rejected: Dict[str, int] = {}  # 4xx：多半是遊戲規則拒絕 (現金不足、非交易階段…)
+        self.errors: Dict[str, int] = {}    # 5xx 或連線錯誤
+
+    async def call(self, client: httpx.AsyncClient, method: str, url: str, name: str, **kwargs) -> Optional[httpx.Response]:
+        start = time.perf_counter()
+        try:
+            res = await client.request(method, url, **kwargs)
+        except httpx.HTTPError:
+            self.errors[name] = self.errors.get(name, 0) + 1
+            return None
+        self.latency.setdefault(name, []).append(time.perf_counter() - start)
+        if res.status_code >= 500:
+            self.errors[name] = self.errors.get(name, 0) + 1
+        elif res.status_code >= 400:
+            self.rejected[name] = self.rejected.get(name, 0) + 1
+        return res
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values: return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * pct / 100))]
+
+class SimPlayer:
+    """一位模擬玩家：把 /api/state 的增量合併成本地狀態，依階段挑選要呼叫的操作。"""
+    def __init__(self, index: int, base: str, rec: Recorder, action_interval: float):
+        self.name = f"bench-{index}"
+        self.base = base
+        self.rec = rec
+        self.action_interval = action_interval
+        self.rng = random.Random(index)
+        self.player_id: Optional[str] = None
+        self.state: dict = {}
+        self.version: Optional[str] = None
+        self.order_ids: List[str] = []
+
+    async def run(self, client: httpx.AsyncClient, stop: asyncio.Event):
+        res = await self.rec.call(client, "POST", f"{self.base}/api/register", "POST /api/register",
+                                  json={"name": self.name})
+        if res is None or res.status_code != 200: return
+        self.player_id = res.json()["player_id"]
+        await asyncio.gather(self.poll(client, stop), self.act(client, stop))
+
+    async def poll(self, client: httpx.AsyncClient, stop: asyncio.Event):
+        await asyncio.sleep(self.rng.random()) # 錯開每位玩家的輪詢時間點
+        while not stop.is_set():
+            params = {"items_meta": "false", "player_id": self.player_id}
+            if self.version is not None: params["since"] = self.version
+            res = await self.rec.call(client, "GET", f"{self.base}/api/state", "GET /api/state", params=params)
+            if res is not None and res.status_code == 200:
+                delta = res.json()
+                self.state = delta if delta.get("snapshot") else {**self.state, **delta}
+                self.version = delta["version"]
+            await asyncio.sleep(1)
+
+    async def act(self, client: httpx.AsyncClient, stop: asyncio.Event):
+        while not stop.is_set():
+            await asyncio.sleep(self.action_interval * self.rng.uniform(0.5, 1.5))
+            player, phase = self.state.get("player"), self.state.get("phase")
+            if not player: continue
+            if phase == 2: await self.action_phase(client, player)
+            elif phase == 3: await self.trading_phase(client, player)
+
+    async def action_phase(self, client: httpx.AsyncClient, player: dict):
+        rng, pid = self.rng, self.player_id
+        choice = rng.random()
+        if choice < 0.5:
+            f = rng.choice(player["factories"])
+            items = TIER_ITEMS[0] if "Miner" in f["name"] else TIER_ITEMS.get(f["tier"], TIER_ITEMS[1])
+            await self.rec.call(client, "POST", f"{self.base}/api/produce", "POST /api/produce",
+                                json={"player_id": pid, "factory_id": f["id"], "target_item": rng.choice(items)})
+        elif choice < 0.75:
+            await self.rec.call(client, "POST", f"{self.base}/api/build", "POST /api/build",
+                                json={"player_id": pid, "target_tier": 1, "payment_materials": rng.sample(TIER_ITEMS[0], 2)})
+        else:
+            await self.rec.call(client, "POST", f"{self.base}/api/bank_sell", "POST /api/bank_sell",
+                                json={"player_id": pid, "item_id": rng.choice(TIER_ITEMS[0]), "quantity": rng.randint(1, 3)})
+
+    async def trading_phase(self, client: httpx.AsyncClient, player: dict):
+        rng, pid = self.rng, self.player_id
+        if self.order_ids and rng.random() < 0.2:
+            order_id = self.order_ids.pop(rng.randrange(len(self.order_ids)))
+            await self.rec.call(client, "DELETE", f"{self.base}/api/orders/{order_id}", "DELETE /api/orders",
+                                params={"player_id": pid})
+            return
+        item_id = rng.choice(TIER_ITEMS[rng.randint(0, 1)])
+        market = self.state.get("market_prices", {}).get(item_id, config.ITEMS[item_id]["base_price"])
+        res = await self.rec.call(client, "POST", f"{self.base}/api/trade", "POST /api/trade", json={
+            "player_id": pid, "type": rng.choice(("BID", "ASK")), "item_id": item_id,
+            "price": int(market * rng.uniform(0.9, 1.1)), "quantity": rng.randint(1, 3)
+        })
+        if res is not None and res.status_code == 200:
+            self.order_ids.append(res.json()["order_id"])
+
+async def run_level(host: str, players: int, turns: int, phase_seconds: float,
+                    action_interval: float, connections: int) -> dict:
+    """開一個新房間，讓 players 位玩家玩 turns 回合，回傳這一輪的統計。"""
+    rec = Recorder()
+    limits = httpx.Limits(max_connections=connections, max_keepalive_connections=connections)
+    async with httpx.AsyncClient(base_url=host, limits=limits, timeout=60) as client:
+        room_id = f"bench-{players}-{int(time.time())}"
+        res = await client.post("/admin/rooms", json={"room_id": room_id})
+        res.raise_for_status()
+        base = f"/rooms/{room_id}"
+
+        stop = asyncio.Event()
+        sims = [SimPlayer(i, base, rec, action_interval) for i in range(players)]
+        tasks = [asyncio.create_task(s.run(client, stop)) for s in sims]
+
+        next_phase: List[float] = []
+        start = time.perf_counter()
+        for _ in range(turns * 4):
+            await asyncio.sleep(phase_seconds)
+            t0 = time.perf_counter()
+            await rec.call(client, "POST", f"{base}/admin/next_phase", "POST /admin/next_phase")
+            next_phase.append(time.perf_counter() - t0)
+        elapsed = time.perf_counter() - start
+
+        stop.set()
+        await asyncio.gather(*tasks)
+        await client.delete(f"/admin/rooms/{room_id}")
+
+    endpoints = {}
+    for name, values in sorted(rec.latency.items()):
+        values.sort()
+        endpoints[name] = {
+            "count": len(values),
+            "rps": len(values) / elapsed,
+            "p50_ms": percentile(values, 50) * 1000,
+            "p95_ms": percentile(values, 95) * 1000,
+            "p99_ms": percentile(values, 99) * 1000,
+            "rejected": rec.rejected.get(name, 0),
+            "errors": rec.errors.get(name, 0),
+        }
+    return {
+        "players": players,
+        "seconds": elapsed,
+        "endpoints": endpoints,
+        "next_phase_ms": [t * 1000 for t in next_phase],
+    }
+
+def print_level(result: dict):
+    print(f"\n=== {result['players']} 位玩家，{result['seconds']:.1f} 秒 ===")
+    print(f"{'端點':<26}{'次數':>8}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'4xx':>7}{'錯誤':>6}")
+    for name, s in result["endpoints"].items():
+        print(f"{name:<26}{s['count']:>8}{s['rps']:>9.1f}{s['p50_ms']:>9.1f}{s['p95_ms']:>9.1f}"
+              f"{s['p99_ms']:>9.1f}{s['rejected']:>7}{s['errors']:>6}")
+
+def start_server(port: int, persist: bool) -> subprocess.Popen:
+    env = dict(os.environ)
+    if not persist: env["GAME_STATE_DB"] = "" # 預設不寫存檔，只測 API 本身
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        env=env, cwd=config.BASE_DIR
+    )
+
+async def wait_ready(host: str, timeout: float = 30):
+    deadline = time.perf_counter() + timeout
+    async with httpx.AsyncClient(base_url=host) as client:
+        while time.perf_counter() < deadline:
+            try:
+                if (await client.get("/api/catalog")).status_code == 200: return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"伺服器 {host} 在 {timeout} 秒內沒有回應")
+
+async def run(args) -> List[dict]:
+    results = []
+    for players in args.players:
+        result = await run_level(args.host, players, args.turns, args.phase_seconds,
+                                 args.action_interval, args.connections)
+        print_level(result)
+        results.append(result)
+
+    print("\n=== /admin/next_phase 耗時 (ms) ===")
+    for r in results:
+        times = r["next_phase_ms"]
+        print(f"{r['players']:>6} 位玩家 | 平均 {sum(times) / len(times):8.1f} | 最慢 {max(times):8.1f}")
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--players", type=int, nargs="+", default=[10, 50, 200, 1000])
+    parser.add_argument("--turns", type=int, default=2, help="每個玩家人數跑幾回合 (每回合 4 個階段)")
+    parser.add_argument("--phase-seconds", type=float, default=5.0, help="管理員每隔幾秒推進一個階段")
+    parser.add_argument("--action-interval", type=float, default=3.0, help="每位玩家平均幾秒做一次操作")
+    parser.add_argument("--connections", type=int, default=500, help="客戶端連線池上限")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--host", help="改測已經在跑的伺服器 (例如 http://127.0.0.1:8000)，不自行啟動")
+    parser.add_argument("--persist", action="store_true", help="啟動的伺服器照常寫入存檔 (預設關閉)")
+    parser.add_argument("--json", help="把結果寫成 JSON 檔")
+    args = parser.parse_args()
+
+    server = None
+    if not args.host:
+        args.host = f"http://127.0.0.1:{args.port}"
+        server = start_server(args.port, args.persist)
+    try:
+        asyncio.run(wait_ready(args.host))
+        results = asyncio.run(run(args))
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"created_at": time.time(), "args": vars(args), "results": results}, f, ensure_ascii=False, indent=2)
+        print(f"\n結果已寫入 {args.json}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+訂單簿效能測試：比較「扁平訂單列表 (每回合重新分類、排序)」與「每物品一本訂單簿」。
+
+執行方式 (在專案根目錄)：
+    python -m benchmarks.bench_orderbook
+    python -m benchmarks.bench_orderbook --sizes 1000 10000 100000
+"""
+import argparse
+import random
+import time
+
+import config
+from core.engine import GameEngine
+from core.models import Order, PlayerState
+
+PLAYER_COUNT = 100
+
+def make_orders(n: int, rng: random.Random) -> list:
+    items = list(config.ITEMS.keys())
+    orders = []
+    for i in range(n):
+        item = rng.choice(items)
+        base = config.ITEMS[item]["base_price"]
+        side = "BID" if rng.random() < 0.5 else "ASK"
+        # 買價略低、賣價略高，大部分訂單不會成交 (留在簿上)，只有重疊區間會撮合
+        price = int(base * rng.uniform(0.7, 1.02)) if side == "BID" else int(base * rng.uniform(0.98, 1.3))
+        orders.append(Order(
+            player_id=f"p{rng.randrange(PLAYER_COUNT)}", type=side, item_id=item,
+            price=price, quantity=rng.randint(1, 20), timestamp=float(i)
+        ))
+    return orders
+
+def make_players() -> dict:
+    rich = {k: 10 ** 9 for k in config.ITEMS}
+    return {
+        f"p{i}": PlayerState(id=f"p{i}", name=f"p{i}", money=0, inventory={}, factories=[],
+                             locked_money=10 ** 12, locked_inventory=dict(rich))
+        for i in range(PLAYER_COUNT)
+    }
+
+def legacy_split(orders: list):
+    """舊做法：每個物品掃兩次整份列表分出買賣，再各自排序。"""
+    for item in set(o.item_id for o in orders):
+        bids = [o for o in orders if o.item_id == item and o.type == "BID"]
+        asks = [o for o in orders if o.item_id == item and o.type == "ASK"]
+        bids.sort(key=lambda x: (-x.price, x.timestamp))
+        asks.sort(key=lambda x: (x.price, x.timestamp))
+
+def timed(fn) -> float:
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+def run(n: int, seed: int):
+    rng = random.Random(seed)
+    orders = make_orders(n, rng)
+
+    engine = GameEngine()
+    t_add = timed(lambda: [engine.orders.add(o) for o in orders])
+    t_sorted = timed(lambda: [(b.sorted_bids(), b.sorted_asks()) for b in engine.orders.books()])
+    t_match = timed(lambda: engine.match_market_orders(make_players()))
+    resting = len(engine.orders)
+    t_legacy = timed(lambda: legacy_split(orders))
+
+    print(f"{n:>8} | 掛單 {t_add * 1000:8.1f} ms ({t_add / n * 1e6:5.2f} µs/筆) | "
+          f"排序兩邊 {t_sorted * 1000:7.1f} ms | 連續撮合 {t_match * 1000:7.1f} ms | "
+          f"舊版分類+排序 {t_legacy * 1000:8.1f} ms | 撮合後剩 {resting} 筆")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    print(f"物品數: {len(config.ITEMS)}，玩家數: {PLAYER_COUNT}")
+    for n in args.sizes:
+        run(n, args.seed)
+
+if __name__ == "__main__":
+    main()
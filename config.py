@@ -1,4 +1,5 @@
 import json
+import hashlib
 import random
 import os
 
@@ -43,6 +44,64 @@ EVENTS_DB = data["events"]
 GOV_ACQUISITIONS = data["gov_acquisitions"]
 SPECIAL_FACILITIES = data.get("special_facilities", {})
 
+# --- 編譯後的物品索引 (啟動時由 ITEMS 建立一次，遊戲邏輯以整數序號查表，不必每次走巢狀 dict) ---
+# 物品序號依 data.json 的物品順序固定下來，整場遊戲不變；玩家庫存 (core.inventory.Inventory) 也以此為索引
+ITEM_IDS = tuple(ITEMS.keys())
+ITEM_INDEX = {item_id: i for i, item_id in enumerate(ITEM_IDS)}
+ITEM_COUNT = len(ITEM_IDS)
+ITEM_TIERS = tuple(ITEMS[item_id]["tier"] for item_id in ITEM_IDS)          # 序號 -> 階級
+ITEM_SERIES = tuple(ITEMS[item_id].get("series") for item_id in ITEM_IDS)   # 序號 -> 系別
+
+TIER_ITEMS = {}           # 階級 -> 該階級的物品 (依序號排列)
+SERIES_TIER_INDEXES = {}  # (系別, 階級) -> 物品序號，例如 ("silicon", 2)
+for _i, _item_id in enumerate(ITEM_IDS):
+    TIER_ITEMS.setdefault(ITEM_TIERS[_i], []).append(_item_id)
+    SERIES_TIER_INDEXES.setdefault((ITEM_SERIES[_i], ITEM_TIERS[_i]), []).append(_i)
+TIER_INDEXES = {tier: tuple(ITEM_INDEX[i] for i in ids) for tier, ids in TIER_ITEMS.items()}  # 階級 -> 物品序號
+SERIES_TIER_INDEXES = {key: tuple(ids) for key, ids in SERIES_TIER_INDEXES.items()}
+
+# 配方攤平成 ((原料序號, 數量), ...)；沒有配方鍵的物品 (T0 原料) 不在表中，鑽石的配方為空
+RECIPES = {
+    item_id: tuple((ITEM_INDEX[ing], qty) for ing, qty in v["recipe"].items())
+    for item_id, v in ITEMS.items() if "recipe" in v
+}
+# 反向圖：原料 -> 以它為原料的產品
+USED_IN = {item_id: () for item_id in ITEM_IDS}
+for _item_id, _recipe in RECIPES.items():
+    for _ing, _ in _recipe:
+        USED_IN[ITEM_IDS[_ing]] += (_item_id,)
+
+def _compile_special_cost(fac: dict) -> dict:
+    """把特殊建築的付款規則預先解析好 (例如 "silicon_2": 4 → 系別、階級、數量與可用的物品序號)。"""
+    costs = fac["costs"]
+    if fac["cost_rule"] == "UNIQUE_TIER":
+        return {"rule": "UNIQUE_TIER", "tier": costs["tier"], "unique_qty": costs["unique_qty"],
+                "qty": costs["qty_per_item"]}
+    if fac["cost_rule"] == "SERIES_AND_TIER":
+        reqs = []
+        for key, qty in costs.items():
+            series, tier = key.rsplit("_", 1)
+            reqs.append((series, int(tier), qty, SERIES_TIER_INDEXES.get((series, int(tier)), ())))
+        return {"rule": "SERIES_AND_TIER", "reqs": tuple(reqs)}
+    return {"rule": fac["cost_rule"]}
+
+SPECIAL_COSTS = {b_type: _compile_special_cost(fac) for b_type, fac in SPECIAL_FACILITIES.items()}
+
+# --- 靜態目錄 (遊戲進行中不會變動，啟動時序列化一次供 /api/catalog 直接回傳) ---
+CATALOG = {
+    "items": ITEMS,
+    "recipes": {k: v["recipe"] for k, v in ITEMS.items() if "recipe" in v},
+    "special_facilities": SPECIAL_FACILITIES,
+    "gov_acquisitions": GOV_ACQUISITIONS,
+    "events": EVENTS_DB,
+}
+CATALOG_JSON = json.dumps(CATALOG, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+CATALOG_HASH = hashlib.sha256(CATALOG_JSON).hexdigest()[:16]
+
+# --- 存檔 (快照 + 操作日誌)，設為空字串即關閉 ---
+STATE_DB_PATH = os.environ.get("GAME_STATE_DB", os.path.join(BASE_DIR, "game_state.db"))
+
 # --- 輔助函式 ---
-def get_random_event():
-    return random.choice(EVENTS_DB)
\ No newline at end of file
+def get_random_event(rng: random.Random = random):
+    # 遊戲中請傳入該場引擎的 engine.rng，才能以種子重現
+    return rng.choice(EVENTS_DB)
\ No newline at end of file
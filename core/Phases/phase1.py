@@ -1,8 +1,9 @@
-import random
 import config
 from typing import Tuple, List, Dict, Any
+from core.metrics import timed
 
 class Phase1News:
+    @timed("generate_daily_event")
     def generate_daily_event(self, turn: int) -> Tuple[Dict[str, Any], List[str]]:
         # 0. 必須保留：清空上一回合的歷史訂單
         self.orders.clear()
@@ -25,7 +26,7 @@ class Phase1News:
         # 2. 一般新聞事件
         valid_events = [e for e in config.EVENTS_DB if e.get("phase_req", "All") in [stage, "All"]]
         if valid_events:
-            self.current_event = random.choice(valid_events)
+            self.current_event = self.rng.choice(valid_events)
         else:
             self.current_event = config.EVENTS_DB[0] 
         
@@ -41,11 +42,11 @@ class Phase1News:
         else:
             # --- 一般政府收購案 ---
             if turn % 2 == 0:
-                if random.random() < gov_chance:
+                if self.rng.random() < gov_chance:
                     candidates = [e for e in config.GOV_ACQUISITIONS if e.get("phase_req") == stage and e.get("id") != "L-05"]
                     
                     if candidates:
-                        self.active_gov_event = random.choice(candidates)
+                        self.active_gov_event = self.rng.choice(candidates)
                         event_logs.append(f"[事件] 第 {turn} 回合 ({stage}) - 政府收購觸發：{self.active_gov_event['title']}")
                 else:
                     event_logs.append(f"[事件] 第 {turn} 回合 ({stage}) - 檢定未通過，本回合無政府收購案。")
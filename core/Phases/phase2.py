@@ -1,102 +1,185 @@
-import uuid
-from typing import List, Tuple
+import copy
+import functools
+from typing import Dict, List, Optional, Tuple, Union
 from core.models import PlayerState, Factory
+from core.inventory import price_vector
+from core.planner import plan_production
+from core.substitution import (PREFER_CHEAPEST, PREFER_PRICIEST, Preference, allocate_ingredients,
+                               check_preference, substitution_order)
 import config
 
+# 特殊建築 -> (設施內部名稱, 階級)
+SPECIAL_BUILDINGS = {
+    "special_diamond": ("Diamond Mine", 4), # 設為 T4 讓它可以讀到鑽石配方
+    "special_defense": ("Defense", 3),
+    "special_omni": ("Omni Factory", 3),
+    "special_accelerator": ("Accelerator", 3)
+}
+
+def _label(i: int) -> str:
+    return config.ITEMS[config.ITEM_IDS[i]]["label"]
+
+def _tier_of(item_id: str) -> Optional[int]:
+    """物品階級；未知物品回傳 None (一律視為等級不符)。"""
+    i = config.ITEM_INDEX.get(item_id)
+    return None if i is None else config.ITEM_TIERS[i]
+
+def _marks_dirty(method):
+    """行動成功才標記玩家的公開資料需要重建；被拒絕的行動不會修改玩家，不必重建。"""
+    @functools.wraps(method)
+    def wrapper(self, player: PlayerState, *args, **kwargs) -> Tuple[bool, str]:
+        result = method(self, player, *args, **kwargs)
+        if result[0]: self.mark_dirty(player)
+        return result
+    return wrapper
+
+# 行動階段的玩家指令：名稱 -> 對應的引擎方法，參數與各個 /api/... 端點的請求內容相同 (批次端點與重播共用)
+ACTION_COMMANDS = {
+    "produce": lambda e, p, d: e.process_production(p, d["factory_id"], d["target_item"], d.get("quantity", 1),
+                                                     d.get("substitutes")),
+    "build": lambda e, p, d: e.process_build_new(p, d["target_tier"], d["payment_materials"]),
+    "build_special": lambda e, p, d: e.process_build_special(p, d["building_type"], d["payment_materials"]),
+    "upgrade": lambda e, p, d: e.process_upgrade(p, d["factory_id"], d["payment_materials"]),
+    "demolish": lambda e, p, d: e.process_demolish(p, d["factory_id"]),
+    "bank_sell": lambda e, p, d: e.process_bank_sell(p, d["item_id"], d["quantity"]),
+}
+
 class Phase2Action:
-    def process_production(self, player: PlayerState, factory_id: str, target_item: str, quantity: int) -> Tuple[bool, str]:
-        factory = next((f for f in player.factories if f.id == factory_id), None)
-        if not factory: return False, "找不到該設施"
+    def process_batch(self, player: PlayerState, commands: List[dict], atomic: bool = False) -> List[Tuple[bool, str]]:
+        """
+        依序執行多個行動指令 (每個 dict 帶 "action" 與該指令的參數)，回傳每個指令的 (成功, 訊息)。
+        一般模式下失敗的指令不影響其他指令；atomic 為 True 時遇到第一個失敗就停下，
+        把玩家狀態與代碼亂數還原到批次開始前，整批都不生效 (所有結果都回報為失敗)。
+        """
+        if atomic:
+            backup = copy.deepcopy(player)
+            ids = (self.ids_drawn, self._id_rng.getstate())
+        results = []
+        for cmd in commands:
+            handler = ACTION_COMMANDS.get(cmd.get("action"))
+            result = handler(self, player, cmd) if handler else (False, f"未知的指令: {cmd.get('action')}")
+            results.append(result)
+            if atomic and not result[0]:
+                player.__dict__.update(backup.__dict__)
+                self.ids_drawn, id_state = ids
+                self._id_rng.setstate(id_state)
+                done = [(False, f"已還原: {msg}") for _, msg in results[:-1]] + results[-1:]
+                results = done + [(False, "未執行 (批次已還原)")] * (len(commands) - len(done))
+                break
+        return results
+
+    def plan_inputs(self, player: PlayerState) -> tuple:
+        """
+        plan_production 的參數：庫存、設施、市價與事件的不可變快照。
+        伺服器在事件迴圈上取好快照，搜尋本身丟到背景執行緒，不必在搜尋期間鎖住玩家狀態。
+        """
+        event = getattr(self, "current_event", {}) or {}
+        factories = tuple((f.id, f.name, f.tier, f.has_produced, f.is_shutdown, f.current_product) for f in player.factories)
+        return (tuple(player.inventory.values()), factories, tuple(price_vector(self.market_prices)),
+                (event.get("special_effect"), event.get("logic_key")))
+
+    def plan_production(self, player: PlayerState) -> dict:
+        """本回合建議的生產計畫 (見 core.planner)；庫存、設施、市價與事件都沒變時直接取快取。"""
+        return plan_production(*self.plan_inputs(player))
+
+    def preview_production(self, player: PlayerState, factory_id: str, target_item: str, quantity: int,
+                           substitutes: Preference = None) -> Tuple[bool, Union[str, dict]]:
+        """
+        試算一次生產但不修改任何狀態，讓玩家送出前先確認萬能工廠會扣掉哪些替代品。
+        成功時回傳 (True, {"consume": 物品 -> 扣除數量, "substituted": 其中當作替代品的部分, "produced": 產量})。
+        """
+        error, factory, take, qty_produced = self._resolve_production(player, factory_id, target_item, quantity, substitutes)
+        if error: return False, error
+        needs = {ing: qty * quantity for ing, qty in config.RECIPES.get(target_item, ())}
+        return True, {
+            "factory_id": factory.id, "target_item": target_item, "quantity": quantity, "produced": qty_produced,
+            "consume": {config.ITEM_IDS[i]: n for i, n in take.items()},
+            "substituted": {config.ITEM_IDS[i]: n - needs.get(i, 0) for i, n in take.items() if n > needs.get(i, 0)},
+        }
+
+    @_marks_dirty
+    def process_production(self, player: PlayerState, factory_id: str, target_item: str, quantity: int,
+                           substitutes: Preference = None) -> Tuple[bool, str]:
+        error, factory, take, qty_produced = self._resolve_production(player, factory_id, target_item, quantity, substitutes)
+        if error: return False, error
+
+        counts = player.inventory.values() # 依物品序號排列的庫存陣列
+        for i, n in take.items():
+            counts[i] -= n
+        player.inventory[target_item] = player.inventory.get(target_item, 0) + qty_produced
+        factory.has_produced = True
+        if "Miner" in factory.name:
+            return True, f"開採了 {qty_produced} 個 {config.ITEMS[target_item]['label']}"
+        factory.current_product = target_item
+        return True, f"生產了 {qty_produced} 個 {config.ITEMS[target_item]['label']}"
+
+    def _resolve_production(self, player: PlayerState, factory_id: str, target_item: str, quantity: int,
+                            substitutes: Preference) -> Tuple[Optional[str], Optional[Factory], Dict[int, int], int]:
+        """檢查生產條件並算出扣料與產量 (不修改狀態)；回傳 (錯誤訊息或 None, 設施, 物品序號 -> 扣除數量, 產量)。"""
+        factory = player.factories.get(factory_id)
+        if not factory: return "找不到該設施", None, {}, 0
             
         if getattr(factory, "is_shutdown", False):
-            return False, "該設施因天災停擺中，本回合無法運作！"
+            return "該設施因天災停擺中，本回合無法運作！", factory, {}, 0
             
         event = getattr(self, "current_event", {}) or {}
         item_data = config.ITEMS.get(target_item)
 
         if "Miner" in factory.name:
             if getattr(factory, "has_produced", False):
-                return False, "該採集器本回合已經開採過了！"
-            if not item_data or item_data.get("tier") != 0:
-                return False, "採集器只能開採 T0 原料"
+                return "該採集器本回合已經開採過了！", factory, {}, 0
+            if _tier_of(target_item) != 0:
+                return "採集器只能開採 T0 原料", factory, {}, 0
             
             base_output = config.MINER_OUTPUTS.get(factory.tier, 3)
             qty_produced = base_output * quantity
             if event.get("special_effect") == "MINER_BOOST_1":
                 qty_produced += (1 * quantity)
-                
-            player.inventory[target_item] = player.inventory.get(target_item, 0) + qty_produced
-            factory.has_produced = True 
-            return True, f"開採了 {qty_produced} 個 {item_data['label']}"
-            
+            return None, factory, {}, qty_produced
+
+        recipe = config.RECIPES.get(target_item) # ((原料序號, 數量), ...)
+        if recipe is None: return "無效的配方", factory, {}, 0
+
+        # 針對鑽石場的特殊防呆
+        if target_item == "diamond":
+            if factory.name != "Diamond Mine":
+                return "只有鑽石場可以生產鑽石！", factory, {}, 0
         else:
-            if not item_data or "recipe" not in item_data: return False, "無效的配方"
+            if factory.tier != item_data["tier"]:
+                return f"工廠等級不符！T{factory.tier} 設施只能生產 T{item_data['tier']} 的產品。", factory, {}, 0
+            
+        if getattr(factory, "has_produced", False):
+            locked_item = getattr(factory, "current_product", None)
+            if locked_item and locked_item != target_item:
+                locked_name = config.ITEMS.get(locked_item, {}).get("label", locked_item)
+                return f"產線已鎖定！此工廠本回合只能生產【{locked_name}】。", factory, {}, 0
+        is_omni = (factory.name == "Omni Factory")
+        is_accelerator = (factory.name == "Accelerator")
 
-            # 針對鑽石場的特殊防呆
-            if target_item == "diamond":
-                if factory.name != "Diamond Mine":
-                    return False, "只有鑽石場可以生產鑽石！"
-            else:
-                if factory.tier != item_data["tier"]:
-                    return False, f"工廠等級不符！T{factory.tier} 設施只能生產 T{item_data['tier']} 的產品。"
-                
-            if getattr(factory, "has_produced", False):
-                locked_item = getattr(factory, "current_product", None)
-                if locked_item and locked_item != target_item:
-                    locked_name = config.ITEMS.get(locked_item, {}).get("label", locked_item)
-                    return False, f"產線已鎖定！此工廠本回合只能生產【{locked_name}】。"
-            is_omni = (factory.name == "Omni Factory")
-            is_accelerator = (factory.name == "Accelerator")
-
-            # 1. 檢查原料是否充足 (萬能工廠可支援同階級替代)
-            for ing_id, req_qty in item_data["recipe"].items():
-                total_needed = req_qty * quantity
-                if player.inventory.get(ing_id, 0) >= total_needed:
-                    continue
-                
-                if is_omni:
-                    req_tier = config.ITEMS[ing_id]["tier"]
-                    shortage = total_needed - player.inventory.get(ing_id, 0)
-                    # 尋找所有同階級的替代品數量
-                    subs_found = sum(qty for sub_id, qty in player.inventory.items() 
-                                     if sub_id != ing_id and config.ITEMS.get(sub_id, {}).get("tier") == req_tier)
-                    if subs_found < shortage:
-                        return False, f"原料或同等級替代品不足: 缺少 {config.ITEMS[ing_id]['label']} (需 {total_needed} 個)"
-                else:
-                    return False, f"原料不足: 缺少 {config.ITEMS[ing_id]['label']} (需 {total_needed} 個)"
-        
-            # 2. 扣除原料 (含萬能工廠的代扣邏輯)
-            for ing_id, req_qty in item_data["recipe"].items():
-                total_needed = req_qty * quantity
-                exact_have = player.inventory.get(ing_id, 0)
-                
-                if exact_have >= total_needed:
-                    player.inventory[ing_id] -= total_needed
-                elif is_omni:
-                    player.inventory[ing_id] = 0
-                    shortage = total_needed - exact_have
-                    req_tier = config.ITEMS[ing_id]["tier"]
-                    # 依序扣除其他同階級物品直到補足 shortage
-                    for sub_id in list(player.inventory.keys()):
-                        if shortage <= 0: break
-                        if sub_id != ing_id and config.ITEMS.get(sub_id, {}).get("tier") == req_tier:
-                            take = min(player.inventory[sub_id], shortage)
-                            player.inventory[sub_id] -= take
-                            shortage -= take
-
-            # 3. 計算產量與增益
-            qty_produced = quantity
-            if is_accelerator:
-                qty_produced *= 2 # 加速器產量翻倍
-                
-            if factory.name == "Diamond Mine" and event.get("logic_key") == "DIAMOND_BOOST":
-                qty_produced *= 2 # 疊加鑽石爆發事件
-                
-            player.inventory[target_item] = player.inventory.get(target_item, 0) + qty_produced 
-            factory.has_produced = True           
-            factory.current_product = target_item     
-            return True, f"生產了 {qty_produced} 個 {item_data['label']}"
+        # 1. 一次算出整份配方的扣料 (萬能工廠的缺口依階級合併，依玩家指定的順序用同階級替代品補足)
+        order = None
+        if is_omni:
+            error = check_preference(substitutes)
+            if error: return error, factory, {}, 0
+            prices = price_vector(self.market_prices) if substitutes in (PREFER_CHEAPEST, PREFER_PRICIEST) else ()
+            order = substitution_order(substitutes, prices)
+        take, missing = allocate_ingredients(player.inventory.values(), recipe, quantity, order)
+        if missing is not None:
+            total_needed = dict(recipe)[missing] * quantity
+            if is_omni:
+                return f"原料或同等級替代品不足: 缺少 {_label(missing)} (需 {total_needed} 個)", factory, {}, 0
+            return f"原料不足: 缺少 {_label(missing)} (需 {total_needed} 個)", factory, {}, 0
 
+        # 2. 計算產量與增益
+        qty_produced = quantity
+        if is_accelerator:
+            qty_produced *= 2 # 加速器產量翻倍
+            
+        if factory.name == "Diamond Mine" and event.get("logic_key") == "DIAMOND_BOOST":
+            qty_produced *= 2 # 疊加鑽石爆發事件
+        return None, factory, take, qty_produced
+
+    @_marks_dirty
     def process_build_new(self, player: PlayerState, target_tier: int, materials: List[str]) -> Tuple[bool, str]:
         if len(player.factories) >= player.land_limit: return False, "土地不足。"
 
@@ -106,7 +189,7 @@ class Phase2Action:
             player.money -= cost
             
             # 🌟 採集器：建好當下不可使用 (冷卻中)
-            new_miner = Factory(id=str(uuid.uuid4())[:8], tier=0, name="Miner")
+            new_miner = Factory(id=self.new_id(8), tier=0, name="Miner")
             new_miner.has_produced = True  
             player.factories.append(new_miner)
             
@@ -121,14 +204,14 @@ class Phase2Action:
             if len(set(used_materials)) != needed_count: return False, "材料必須不同。"
             
             for mat in used_materials:
-                if config.ITEMS[mat]["tier"] != rule["material_tier"]: return False, f"{mat} 等級錯誤。"
-                if player.inventory.get(mat, 0) < rule["qty_per_type"]: return False, f"需要 {rule['qty_per_type']} 個 {mat}。"
+                if _tier_of(mat) != rule["material_tier"]: return False, f"{mat} 等級錯誤。"
+                if player.inventory[mat] < rule["qty_per_type"]: return False, f"需要 {rule['qty_per_type']} 個 {mat}。"
                 
             for mat in used_materials:
                 player.inventory[mat] -= rule["qty_per_type"]
                 
             # 🌟 一般加工廠：建好當下可立刻使用
-            new_factory = Factory(id=str(uuid.uuid4())[:8], tier=1, name="Factory T1")
+            new_factory = Factory(id=self.new_id(8), tier=1, name="Factory T1")
             new_factory.has_produced = False 
             player.factories.append(new_factory)
             
@@ -136,85 +219,74 @@ class Phase2Action:
             
         return False, "未知的建造類型。"
 
+    @_marks_dirty
     def process_build_special(self, player: PlayerState, b_type: str, materials: List[str]) -> Tuple[bool, str]:
-        # 1. 取得設定檔中的規則
+        # 1. 取得設定檔中的規則 (付款規則已在載入設定時解析好)
         fac_config = config.SPECIAL_FACILITIES.get(b_type)
         if not fac_config:
             return False, "未知的特殊建築類型"
+        cost = config.SPECIAL_COSTS[b_type]
 
         # 2. 土地空間檢查 (擴充土地除外)
         if b_type != "special_land" and len(player.factories) >= player.land_limit:
             return False, "土地空間不足，請先擴充土地！"
 
-        mats = [m for m in materials if m] # 過濾空值
+        # 過濾空值與未知物品，轉成物品序號
+        mats = [config.ITEM_INDEX[m] for m in materials if m in config.ITEM_INDEX]
+        counts = player.inventory.values()
         
         # 3. 處理「UNIQUE_TIER」邏輯 (例如：擴充土地)
-        if fac_config["cost_rule"] == "UNIQUE_TIER":
-            req_tier = fac_config["costs"]["tier"]
-            req_unique = fac_config["costs"]["unique_qty"]
-            req_qty = fac_config["costs"]["qty_per_item"]
+        if cost["rule"] == "UNIQUE_TIER":
+            req_tier = cost["tier"]
+            req_unique = cost["unique_qty"]
+            req_qty = cost["qty"]
             
-            unique_mats = list(set(mats))
-            # 先過濾出符合等級的材料
-            valid_tier_mats = [m for m in unique_mats if config.ITEMS.get(m, {}).get("tier") == req_tier]
+            # 先過濾出符合等級的材料 (去除重複，保留玩家選擇的順序)
+            valid_tier_mats = [m for m in dict.fromkeys(mats) if config.ITEM_TIERS[m] == req_tier]
             
             if len(valid_tier_mats) < req_unique: 
                 return False, f"選擇的材料必須包含 {req_unique} 種不同的 T{req_tier} 物品！"
             
             valid_mats = valid_tier_mats[:req_unique]
             for m in valid_mats:
-                if player.inventory.get(m, 0) < req_qty: 
-                    return False, f"缺乏 {config.ITEMS[m]['label']} (需要 {req_qty} 個)"
+                if counts[m] < req_qty: 
+                    return False, f"缺乏 {_label(m)} (需要 {req_qty} 個)"
             
             # 扣除庫存並生效
             for m in valid_mats: 
-                player.inventory[m] -= req_qty
+                counts[m] -= req_qty
             player.land_limit += 1
             return True, "成功擴充 1 單位的土地！"
 
         # 4. 處理「SERIES_AND_TIER」邏輯 (其他實體設施)
-        elif fac_config["cost_rule"] == "SERIES_AND_TIER":
-            reqs = fac_config["costs"] # e.g. {"silicon_2": 4, "iron_2": 4}
-            matched_items = {}
+        elif cost["rule"] == "SERIES_AND_TIER":
+            matched_items = [] # (物品序號, 數量)
             available_mats = list(mats) 
             
-            for req_key, req_qty in reqs.items():
-                req_series, req_tier_str = req_key.split("_")
-                req_tier = int(req_tier_str)
-                
+            # 每項需求已解析為 (系別, 等級, 數量, 符合的物品序號)，例如 "silicon_2": 4
+            for req_series, req_tier, req_qty, candidates in cost["reqs"]:
                 # 尋找玩家選擇中，符合該系別與等級的物品
-                found_item = None
-                for m in available_mats:
-                    item_data = config.ITEMS.get(m)
-                    if item_data and item_data.get("series") == req_series and item_data.get("tier") == req_tier:
-                        found_item = m
-                        break
+                found_item = next((m for m in available_mats if m in candidates), None)
                         
-                if not found_item:
+                if found_item is None:
                     fam_name = {"silicon": "矽晶", "iron": "鐵", "energy": "能源"}.get(req_series, req_series)
                     return False, f"付款材料缺少對應的【{fam_name}系 T{req_tier}】物品！"
                 
-                if player.inventory.get(found_item, 0) < req_qty:
-                    return False, f"{config.ITEMS[found_item]['label']} 數量不足 (需 {req_qty} 個)！"
+                if counts[found_item] < req_qty:
+                    return False, f"{_label(found_item)} 數量不足 (需 {req_qty} 個)！"
                     
-                matched_items[req_key] = {"item": found_item, "qty": req_qty}
+                matched_items.append((found_item, req_qty))
                 available_mats.remove(found_item) # 避免重複判定
 
             # 扣除庫存
-            for req_key, match in matched_items.items():
-                player.inventory[match["item"]] -= match["qty"]
+            for item, qty in matched_items:
+                counts[item] -= qty
                 
             # 決定設施內部的識別名稱與階級
-            name_mapping = {
-                "special_diamond": ("Diamond Mine", 4), # 設為 T4 讓它可以讀到鑽石配方
-                "special_defense": ("Defense", 3),
-                "special_omni": ("Omni Factory", 3),
-                "special_accelerator": ("Accelerator", 3)
-            }
-            name, tier = name_mapping.get(b_type, (fac_config["label"], 3))
+            name, tier = SPECIAL_BUILDINGS.get(b_type, (fac_config["label"], 3))
             
             # 建立特殊設施
-            new_special = Factory(id=str(uuid.uuid4())[:8], tier=tier, name=name)
+            new_special = Factory(id=self.new_id(8), tier=tier, name=name)
             new_special.has_produced = False 
             player.factories.append(new_special)
             
@@ -222,8 +294,9 @@ class Phase2Action:
             
         return False, "設定檔規則解析錯誤"
     
+    @_marks_dirty
     def process_upgrade(self, player: PlayerState, factory_id: str, materials: List[str]) -> Tuple[bool, str]:
-        factory = next((f for f in player.factories if f.id == factory_id), None)
+        factory = player.factories.get(factory_id)
         if not factory: return False, "找不到工廠。"
         
         if "Miner" in factory.name:
@@ -232,16 +305,16 @@ class Phase2Action:
             if not rule["complex"]:
                 if len(materials) < 1: return False, "請選擇 1 種材料。"
                 mat = materials[0]
-                if config.ITEMS[mat]["tier"] != rule["req_tier"]: return False, "材料等級錯誤。"
-                if player.inventory.get(mat, 0) < rule["qty"]: return False, "材料數量不足。"
+                if _tier_of(mat) != rule["req_tier"]: return False, "材料等級錯誤。"
+                if player.inventory[mat] < rule["qty"]: return False, "材料數量不足。"
                 player.inventory[mat] -= rule["qty"]
             else:
                 if len(materials) < 2: return False, "請選擇 2 種材料。"
                 mat_A, mat_B = materials[0], materials[1]
-                if config.ITEMS[mat_A]["tier"] != 2 or player.inventory.get(mat_A, 0) < 3: return False, "需要 3 個 T2 材料。"
-                if config.ITEMS[mat_B]["tier"] != 1 or player.inventory.get(mat_B, 0) < 3: return False, "需要 3 個 T1 材料。"
+                if _tier_of(mat_A) != 2 or player.inventory[mat_A] < 3: return False, "需要 3 個 T2 材料。"
+                if _tier_of(mat_B) != 1 or player.inventory[mat_B] < 3: return False, "需要 3 個 T1 材料。"
                 player.inventory[mat_A] -= 3; player.inventory[mat_B] -= 3
-            factory.tier += 1
+            player.factories.set_tier(factory, factory.tier + 1) # 經由列表升級，倉儲免稅額等彙總值才會更新
             return True, f"採集器升級至 T{factory.tier}！"
 
         if factory.tier == 1:
@@ -251,11 +324,11 @@ class Phase2Action:
             used_materials = materials[:rule["unique_types"]]
             if len(set(used_materials)) != rule["unique_types"]: return False, "材料必須不同。"
             for mat in used_materials:
-                if config.ITEMS[mat]["tier"] != rule["material_tier"]: return False, "材料等級錯誤。"
-                if player.inventory.get(mat, 0) < rule["qty_per_type"]: return False, "材料數量不足。"
+                if _tier_of(mat) != rule["material_tier"]: return False, "材料等級錯誤。"
+                if player.inventory[mat] < rule["qty_per_type"]: return False, "材料數量不足。"
             player.money -= rule["money"]
             for mat in used_materials: player.inventory[mat] -= rule["qty_per_type"]
-            factory.tier = 2
+            player.factories.set_tier(factory, 2)
             return True, "成功升級至 T2 工廠！"
 
         if factory.tier == 2:
@@ -263,22 +336,24 @@ class Phase2Action:
             if player.money < cost: return False, f"現金不足 (需要 ${cost})。"
             if len(materials) < 3: return False, "請選擇 3 種材料。"
             used_materials = materials[:3]
-            t2 = [m for m in used_materials if config.ITEMS[m]["tier"] == 2]
-            t1 = [m for m in used_materials if config.ITEMS[m]["tier"] == 1]
+            tiers = [_tier_of(m) for m in used_materials]
+            t2 = [m for m, tier in zip(used_materials, tiers) if tier == 2]
+            t1 = [m for m, tier in zip(used_materials, tiers) if tier == 1]
             if len(set(t2)) != 2 or len(t1) != 1: return False, "需要 2 種不同的 T2 和 1 種 T1。"
             for m in t2:
-                if player.inventory.get(m, 0) < 3: return False, "需要 3 個 T2 材料。"
+                if player.inventory[m] < 3: return False, "需要 3 個 T2 材料。"
             for m in t1:
-                if player.inventory.get(m, 0) < 10: return False, "需要 10 個 T1 材料。"
+                if player.inventory[m] < 10: return False, "需要 10 個 T1 材料。"
             player.money -= cost
             for m in t2: player.inventory[m] -= 3
             for m in t1: player.inventory[m] -= 10
-            factory.tier = 3
+            player.factories.set_tier(factory, 3)
             return True, "成功升級至 T3 工廠！"
         return False, "已達最高等級。"
 
+    @_marks_dirty
     def process_demolish(self, player: PlayerState, factory_id: str) -> Tuple[bool, str]:
-        factory = next((f for f in player.factories if f.id == factory_id), None)
+        factory = player.factories.get(factory_id)
         if not factory: return False, "找不到該設施。"
 
         # 計算拆除費用 (Updated: T2=1000, T3=4000)
@@ -302,12 +377,12 @@ class Phase2Action:
         
         return True, f"已拆除 {factory.name} (Lv.{factory.tier})，支付清潔費 ${demolish_fee}。"
 
+    @_marks_dirty
     def process_bank_sell(self, player: PlayerState, item_id: str, qty: int) -> Tuple[bool, str]:
         if qty <= 0: return False, "數量必須大於 0"
         if player.inventory.get(item_id, 0) < qty: return False, "庫存不足"
     
-        item_info = config.ITEMS.get(item_id)
-        if not item_info or item_info["tier"] != 0:
+        if _tier_of(item_id) != 0:
             return False, "銀行只收購 T0 原料！"
 
         # 價格計算：市價 * 0.85
@@ -1,19 +1,17 @@
 import time
-from typing import Tuple, List, Dict
+from typing import Tuple, List, Dict, Optional
 from core.models import Order, PlayerState
 import config
+from core.metrics import timed
 
 class Phase3Trading:
     def validate_and_lock_assets(self, player: PlayerState, order: Order) -> Tuple[bool, str]:
         if order.quantity <= 0: return False, "數量必須大於 0。"
         
-        current_price = self.market_prices.get(order.item_id, 500)
-        
         # 一般市場的波幅檢查
         if order.type != "GOV_ASK":
-            max_p = int(current_price * (1 + config.PRICE_FLUCTUATION_LIMIT))
-            min_p = int(current_price * (1 - config.PRICE_FLUCTUATION_LIMIT))
-            if order.price > max_p or order.price < min_p: return False, f"價格超出限制 (${min_p} ~ ${max_p})"
+            err = self._check_price_limit(order.item_id, order.price)
+            if err: return False, err
         
         # 檢查與鎖定資產
         if order.type == "BID":
@@ -27,35 +25,101 @@ class Phase3Trading:
             player.locked_inventory[order.item_id] = player.locked_inventory.get(order.item_id, 0) + order.quantity
             
         order.timestamp = time.time()
+        order.id = self.new_id() # 成功才配發代碼，重播時同一筆掛單會拿到同一個代碼
+        self.mark_dirty(player) # 只有成功時才動到資產，失敗的請求不必重建公開資料
         
         # 移除 print，改由回傳成功訊息，讓外層的 main.py 負責寫入 Log
         success_msg = f"[掛單成功] {player.name} 掛出 {order.type}：{order.quantity} 個 {order.item_id} (單價 ${order.price})"
         return True, success_msg
 
+    def _check_price_limit(self, item_id: str, price: int) -> Optional[str]:
+        current_price = self.market_prices.get(item_id, 500)
+        max_p = int(current_price * (1 + config.PRICE_FLUCTUATION_LIMIT))
+        min_p = int(current_price * (1 - config.PRICE_FLUCTUATION_LIMIT))
+        if price > max_p or price < min_p: return f"價格超出限制 (${min_p} ~ ${max_p})"
+        return None
+
+    def find_order(self, order_id: str) -> Optional[Order]:
+        order = self.orders.get(order_id)
+        if order is None:
+            order = next((o for o in self.gov_orders if o.id == order_id), None)
+        return order
+
+    def remove_order(self, order_id: str) -> Optional[Order]:
+        """從訂單簿 (或政府收購投標) 移除訂單，不處理資產；回傳被移除的訂單。"""
+        order = self.orders.remove(order_id)
+        if order is None:
+            order = next((o for o in self.gov_orders if o.id == order_id), None)
+            if order is not None: self.gov_orders.remove(order)
+        return order
+
+    def player_orders(self, player_id: str) -> List[Order]:
+        return self.orders.orders_of(player_id) + [o for o in self.gov_orders if o.player_id == player_id]
+
+    def cancel_order(self, player: PlayerState, order_id: str) -> Tuple[bool, str]:
+        order = self.find_order(order_id)
+        if order is None or order.player_id != player.id: return False, "找不到該訂單。"
+        self.remove_order(order_id)
+
+        # 退回掛單時鎖定的資產
+        if order.type == "BID":
+            refund = order.price * order.quantity
+            player.locked_money -= refund
+            player.money += refund
+        else: # ASK or GOV_ASK
+            player.locked_inventory[order.item_id] -= order.quantity
+            player.inventory[order.item_id] = player.inventory.get(order.item_id, 0) + order.quantity
+        self.mark_dirty(player)
+        return True, f"[取消掛單] {player.name} 撤回 {order.type}：{order.quantity} 個 {order.item_id} (單價 ${order.price})"
+
+    def amend_order(self, player: PlayerState, order_id: str, price: int, quantity: Optional[int] = None) -> Tuple[bool, str]:
+        order = self.orders.get(order_id)
+        if order is None:
+            if self.find_order(order_id): return False, "政府合約投標無法改單，請取消後重新投標。"
+            return False, "找不到該訂單。"
+        if order.player_id != player.id: return False, "找不到該訂單。"
+        if quantity is None: quantity = order.quantity
+        if quantity <= 0: return False, "數量必須大於 0。"
+        err = self._check_price_limit(order.item_id, price)
+        if err: return False, err
+
+        # 先檢查差額，全部通過才一起修改，避免只改到一半
+        if order.type == "BID":
+            delta = price * quantity - order.price * order.quantity
+            if delta > player.money: return False, "現金不足。"
+            player.money -= delta
+            player.locked_money += delta
+        else:
+            delta = quantity - order.quantity
+            if delta > player.inventory.get(order.item_id, 0): return False, "庫存不足。"
+            player.inventory[order.item_id] = player.inventory.get(order.item_id, 0) - delta
+            player.locked_inventory[order.item_id] = player.locked_inventory.get(order.item_id, 0) + delta
+
+        # 改單視同重新掛單：失去原本的時間優先順序
+        self.orders.remove(order_id)
+        order.price, order.quantity, order.timestamp = price, quantity, time.time()
+        self.orders.add(order)
+        self.mark_dirty(player)
+        return True, f"[修改掛單] {player.name} 的 {order.type} 改為：{quantity} 個 {order.item_id} (單價 ${price})"
+
+    @timed("match_market_orders")
     def match_market_orders(self, players: Dict[str, PlayerState]) -> List[str]:
         trade_logs = []
         # 加入訂單數量追蹤，確認系統到底有沒有收到單
         trade_logs.append(f"=== 一般市場交易撮合開始 (共收到 {len(self.orders)} 筆訂單) ===")
         
-        items_traded = set(o.item_id for o in self.orders)
-        
-        for item in items_traded:
-            # 將訂單分為買單與賣單
-            bids = [o for o in self.orders if o.item_id == item and o.type == "BID"]
-            asks = [o for o in self.orders if o.item_id == item and o.type == "ASK"]
-            
+        # 每個物品的訂單簿在掛單時就已依價格、時間排好，直接從兩邊頂端取單撮合
+        for book in self.orders.books():
+            item = book.item_id
+
             # 🌟 新增：如果某物品只有買或只有賣，明確印出缺乏對手盤
-            if not bids or not asks:
-                trade_logs.append(f"[{item} 撮合略過] 缺乏對手盤 (買單: {len(bids)} 筆, 賣單: {len(asks)} 筆)，無法進行交易。")
+            if not book.bid_count or not book.ask_count:
+                trade_logs.append(f"[{item} 撮合略過] 缺乏對手盤 (買單: {book.bid_count} 筆, 賣單: {book.ask_count} 筆)，無法進行交易。")
                 continue
-            
-            # 買單從高價排到低價，賣單從低價排到高價 (時間優先排序)
-            bids.sort(key=lambda x: (-x.price, x.timestamp))
-            asks.sort(key=lambda x: (x.price, x.timestamp))
-            
-            while bids and asks:
-                bid = bids[0]
-                ask = asks[0]
+
+            while book.bid_count and book.ask_count:
+                bid = book.best_bid()
+                ask = book.best_ask()
                 
                 # 最高買價 >= 最低賣價，則有機會成交
                 if bid.price >= ask.price:
@@ -80,21 +144,22 @@ class Phase3Trading:
                         
                         seller.locked_inventory[item] -= trade_qty
                         seller.money += cost
+                        self.mark_dirty(buyer, seller)
                         
                         trade_logs.append(f"[撮合成交] {buyer.name} 向 {seller.name} 買入 {trade_qty} 個 {item} (單價: ${trade_price})")
                         
-                        bid.quantity -= trade_qty
-                        ask.quantity -= trade_qty
-                        if bid.quantity <= 0: bids.pop(0)
-                        if ask.quantity <= 0: asks.pop(0)
+                        book.fill(bid, trade_qty)
+                        book.fill(ask, trade_qty)
+                        if bid.quantity <= 0: book.pop_bid()
+                        if ask.quantity <= 0: book.pop_ask()
                         
                     else:
                         if not buyer_can_afford:
                             trade_logs.append(f"[撮合失敗] {buyer.name} 向 {seller.name} 購買 {item} 失敗。原因：{buyer.name} 鎖定資金異常")
-                            bids.pop(0)
+                            book.pop_bid()
                         if not seller_has_item:
                             trade_logs.append(f"[撮合失敗] {buyer.name} 向 {seller.name} 購買 {item} 失敗。原因：{seller.name} 鎖定庫存異常")
-                            asks.pop(0)
+                            book.pop_ask()
                 else:
                     trade_logs.append(f"[{item} 撮合結束] 最高買價 (${bid.price}) 低於 最低賣價 (${ask.price})，無法達成交易共識。")
                     break
@@ -1,11 +1,19 @@
-import random
+import logging
+from itertools import takewhile
 from typing import List, Dict, Tuple
 from core.models import Order, PlayerState
+from core.orderbook import clearing_price
+from core.inventory import price_vector
+from core.settlement import DEFENSE_HIT, DEFENSE_PAID, DEFENSE_SHIELDED, SettlementBatch
 import config
+from core.metrics import timed
+
+logger = logging.getLogger(__name__) # 結算細節只在開啟 DEBUG 時輸出，不在熱路徑上同步寫 stdout
 
 class Phase4Settlement:
     def execute_call_auction(self, players: Dict[str, PlayerState]) -> List[str]:
-        print("\n=== 結算開始 ===")
+        self.mark_all_dirty() # 結算會動到每一位玩家
+        logger.debug("=== 結算開始 ===")
         match_logs = []  # 🌟 新增：用來收集交易日誌的列表
         
         # 1. 優先處理政府收購 (Gov Execution)
@@ -14,19 +22,15 @@ class Phase4Settlement:
             if gov_logs:
                 match_logs.extend(gov_logs)
             
-        # 2. 處理一般市場撮合
-        item_orders = {}
-        for order in self.orders:
-            if order.item_id not in item_orders: item_orders[order.item_id] = []
-            item_orders[order.item_id].append(order)
-
-        for item_id, orders in item_orders.items():
-            bids = [o for o in orders if o.type == "BID"]
-            asks = [o for o in orders if o.type == "ASK"]
+        # 2. 處理一般市場撮合 (訂單簿兩邊已是價格、時間優先順序)
+        for book in self.orders.books():
+            item_id = book.item_id
+            bids = book.sorted_bids()
+            asks = book.sorted_asks()
             
             # Call Auction Logic
             clearing_price, volume = self._calc_price(bids, asks, item_id)
-            print(f"{item_id}: 結算價 ${clearing_price}, 成交量 {volume}")
+            logger.debug("%s: 結算價 $%s, 成交量 %s", item_id, clearing_price, volume)
             
             item_name = config.ITEMS[item_id]['label']
             
@@ -43,36 +47,25 @@ class Phase4Settlement:
                 self._settle(players, bids, asks, clearing_price, 0, item_id)
         
         # 清空所有訂單
-        self.orders = []
+        self.orders.clear()
         self.gov_orders = []
         
-        # Storage Penalty
-        print("--- 庫存盤點 ---")
-        for p in players.values():
-            cp = sum(config.CP_VALUES.get(f.tier, 0) for f in p.factories)
-            limit = config.BASE_STORAGE_LIMIT + cp
-            for k, v in p.inventory.items():
-                if v > limit:
-                    excess = v - limit
-                    penalty = 0
-                    t1 = min(excess, 3); penalty += t1 * config.PENALTY_LOW
-                    if excess > 3:
-                        t2 = min(excess-3, 4); penalty += t2 * config.PENALTY_MID
-                    if excess > 7:
-                        t3 = excess - 7; penalty += t3 * config.PENALTY_HIGH
-                    
-                    if p.money < penalty:
-                        print(f"罰款 {p.name}: {k} -${p.money} (觸發破產保護)")
-                        p.money = 0
-                    else:
-                        p.money -= penalty
-                        print(f"罰款 {p.name}: {k} -${penalty}")
-        print("=== 結算完成 ===\n")
+        # Storage Penalty：全部玩家一次盤點 (core.settlement)
+        logger.debug("--- 庫存盤點 ---")
+        batch = SettlementBatch(list(players.values()))
+        fines, bankrupt = batch.storage_penalty()
+        batch.commit()
+        if logger.isEnabledFor(logging.DEBUG):
+            for p, fine, broke in zip(batch.players, fines, bankrupt):
+                if fine or broke:
+                    logger.debug("罰款 %s: -$%s%s", p.name, fine, " (觸發破產保護)" if broke else "")
+        logger.debug("=== 結算完成 ===")
         
         return match_logs # 🌟 回傳收集到的日誌給 main.py
 
+    @timed("execute_gov_auction")
     def _execute_gov_auction(self, players) -> List[str]:
-        print(f"--- 政府收購: {self.active_gov_event['title']} ---")
+        logger.debug("--- 政府收購: %s ---", self.active_gov_event['title'])
         event = self.active_gov_event
         gov_logs = [] # 🌟 收集政府收購的日誌
         
@@ -118,7 +111,7 @@ class Phase4Settlement:
                     # Execute Trade
                     player.locked_inventory[item_id] -= can_fill
                     player.money += revenue
-                    print(f"政府收購: {player.name} 出售 {can_fill} 個 {item_id} @ ${order.price}")
+                    logger.debug("政府收購: %s 出售 %s 個 %s @ $%s", player.name, can_fill, item_id, order.price)
                     
                     # 🌟 記錄政府得標日誌
                     gov_logs.append(f"🏛️ 政府得標：【{player.name}】成功向政府出售 {can_fill} 個 {item_name}，進帳 ${revenue}！")
@@ -138,48 +131,18 @@ class Phase4Settlement:
                     
         return gov_logs # 回傳給主函式
 
+    @timed("calc_price")
     def _calc_price(self, bids: List[Order], asks: List[Order], item_id: str) -> Tuple[int, int]:
-        if not bids or not asks: return self.market_prices[item_id], 0
-        
-        # 1. Collect all price nodes (from both bids and asks)
-        prices = sorted(list(set([o.price for o in bids] + [o.price for o in asks])))
-        
-        max_vol = 0
-        best_price = self.market_prices[item_id]
-        candidates = []
-
-        # 2. Cumulative Calculation
-        for p in prices:
-            # Demand: Buy at P or higher
-            demand = sum(o.quantity for o in bids if o.price >= p)
-            # Supply: Sell at P or lower
-            supply = sum(o.quantity for o in asks if o.price <= p)
-            
-            # 3. Tradable Volume
-            vol = min(demand, supply)
-            
-            if vol > max_vol:
-                max_vol = vol
-                candidates = [p]
-            elif vol == max_vol and vol > 0:
-                candidates.append(p)
-        
-        if max_vol == 0:
-            return best_price, 0
-
-        # 4. Boundary Condition: Closest to last price
-        last_p = self.market_prices[item_id]
-        candidates.sort(key=lambda x: abs(x - last_p))
-        best_price = candidates[0]
-        
-        return best_price, max_vol
+        # 需求/供給曲線以累積和一次算出 (O(N log N))，同量時取最接近上一次市價的價位
+        return clearing_price(bids, asks, self.market_prices[item_id])
 
     def _settle(self, players, bids, asks, price, volume, item_id) -> List[str]:
         settle_logs = [] # 🌟 新增：收集這項物品的所有詳細撮合日誌
         item_name = config.ITEMS[item_id]['label'] # 取得物品名稱以便顯示
 
-        valid_bids = sorted([b for b in bids if b.price >= price], key=lambda x: (-x.price, x.timestamp))
-        valid_asks = sorted([a for a in asks if a.price <= price], key=lambda x: (x.price, x.timestamp))
+        # bids / asks 來自訂單簿，已依價格、時間優先排序，只需取出價格可成交的前段
+        valid_bids = list(takewhile(lambda b: b.price >= price, bids))
+        valid_asks = list(takewhile(lambda a: a.price <= price, asks))
         
         filled = 0
         b_idx = 0
@@ -231,7 +194,7 @@ class Phase4Settlement:
         return settle_logs # 🌟 回傳詳細日誌
     
     def game_set(self, players: Dict[str, PlayerState]) -> List[Tuple[str, dict]]:
-        print("\n=== 遊戲結束，開始最終計分 ===")
+        logger.info("=== 遊戲結束，開始最終計分 ===")
         
         # 定義設施價值查表
         facility_values = {
@@ -240,22 +203,19 @@ class Phase4Settlement:
         }
         
         final_scores = {}
+        prices = price_vector(self.market_prices) # 市價依物品序號排成陣列，所有玩家共用
         
         for p_id, player in players.items():
             # 1. 計算庫存總價值 (所有物品數量 * 當前市價)
-            inventory_value = 0
-            for item_id, qty in player.inventory.items():
-                if qty > 0:
-                    market_price = self.market_prices.get(item_id, 0)
-                    inventory_value += qty * market_price
+            inventory_value = player.inventory.value(prices)
                     
             # 2. 計算設施總價值
             facility_value = 0
-            for factory in player.factories:
+            for (name, tier), count in player.factories.counts.items():
                 # 判定是採集器還是工廠
-                f_type = "Miner" if "Miner" in factory.name else "Factory"
+                f_type = "Miner" if "Miner" in name else "Factory"
                 # 根據 tier 取出對應價值，若防呆防錯預設為 0
-                facility_value += facility_values[f_type].get(factory.tier, 0)
+                facility_value += facility_values[f_type].get(tier, 0) * count
                 
             # 3. 總分計算 = 庫存價值 + 設施價值 + 現金
             total_score = inventory_value + facility_value + player.money
@@ -272,76 +232,63 @@ class Phase4Settlement:
         
         # 印出結算結果清單
         for rank, (name, data) in enumerate(ranked_players, 1):
-            print(f"第 {rank} 名: {name} | 總分: {data['total_score']} "
-                  f"(現金: {data['cash']}, 庫存價值: {data['inventory_value']}, 設施價值: {data['facility_value']})")
+            logger.info("第 %s 名: %s | 總分: %s (現金: %s, 庫存價值: %s, 設施價值: %s)", rank, name,
+                        data['total_score'], data['cash'], data['inventory_value'], data['facility_value'])
             
         return ranked_players
     
+    @timed("process_end_of_turn")
     def process_end_of_turn(self, players: Dict[str, PlayerState]) -> List[str]:
+        self.mark_all_dirty() # 結算會動到每一位玩家
         logs = []
         event = getattr(self, "current_event", {}) or {}
         
+        # 各階段對全部玩家批次套用 (core.settlement)，順序與逐一結算時相同：
+        # 反壟斷法 → 倉儲稅 → 事件檢定 → 懲罰
+        batch = SettlementBatch(list(players.values()))
+        n = len(batch.players)
+
         # 1. 全域特殊事件 (例如：反壟斷法案)
         if event.get("type") == "SPECIAL" and event.get("logic_key") == "ROBIN_HOOD_TAX":
-            sorted_players = sorted(players.values(), key=lambda x: x.money, reverse=True)
-            top_3 = sorted_players[:3]
-            others = sorted_players[3:]
-            tax_pool = 0
-            for tp in top_3:
-                tax = int(tp.money * 0.3)
-                tp.money -= tax
-                tax_pool += tax
-            if others and tax_pool > 0:
-                share = tax_pool // len(others)
-                for op in others: op.money += share
+            tax_pool = batch.robin_hood_tax()
             logs.append(f"⚖️ 反壟斷法：前 3 名玩家扣除 30% 稅金共 ${tax_pool}，已平分給其餘玩家！")
 
-        # 2. 結算每個玩家的【倉儲稅】與【事件懲罰】
-        for p_id, p in players.items():
+        # 2. 倉儲稅：免稅額 = 基礎(5) + sum(工廠點數)，採集器不算；由設施列表隨建造/升級/拆除維護
+        taxes = batch.storage_tax()
+
+        # 3. 事件檢定與懲罰
+        outcome = [None] * n
+        lost = [0] * n
+        if event.get("type") == "DEFENSE_CHECK":
+            outcome = batch.defense_check(event["req_item"], event["req_qty"])
+            if event["penalty"] == "HALVE_CASH":
+                lost = batch.halve_cash([o == DEFENSE_HIT for o in outcome])
+        batch.commit()
+
+        # 4. 設施的懲罰與日誌 (依玩家順序，摧毀設施時的亂數順序與逐一結算相同)
+        for p, tax_total, result, cash_lost in zip(batch.players, taxes, outcome, lost):
             player_logs = []
-            
-            # --- A. 倉儲稅機制 ---
-            # 免稅額 = 基礎(5) + sum(工廠點數)
-            capacity = 5
-            for f in p.factories:
-                if "Miner" in f.name: continue
-                elif f.tier == 1: capacity += 3
-                elif f.tier == 2: capacity += 6
-                elif f.tier >= 3: capacity += 12
-            
-            tax_total = 0
-            for item, qty in p.inventory.items():
-                if qty > capacity:
-                    excess = qty - capacity
-                    if excess <= 3: tax_total += excess * 100
-                    elif excess <= 7: tax_total += excess * 200
-                    else: tax_total += excess * 500
-                    
             if tax_total > 0:
-                p.money -= tax_total
                 player_logs.append(f"倉儲超載稅：扣除 ${tax_total}")
 
-            # --- B. 事件檢定與懲罰 ---
-            has_defense = any(f.name == "Defense" for f in p.factories) # 檢查是否有防災中心
-            
-            if event.get("type") == "DEFENSE_CHECK":
-                req_item = event["req_item"]
-                req_qty = event["req_qty"]
-                
-                if p.inventory.get(req_item, 0) >= req_qty:
-                    p.inventory[req_item] -= req_qty
-                    player_logs.append(f" 成功上繳 {req_qty} 個 {config.ITEMS[req_item]['label']} 抵禦災害！")
-                elif has_defense:
-                    player_logs.append(f" 防災中心啟動！完美抵禦了災害！")
-                else:
-                    penalty = event["penalty"]
-                    if penalty == "SHUTDOWN_FACILITIES":
-                        for f in p.factories: setattr(f, "is_shutdown", True) # 標記停擺
-                        player_logs.append(" 災害命中：所有設施下回合停擺！")
-                    elif penalty == "HALVE_CASH":
-                        lost = p.money - int(p.money * 0.5)
-                        p.money = int(p.money * 0.5)
-                        player_logs.append(f" 災害命中：現金減半 (損失 ${lost})！")
-                    elif penalty == "DESTROY_FACTORY":
-                        if p.factories:
-                            import random
\ No newline at end of file
+            if result == DEFENSE_PAID:
+                player_logs.append(f" 成功上繳 {event['req_qty']} 個 {config.ITEMS[event['req_item']]['label']} 抵禦災害！")
+            elif result == DEFENSE_SHIELDED:
+                player_logs.append(f" 防災中心啟動！完美抵禦了災害！")
+            elif result == DEFENSE_HIT:
+                penalty = event["penalty"]
+                if penalty == "SHUTDOWN_FACILITIES":
+                    for f in p.factories: setattr(f, "is_shutdown", True) # 標記停擺
+                    player_logs.append(" 災害命中：所有設施下回合停擺！")
+                elif penalty == "HALVE_CASH":
+                    player_logs.append(f" 災害命中：現金減半 (損失 ${cash_lost})！")
+                elif penalty == "DESTROY_FACTORY":
+                    if p.factories:
+                        destroyed = self.rng.choice(p.factories) # 本場的亂數，重播時摧毀同一座
+                        p.factories.remove(destroyed)
+                        player_logs.append(f" 災害命中：{destroyed.name} (Lv.{destroyed.tier}) 被摧毀了！")
+
+            if player_logs:
+                logs.append(f"【{p.name}】" + "".join(player_logs))
+
+        return logs
@@ -0,0 +1,88 @@
+import asyncio
+import secrets
+from typing import Dict, Iterable, Optional
+
+# --- 狀態區塊名稱 (每個區塊各自記錄最後變動時的版本號) ---
+SECTION_PHASE = "phase"              # turn / phase / final_ranking
+SECTION_EVENTS = "events"            # event / gov_event
+SECTION_PRICES = "market_prices"
+SECTION_PLAYERS = "all_players"
+SECTION_LOGS = "logs"                # 只有管理員畫面需要
+SECTION_BOOK = "order_book"          # 交易階段的指示價格與市場深度
+ALL_SECTIONS = (SECTION_PHASE, SECTION_EVENTS, SECTION_PRICES, SECTION_PLAYERS, SECTION_LOGS, SECTION_BOOK)
+
+class StateNotifier:
+    """
+    狀態變動通知器：遊戲狀態每被修改一次就遞增全域版本號，並記錄是哪些區塊、哪些玩家被修改。
+    - 輪詢端可帶 since=版本號，只取回版本號之後有變動的區塊 (或直接得到 304)。
+    - 推播連線 (SSE) 只在版本號變動時才重新組裝狀態，閒置時完全不消耗 CPU。
+    版本號只存在記憶體中，每次啟動都從 0 開始；對外的游標與 ETag 一律是「epoch.版本號」，
+    epoch 每個通知器 (每個房間、每次啟動) 各不相同，重啟前拿到的游標與 ETag 因此不會被誤認為仍然有效。
+    """
+    def __init__(self):
+        self.epoch = secrets.token_hex(4)
+        self.version = 0
+        self.sections: Dict[str, int] = {}
+        self.player_versions: Dict[str, int] = {}
+        self.players_epoch = 0  # 一次影響所有玩家的變動 (例如切換回合、重置)
+        self._changed: Optional[asyncio.Event] = None
+
+    def bump(self, *sections: str, player_ids: Iterable[str] = (), all_players: bool = False) -> int:
+        self.version += 1
+        for name in sections:
+            self.sections[name] = self.version
+        for pid in player_ids:
+            self.player_versions[pid] = self.version
+        if all_players:
+            self.players_epoch = self.version
+            self.player_versions.clear()
+
+        # 喚醒目前所有等待者，並換上一個新的 Event 給下一輪使用
+        if self._changed is not None:
+            self._changed.set()
+            self._changed = None
+        return self.version
+
+    # --- 對外的游標 / ETag ---
+    def cursor(self, version: Optional[int] = None) -> str:
+        """客戶端下次帶回來的 since 值；預設為目前的版本號。"""
+        return f"{self.epoch}.{self.version if version is None else version}"
+
+    def etag(self, version: int) -> str:
+        return f'"{self.cursor(version)}"'
+
+    def parse_cursor(self, cursor: Optional[str]) -> Optional[int]:
+        """
+        把客戶端帶回來的 since 轉回版本號；格式錯誤、epoch 不同 (伺服器重啟過或換了房間)
+        或版本號比目前還新時回傳 None，呼叫端應改送完整快照。
+        """
+        if not cursor: return None
+        epoch, _, version = cursor.partition(".")
+        if epoch != self.epoch or not version.isdigit(): return None
+        version = int(version)
+        return version if version <= self.version else None
+
+    def section_version(self, name: str) -> int:
+        return self.sections.get(name, 0)
+
+    def player_version(self, player_id: str) -> int:
+        return max(self.player_versions.get(player_id, 0), self.players_epoch)
+
+    def view_version(self, player_id: Optional[str] = None) -> int:
+        """某位玩家畫面所依賴的最新版本號 (作為 ETag 使用)。"""
+        v = max((self.section_version(s) for s in ALL_SECTIONS if s != SECTION_LOGS), default=0)
+        if player_id:
+            v = max(v, self.player_version(player_id))
+        return v
+
+    async def wait_for_change(self, since: int, timeout: float) -> bool:
+        """等待版本號超過 since；逾時回傳 False (呼叫端可送出 keep-alive)。"""
+        if self.version > since:
+            return True
+        if self._changed is None:
+            self._changed = asyncio.Event()
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
@@ -1,5 +1,8 @@
-from typing import List, Dict
-from core.models import Order
+import random
+import uuid
+from typing import List, Dict, Optional, Set
+from core.models import Order, PlayerState
+from core.orderbook import MarketBook
 import config
 
 # Correct the path to include 'Phases' subfolder
@@ -13,11 +16,59 @@ class GameEngine(Phase1News, Phase2Action, Phase3Trading, Phase4Settlement):
     """
     Game Engine combining all phases via Multiple Inheritance.
     """
-    def __init__(self):    
-        self.orders: List[Order] = []
+    def __init__(self, seed: Optional[int] = None):
+        # 每場遊戲自己的亂數：事件抽選、災害懲罰用 rng，玩家/工廠/訂單代碼用另一條，
+        # 同一個 seed 加上同一串指令就能重現整場遊戲，同一行程裡的房間也不會互相影響
+        self.seed = seed if seed is not None else random.SystemRandom().getrandbits(63)
+        self.rng = random.Random(self.seed)
+        self._id_rng = random.Random(f"{self.seed}:ids")
+        self.ids_drawn = 0
+        self.orders = MarketBook()  # 一般市場：每個物品一本訂單簿
         self.market_prices: Dict[str, int] = {
             k: v["base_price"] for k, v in config.ITEMS.items()
         }
         self.current_event = config.EVENTS_DB[0] 
         self.active_gov_event = None 
-        self.gov_orders: List[Order] = []
\ No newline at end of file
+        self.gov_orders: List[Order] = []
+        # 髒標記：各階段修改過哪些玩家，讓房間只重建這些玩家的公開資料 (None 代表全部)
+        self._dirty_players: Optional[Set[str]] = None
+
+    def mark_dirty(self, *players: PlayerState):
+        if self._dirty_players is not None:
+            self._dirty_players.update(p.id for p in players)
+
+    def mark_all_dirty(self):
+        self._dirty_players = None
+
+    def take_dirty(self) -> Optional[Set[str]]:
+        """取出並清空髒標記；回傳 None 代表所有玩家都要重建。"""
+        dirty, self._dirty_players = self._dirty_players, set()
+        return dirty
+
+    # --- 可重現的識別碼 (只在操作成功時才抽，失敗的請求不會讓重播對不上) ---
+    def new_id(self, length: int = 12) -> str:
+        return f"{self._draw_id_bits():032x}"[:length]
+
+    def new_uuid(self) -> str:
+        return str(uuid.UUID(int=self._draw_id_bits(), version=4))
+
+    def _draw_id_bits(self) -> int:
+        # 每次固定抽 128 bits，只要知道抽過幾次就能把亂數快轉到同一個位置
+        self.ids_drawn += 1
+        return self._id_rng.getrandbits(128)
+
+    def sync_ids(self, drawn: int):
+        """把代碼亂數快轉到已抽過 drawn 次 (還原存檔時用：日誌只記次數，不存整份亂數狀態)。"""
+        while self.ids_drawn < drawn:
+            self._draw_id_bits()
+
+    def rng_state(self) -> dict:
+        return {"seed": self.seed, "rng": self.rng.getstate(), "id_rng": self._id_rng.getstate(),
+                "ids_drawn": self.ids_drawn}
+
+    def set_rng_state(self, state: dict):
+        self.seed = state["seed"]
+        self.ids_drawn = state["ids_drawn"]
+        for rng, key in ((self.rng, "rng"), (self._id_rng, "id_rng")):
+            version, internal, gauss = state[key] # 存檔 (JSON) 後 tuple 會變成 list
+            rng.setstate((version, tuple(internal), gauss))
@@ -0,0 +1,95 @@
+import re
+import time
+from collections import deque
+from itertools import islice
+from typing import Callable, Deque, List, Optional, Tuple
+
+# --- 紀錄類型 ---
+LOG_SYSTEM = "system"          # 房間建立、重置、階段切換、最終排名
+LOG_PLAYER = "player"          # 玩家註冊 / 重連
+LOG_ACTION = "action"          # 玩家操作 (生產、建造、掛單...)，只有本人與管理員看得到
+LOG_SETTLEMENT = "settlement"  # 撮合、政府收購、回合結算、每日事件
+
+ADMIN = object()  # 檢視者：管理員看得到所有紀錄
+
+_LEGACY_LINE = re.compile(r"^\[\d{2}:\d{2}:\d{2}\] (.*)", re.S)
+
+class EventLog:
+    """
+    房間的事件日誌：固定容量的環形緩衝區 (deque)，每筆紀錄帶遞增的序號。
+    - 新增是 O(1)；超出容量時最舊的紀錄交給 archive (寫入存檔)，不會無聲消失。
+    - 客戶端帶上次看到的序號 (游標) 只取回之後的紀錄，不必每次重新下載整份日誌。
+    - 紀錄可以只給某位玩家看 (player_id)；管理員看得到全部。
+    序號跨越重置持續遞增，客戶端手上的游標才不會和新一局的紀錄混淆。
+    """
+    def __init__(self, capacity: int, archive: Optional[Callable[[List[dict]], None]] = None):
+        self.capacity = capacity
+        self.archive = archive
+        self.seq = 0  # 最後一筆紀錄的序號
+        self.base = 0  # 游標小於這個值的客戶端必須整份重抓 (重置或被擠出緩衝區)
+        self._entries: Deque[dict] = deque()
+
+    def append(self, message: str, kind: str = LOG_SYSTEM, player_id: Optional[str] = None) -> dict:
+        self.seq += 1
+        entry = {"seq": self.seq, "ts": time.time(), "kind": kind, "message": message}
+        if player_id is not None:
+            entry["player_id"] = player_id
+        self._push(entry)
+        return entry
+
+    def restore(self, entry) -> dict:
+        """還原存檔中的紀錄 (保留原本的序號)；舊版存檔的純文字日誌行也能讀入。"""
+        if isinstance(entry, str):
+            match = _LEGACY_LINE.match(entry)
+            self.seq += 1
+            entry = {"seq": self.seq, "ts": None, "kind": LOG_SYSTEM, "message": match.group(1) if match else entry}
+        else:
+            self.seq = max(self.seq, entry["seq"])
+        self._push(entry)
+        return entry
+
+    def _push(self, entry: dict):
+        self._entries.append(entry)
+        if len(self._entries) > self.capacity:
+            evicted = self._entries.popleft()
+            self.base = evicted["seq"]
+            if self.archive: self.archive([evicted])
+
+    def clear(self):
+        """
+        重置時清空 (舊紀錄一併寫入存檔)。清空本身佔用一個序號，
+        所有在這之前取得的游標 (包含剛好看完最後一筆的) 都會收到整份重送，畫面跟著清空。
+        """
+        if self.archive and self._entries:
+            self.archive(list(self._entries))
+        self._entries.clear()
+        self.seq += 1
+        self.base = self.seq
+
+    def since(self, after: Optional[int], viewer=ADMIN) -> Tuple[bool, List[dict]]:
+        """
+        回傳 (是否為整份重送, 游標之後且 viewer 看得到的紀錄，由舊到新)。
+        after 為 None、早於緩衝區或早於上次重置時整份重送，客戶端應清掉畫面上的舊紀錄。
+        """
+        full = after is None or after < self.base
+        if full:
+            entries = self._entries
+        elif after >= self.seq:
+            return False, []
+        else:
+            # 緩衝區內的序號是連續的，直接算出游標的位置
+            entries = islice(self._entries, after - self._entries[0]["seq"] + 1, None)
+        if viewer is ADMIN:
+            return full, list(entries)
+        return full, [e for e in entries if e.get("player_id") in (None, viewer)]
+
+    def to_dict(self) -> dict:
+        return {"seq": self.seq, "base": self.base, "entries": list(self._entries)}
+
+    def load(self, data: dict):
+        self._entries = deque(data["entries"])
+        self.seq = data["seq"]
+        self.base = data["base"]
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -0,0 +1,113 @@
+from array import array
+from collections.abc import Mapping, MutableMapping
+from operator import mul
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from pydantic_core import core_schema
+
+import config
+
+# --- 物品序號表 (由 config 在載入時編譯，依 data.json 的物品順序固定下來，整場遊戲不變) ---
+ITEM_IDS: Tuple[str, ...] = config.ITEM_IDS
+ITEM_INDEX: Dict[str, int] = config.ITEM_INDEX
+ITEM_COUNT = config.ITEM_COUNT
+TIER_ITEMS: Dict[int, List[str]] = config.TIER_ITEMS  # 階級 -> 該階級的物品 (同樣依序號排列)
+
+def price_vector(prices: Dict[str, int], default: int = 0) -> array:
+    """把 {item_id: 價格} 轉成依物品序號排列的陣列，供 Inventory.value() 整表計算。"""
+    return array("q", (prices.get(item_id, default) for item_id in ITEM_IDS))
+
+class Inventory(MutableMapping):
+    """
+    玩家庫存：以物品序號為索引的 array('q')，取代原本以字串為鍵的 dict。
+    - 對外仍是 item_id -> 數量的 Mapping (get / [] / items() 用法不變)，序列化成與以前相同的 JSON 物件。
+    - 每種物品都固定存在 (沒有時為 0)，不能寫入 config.ITEMS 以外的物品。
+    - 扣稅、估值、加總這類整表運算直接走陣列，不必逐一查字串鍵。
+    """
+    __slots__ = ("_counts",)
+
+    def __init__(self, counts: Optional[Mapping] = None):
+        self._counts = array("q", bytes(8 * ITEM_COUNT))
+        if counts:
+            for item_id, qty in counts.items():
+                self[item_id] = qty
+
+    # --- Mapping 介面 ---
+    def __getitem__(self, item_id: str) -> int:
+        return self._counts[ITEM_INDEX[item_id]]
+
+    def __setitem__(self, item_id: str, qty: int):
+        self._counts[ITEM_INDEX[item_id]] = qty
+
+    def __delitem__(self, item_id: str):
+        self._counts[ITEM_INDEX[item_id]] = 0
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(ITEM_IDS)
+
+    def __len__(self) -> int:
+        return ITEM_COUNT
+
+    def __contains__(self, item_id: Any) -> bool:
+        return item_id in ITEM_INDEX
+
+    def get(self, item_id: str, default: int = 0) -> int:
+        i = ITEM_INDEX.get(item_id)
+        return default if i is None else self._counts[i]
+
+    def keys(self):
+        return ITEM_IDS
+
+    def values(self) -> array:
+        """依物品序號排列的數量陣列 (本體，不是拷貝)；搭配 config 的序號表可直接讀寫。"""
+        return self._counts
+
+    def items(self):
+        return zip(ITEM_IDS, self._counts)
+
+    # --- 整表運算 ---
+    def total(self) -> int:
+        return sum(self._counts)
+
+    def value(self, prices: array) -> int:
+        """以 price_vector() 的價格估算庫存總值 (只計正數量)。"""
+        counts = self._counts
+        if min(counts) < 0: # 正常不會出現負數，保險起見才逐一過濾
+            counts = [q if q > 0 else 0 for q in counts]
+        return sum(map(mul, counts, prices))
+
+    def to_dict(self) -> Dict[str, int]:
+        return dict(zip(ITEM_IDS, self._counts))
+
+    def __repr__(self) -> str:
+        return f"Inventory({ {k: v for k, v in self.items() if v} })"
+
+    def __copy__(self) -> "Inventory":
+        clone = Inventory.__new__(Inventory)
+        clone._counts = array("q", self._counts)
+        return clone
+
+    def __deepcopy__(self, memo) -> "Inventory":
+        return self.__copy__()
+
+    def __reduce__(self):
+        return Inventory, (self.to_dict(),)
+
+    # --- pydantic 整合：從 dict 驗證建立，序列化回 dict ---
+    @classmethod
+    def _validate(cls, value: Any) -> "Inventory":
+        if isinstance(value, Inventory):
+            return value
+        if not isinstance(value, Mapping):
+            raise ValueError("庫存必須是 {物品: 數量} 的物件")
+        unknown = [k for k in value if k not in ITEM_INDEX]
+        if unknown:
+            raise ValueError(f"未知的物品: {', '.join(map(str, unknown))}")
+        return cls(value)
+
+    @classmethod
+    def __get_pydantic_core_schema__(cls, source, handler):
+        return core_schema.no_info_plain_validator_function(
+            cls._validate,
+            serialization=core_schema.plain_serializer_function_ser_schema(lambda v: v.to_dict()),
+        )
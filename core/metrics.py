@@ -0,0 +1,181 @@
+import abc
+import asyncio
+import bisect
+import functools
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"  # Prometheus 文字格式
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LOOP_LAG_INTERVAL = 1.0  # 事件迴圈延遲的取樣間隔 (秒)
+
+class Metric(abc.ABC):
+    """
+    一個指標 (可帶標籤)。寫入只是在鎖內更新幾個數字 (結算在背景執行緒進行，所以需要鎖)，
+    文字格式只在 /metrics 被抓取時才組出來，沒人抓時幾乎沒有額外開銷。
+    """
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+        self._lock = threading.Lock()
+
+    def _labels(self, values: Tuple[str, ...], extra: str = "") -> str:
+        pairs = [f'{k}="{_escape(v)}"' for k, v in zip(self.labelnames, values)]
+        if extra: pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+    @abc.abstractmethod
+    def render(self) -> List[str]:
+        """/metrics 被抓取時呼叫：回傳 HELP / TYPE 與所有數值的文字行。"""
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name, help_text, labelnames=()):
+        super().__init__(name, help_text, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return self.header() + [f"{self.name}{self._labels(k)} {_num(v)}" for k, v in values]
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = buckets
+        self._series: Dict[Tuple[str, ...], list] = {}  # 標籤 -> [各區間次數 (非累積)..., 總和, 次數]
+
+    def observe(self, value: float, *labels: str):
+        i = bisect.bisect_left(self.buckets, value) # 落在第一個 >= value 的區間；超過最大值時為 +Inf
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> List[str]:
+        with self._lock:
+            snapshot = [(k, list(v)) for k, v in self._series.items()]
+        lines = self.header()
+        for labels, series in snapshot:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), series):
+                cumulative += n
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{_num(bound)}"'
+                lines.append(f"{self.name}_bucket{self._labels(labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{self._labels(labels)} {_num(series[-2])}")
+            lines.append(f"{self.name}_count{self._labels(labels)} {series[-1]}")
+        return lines
+
+class Gauge(Metric):
+    """值在抓取時才由 collect() 算出 (例如目前玩家數)，平常完全不需要更新。"""
+    kind = "gauge"
+
+    def __init__(self, name, help_text, labelnames=(), collect: Callable[[], Iterable] = lambda: ()):
+        super().__init__(name, help_text, labelnames)
+        self.collect = collect  # 回傳 [(標籤值 tuple, 數值), ...]
+
+    def render(self) -> List[str]:
+        values = list(self.collect())
+        return self.header() + [f"{self.name}{self._labels(k)} {_num(v)}" for k, v in values]
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> bytes:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return ("\n".join(lines) + "\n").encode("utf-8")
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _num(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+# --- 全域指標 ---
+REGISTRY = Registry()
+HTTP_REQUESTS = REGISTRY.register(Counter(
+    "http_requests_total", "HTTP 請求數 (依端點的路由樣板；舊網址與 /rooms/{room_id} 底下的同一端點合併計算)", ("method", "route", "status")))
+HTTP_LATENCY = REGISTRY.register(Histogram(
+    "http_request_duration_seconds", "HTTP 請求處理時間 (推播連線為整段連線時間)", ("method", "route")))
+ENGINE_SECONDS = REGISTRY.register(Histogram(
+    "game_engine_seconds", "引擎結算/撮合各方法的執行時間", ("method",)))
+PHASE_SECONDS = REGISTRY.register(Histogram(
+    "game_phase_transition_seconds", "管理員切換階段的遊戲邏輯耗時 (依切換前的階段)", ("from_phase",)))
+LOOP_LAG = REGISTRY.register(Histogram(
+    "event_loop_lag_seconds", "事件迴圈延遲：排定的喚醒比預期晚了多久",
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)))
+
+def timed(method: str):
+    """裝飾引擎方法，把執行時間記到 game_engine_seconds{method=...}。"""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                ENGINE_SECONDS.observe(time.perf_counter() - start, method)
+        return wrapper
+    return decorator
+
+class MetricsMiddleware:
+    """
+    純 ASGI middleware：記錄每個路由的請求數與處理時間 (不經過 BaseHTTPMiddleware，推播串流不受影響)。
+    route_prefix 為同一組路由再掛一次時的前綴 (例如 /rooms/{room_id})，標籤會去掉它，兩種網址合併成同一組。
+    """
+    def __init__(self, app, route_prefix: str = ""):
+        self.app = app
+        self.route_prefix = route_prefix
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            template = getattr(route, "path", None) or "unmatched" # 路由樣板，避免每個房間/訂單代碼各成一組標籤
+            if self.route_prefix and template.startswith(self.route_prefix + "/"):
+                template = template[len(self.route_prefix):]
+            HTTP_LATENCY.observe(time.perf_counter() - start, scope["method"], template)
+            HTTP_REQUESTS.inc(scope["method"], template, str(status[0]))
+
+async def monitor_loop_lag(interval: float = LOOP_LAG_INTERVAL):
+    """背景工作：每隔 interval 秒睡一次，實際醒來比預期晚多少就是事件迴圈被卡住的時間。"""
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        LOOP_LAG.observe(max(0.0, loop.time() - expected))
@@ -1,7 +1,15 @@
-from typing import Dict, List, Optional
-from pydantic import BaseModel
+import copy
+import uuid
+from collections import Counter
+from collections.abc import MutableSequence
+from typing import Any, Dict, Iterator, List, Optional
+from pydantic import BaseModel, Field
+from pydantic_core import core_schema
+from core.inventory import Inventory
+import config
 
 class Order(BaseModel):
+    id: str = Field(default_factory=lambda: uuid.uuid4().hex[:12])  # 伺服器指派，用於取消/改價
     player_id: str
     type: str  
     item_id: str
@@ -17,12 +25,163 @@ class Factory(BaseModel):
     is_shutdown: bool = False
     current_product: Optional[str] = None  
 
+def _storage_points(f: Factory) -> int:
+    """回合結算倉儲稅的免稅點數：採集器不算，加工廠 T1 +3、T2 +6、T3 以上 +12。"""
+    if "Miner" in f.name: return 0
+    if f.tier == 1: return 3
+    if f.tier == 2: return 6
+    if f.tier >= 3: return 12
+    return 0
+
+class Factories(MutableSequence):
+    """
+    玩家的設施列表：對外仍是依建造順序排列的 Factory 列表 (序列化成與以前相同的 JSON 陣列)，
+    另外維護 id 索引與彙總值，建造、拆除、升級時增量更新，不必每次都掃過所有設施：
+    - get(factory_id)：O(1) 找設施
+    - storage_capacity：回合結算倉儲稅的免稅額；cp_total：撮合後庫存盤點用的工廠點數總和
+    - has_defense、counts[(名稱, 階級)]：防災中心與各類設施數量
+    升級請呼叫 set_tier()；直接修改 factory.tier 不會更新彙總值。
+    """
+    __slots__ = ("_items", "_by_id", "cp_total", "storage_points", "defenses", "counts")
+
+    def __init__(self, factories=()):
+        self._items: List[Factory] = []
+        self._by_id: Dict[str, Factory] = {}
+        self.cp_total = 0
+        self.storage_points = 0
+        self.defenses = 0  # 防災中心數量 (回合結算每位玩家都要查)
+        self.counts: Counter = Counter()  # (名稱, 階級) -> 數量
+        for f in factories:
+            self.append(f)
+
+    # --- 增量維護 ---
+    def _first(self, factory_id: str) -> Optional[Factory]:
+        return next((g for g in self._items if g.id == factory_id), None)
+
+    def _track(self, f: Factory):
+        # 萬一代碼重複，與以前的線性搜尋一樣找列表中較前面的那座 (只有重複時才需要掃列表)
+        if self._by_id.setdefault(f.id, f) is not f:
+            self._by_id[f.id] = self._first(f.id)
+        self._count(f, 1)
+
+    def _untrack(self, f: Factory):
+        # 呼叫前 f 必須已經從 _items 移除
+        if self._by_id.get(f.id) is f:
+            del self._by_id[f.id]
+            other = self._first(f.id)
+            if other is not None: self._by_id[f.id] = other
+        self._count(f, -1)
+
+    def _count(self, f: Factory, sign: int):
+        self.cp_total += sign * config.CP_VALUES.get(f.tier, 0)
+        self.storage_points += sign * _storage_points(f)
+        if f.name == "Defense": self.defenses += sign
+        key = (f.name, f.tier)
+        self.counts[key] += sign
+        if not self.counts[key]: del self.counts[key]
+
+    def _rebuild(self):
+        items = self._items
+        self.__init__(items)
+
+    # --- 查詢 ---
+    def get(self, factory_id: str) -> Optional[Factory]:
+        return self._by_id.get(factory_id)
+
+    @property
+    def storage_capacity(self) -> int:
+        return 5 + self.storage_points
+
+    @property
+    def has_defense(self) -> bool:
+        return self.defenses > 0
+
+    def set_tier(self, f: Factory, tier: int):
+        """升級設施並更新彙總值。"""
+        self._count(f, -1)
+        f.tier = tier
+        self._count(f, 1)
+
+    # --- MutableSequence 介面 ---
+    def __getitem__(self, i):
+        return self._items[i]
+
+    def __setitem__(self, i, value):
+        if isinstance(i, slice):
+            self._items[i] = value
+            self._rebuild()
+            return
+        old = self._items[i]
+        self._items[i] = value # 先換掉再取消索引，舊設施才不會被當成同代碼的另一座找回來
+        self._untrack(old)
+        self._track(value)
+
+    def __delitem__(self, i):
+        if isinstance(i, slice):
+            del self._items[i]
+            self._rebuild()
+            return
+        f = self._items.pop(i)
+        self._untrack(f)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __iter__(self) -> Iterator[Factory]:
+        return iter(self._items)
+
+    def __contains__(self, f: Any) -> bool:
+        return f in self._items
+
+    def insert(self, i: int, f: Factory):
+        self._items.insert(i, f)
+        self._track(f)
+
+    def append(self, f: Factory):
+        self._items.append(f)
+        self._track(f)
+
+    def remove(self, f: Factory):
+        del self[self._items.index(f)] # 與 list.remove 相同：依欄位相等比對
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, Factories): other = other._items
+        return self._items == other
+
+    def __repr__(self) -> str:
+        return f"Factories({self._items!r})"
+
+    def __copy__(self) -> "Factories":
+        return Factories(self._items)
+
+    def __deepcopy__(self, memo) -> "Factories":
+        return Factories([copy.deepcopy(f, memo) for f in self._items])
+
+    def __reduce__(self):
+        return Factories, (self._items,)
+
+    # --- pydantic 整合：從列表驗證建立，序列化回列表 ---
+    @classmethod
+    def _validate(cls, value: Any) -> "Factories":
+        if isinstance(value, Factories):
+            return value
+        if not isinstance(value, (list, tuple)):
+            raise ValueError("設施必須是列表")
+        return cls(f if isinstance(f, Factory) else Factory(**f) for f in value)
+
+    @classmethod
+    def __get_pydantic_core_schema__(cls, source, handler):
+        return core_schema.no_info_plain_validator_function(
+            cls._validate,
+            serialization=core_schema.plain_serializer_function_ser_schema(lambda v: [f.model_dump() for f in v]),
+        )
+
 class PlayerState(BaseModel):
     id: str
     name: str
     money: int
-    inventory: Dict[str, int]
-    locked_inventory: Dict[str, int] = {}
+    inventory: Inventory  # 以物品序號為索引的陣列，序列化時仍是 {item_id: 數量}
+    locked_inventory: Inventory = Field(default_factory=Inventory)
     locked_money: int = 0
-    factories: List[Factory]
+    factories: Factories  # 依建造順序的設施列表，附 id 索引與彙總值
     land_limit: int = 5
\ No newline at end of file
@@ -0,0 +1,216 @@
+import bisect
+import heapq
+import itertools
+from typing import Dict, Iterator, List, Optional, Tuple
+from core.models import Order
+
+DEPTH_LEVELS = 5  # 市場深度每邊顯示幾個價位
+
+class OrderBook:
+    """
+    單一物品的訂單簿：買賣兩邊各用一個 heap，依「價格優先、時間優先」排序。
+    - 買方 heap 的鍵為 (-價格, 時間, 序號)，最高價的最早買單在最上面。
+    - 賣方 heap 的鍵為 (價格, 時間, 序號)，最低價的最早賣單在最上面。
+    掛單時就排好位置 (O(log n))，撮合直接從頂端取單，不必每回合重新分類、排序整份訂單列表。
+    取消訂單採「延遲刪除」：只把 heap 中的項目標記為已移除 (O(1))，等它浮到頂端時才真正丟掉。
+    另外依價位彙總每邊的掛單量 (掛單、取消、成交時增量更新)，供交易階段的指示價格與市場深度使用。
+    """
+    def __init__(self, item_id: str):
+        self.item_id = item_id
+        self._bids: List[list] = []  # [鍵1, 時間, 序號, Order 或 None (已取消)]
+        self._asks: List[list] = []
+        self._entries: Dict[str, list] = {}  # order_id -> heap 項目
+        self.bid_count = 0
+        self.ask_count = 0
+        self._seq = itertools.count()  # 同一時間戳的訂單依到達順序排列
+        self.bid_levels: Dict[int, int] = {}  # 價格 -> 該價位掛單總量
+        self.ask_levels: Dict[int, int] = {}
+        self._bid_prices: List[int] = []  # 有掛單的價位 (由低到高)
+        self._ask_prices: List[int] = []
+        self._indicative: Optional[Tuple[int, int, int]] = None  # (參考市價, 指示價, 可成交量)
+
+    # --- 掛單 / 取消 ---
+    def add(self, order: Order):
+        if order.type == "BID":
+            entry = [-order.price, order.timestamp, next(self._seq), order]
+            heapq.heappush(self._bids, entry)
+            self.bid_count += 1
+        else:
+            entry = [order.price, order.timestamp, next(self._seq), order]
+            heapq.heappush(self._asks, entry)
+            self.ask_count += 1
+        self._entries[order.id] = entry
+        self._adjust_level(order, order.quantity)
+
+    def get(self, order_id: str) -> Optional[Order]:
+        entry = self._entries.get(order_id)
+        return entry[3] if entry else None
+
+    def remove(self, order_id: str) -> Optional[Order]:
+        entry = self._entries.pop(order_id, None)
+        if entry is None: return None
+        order, entry[3] = entry[3], None
+        if order.type == "BID": self.bid_count -= 1
+        else: self.ask_count -= 1
+        self._adjust_level(order, -order.quantity)
+        return order
+
+    def fill(self, order: Order, qty: int):
+        """訂單部分或全部成交：扣掉數量並同步價位彙總 (全部成交後仍需 pop 移出訂單簿)。"""
+        order.quantity -= qty
+        self._adjust_level(order, -qty)
+
+    def _adjust_level(self, order: Order, qty: int):
+        if order.type == "BID": levels, prices = self.bid_levels, self._bid_prices
+        else: levels, prices = self.ask_levels, self._ask_prices
+        total = levels.get(order.price, 0) + qty
+        if total > 0:
+            if order.price not in levels: bisect.insort(prices, order.price)
+            levels[order.price] = total
+        elif order.price in levels:
+            del levels[order.price]
+            del prices[bisect.bisect_left(prices, order.price)]
+        self._indicative = None
+
+    # --- 撮合用 (讀取 / 移除最優價) ---
+    def best_bid(self) -> Optional[Order]:
+        return self._top(self._bids)
+
+    def best_ask(self) -> Optional[Order]:
+        return self._top(self._asks)
+
+    def pop_bid(self) -> Order:
+        return self.remove(self._top(self._bids).id)
+
+    def pop_ask(self) -> Order:
+        return self.remove(self._top(self._asks).id)
+
+    @staticmethod
+    def _top(heap: List[list]) -> Optional[Order]:
+        while heap and heap[0][3] is None:
+            heapq.heappop(heap)  # 丟掉已取消的項目
+        return heap[0][3] if heap else None
+
+    # --- 集合競價用 (整邊依優先順序排好) ---
+    def sorted_bids(self) -> List[Order]:
+        return [entry[3] for entry in sorted(self._bids) if entry[3] is not None]
+
+    def sorted_asks(self) -> List[Order]:
+        return [entry[3] for entry in sorted(self._asks) if entry[3] is not None]
+
+    # --- 指示價格與市場深度 (交易階段即時顯示) ---
+    def indicative(self, last_price: int) -> Tuple[int, int]:
+        """若現在進行集合競價的 (結算價, 成交量)；結果快取到訂單簿下次變動為止。"""
+        cached = self._indicative
+        if cached is None or cached[0] != last_price:
+            price, volume = _clear_levels(self.bid_levels, self.ask_levels, last_price)
+            cached = self._indicative = (last_price, price, volume)
+        return cached[1], cached[2]
+
+    def depth(self, levels: int = DEPTH_LEVELS) -> Dict[str, List[List[int]]]:
+        return {
+            "bids": [[p, self.bid_levels[p]] for p in reversed(self._bid_prices[-levels:])],
+            "asks": [[p, self.ask_levels[p]] for p in self._ask_prices[:levels]],
+        }
+
+    def __len__(self) -> int:
+        return self.bid_count + self.ask_count
+
+    def __iter__(self) -> Iterator[Order]:
+        for entry in self._entries.values(): yield entry[3]
+
+class MarketBook:
+    """
+    一般市場所有物品的訂單簿 (item_id -> OrderBook)，取代原本扁平的 engine.orders 列表。
+    另外維護 order_id -> 所在訂單簿、player_id -> 訂單代碼的索引，取消、改價與查詢玩家掛單都不必掃描。
+    迭代時會走過所有掛單 (順序不保證)，供存檔與統計使用。
+    """
+    def __init__(self):
+        self._books: Dict[str, OrderBook] = {}
+        self._index: Dict[str, OrderBook] = {}
+        self._by_player: Dict[str, Dict[str, None]] = {}  # 用 dict 保留掛單順序
+
+    def add(self, order: Order) -> OrderBook:
+        book = self._books.get(order.item_id)
+        if book is None:
+            book = self._books[order.item_id] = OrderBook(order.item_id)
+        book.add(order)
+        self._index[order.id] = book
+        self._by_player.setdefault(order.player_id, {})[order.id] = None
+        return book
+
+    def get(self, order_id: str) -> Optional[Order]:
+        book = self._index.get(order_id)
+        return book.get(order_id) if book else None
+
+    def remove(self, order_id: str) -> Optional[Order]:
+        book = self._index.pop(order_id, None)
+        order = book.remove(order_id) if book else None
+        if order is not None:
+            self._by_player.get(order.player_id, {}).pop(order_id, None)
+        return order
+
+    def orders_of(self, player_id: str) -> List[Order]:
+        # 撮合時直接從訂單簿彈出的訂單不會回頭更新索引，這裡順便略過
+        orders = (self.get(oid) for oid in self._by_player.get(player_id, ()))
+        return [o for o in orders if o is not None]
+
+    def market_depth(self, market_prices: Dict[str, int]) -> Dict[str, dict]:
+        """每個有掛單物品的指示價格、可成交量與前幾檔深度。"""
+        result = {}
+        for item_id, book in self._books.items():
+            if not len(book): continue
+            price, volume = book.indicative(market_prices.get(item_id, 0))
+            result[item_id] = {"indicative_price": price, "volume": volume, **book.depth()}
+        return result
+
+    def book(self, item_id: str) -> Optional[OrderBook]:
+        return self._books.get(item_id)
+
+    def books(self) -> List[OrderBook]:
+        return list(self._books.values())
+
+    def clear(self):
+        self._books.clear()
+        self._index.clear()
+        self._by_player.clear()
+
+    def __len__(self) -> int:
+        return sum(len(b) for b in self._books.values())
+
+    def __iter__(self) -> Iterator[Order]:
+        for book in self._books.values():
+            yield from book
+
+# --- 集合競價結算價 ---
+def clearing_price(bids: List[Order], asks: List[Order], last_price: int) -> Tuple[int, int]:
+    """
+    集合競價：在所有出現過的價位中找出成交量 min(需求, 供給) 最大的價格，
+    多個價位同為最大量時取最接近上一次市價者 (距離相同取較低價)。回傳 (結算價, 成交量)。
+    需求 = 出價 >= P 的買單總量，供給 = 開價 <= P 的賣單總量；兩條曲線都只用一次累積和算出。
+    """
+    if not bids or not asks: return last_price, 0
+
+    bid_levels: Dict[int, int] = {}
+    for o in bids: bid_levels[o.price] = bid_levels.get(o.price, 0) + o.quantity
+    ask_levels: Dict[int, int] = {}
+    for o in asks: ask_levels[o.price] = ask_levels.get(o.price, 0) + o.quantity
+    return _clear_levels(bid_levels, ask_levels, last_price)
+
+def _clear_levels(bid_levels: Dict[int, int], ask_levels: Dict[int, int], last_price: int) -> Tuple[int, int]:
+    """clearing_price 的核心，輸入為依價位彙總後的買賣量 (價格 -> 數量)。"""
+    if not bid_levels or not ask_levels: return last_price, 0
+    prices = sorted(bid_levels.keys() | ask_levels.keys())
+
+    # 供給：由低價往高價累加；需求：由高價往低價累加
+    supply = list(itertools.accumulate(ask_levels.get(p, 0) for p in prices))
+    demand = list(itertools.accumulate(bid_levels.get(p, 0) for p in reversed(prices)))[::-1]
+
+    best_price, max_vol, best_dist = last_price, 0, 0
+    for p, d, s in zip(prices, demand, supply):
+        vol = d if d < s else s
+        if vol > max_vol:
+            best_price, max_vol, best_dist = p, vol, abs(p - last_price)
+        elif vol == max_vol and vol > 0 and abs(p - last_price) < best_dist:
+            best_price, best_dist = p, abs(p - last_price)
+    return best_price, max_vol
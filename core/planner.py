@@ -0,0 +1,218 @@
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+import config
+from core.substitution import PREFER_CHEAPEST, allocate_ingredients, substitution_order
+
+# --- 生產規劃 ---
+# 依玩家目前的庫存、設施與市價，找出本回合價值最高的生產組合：
+# 每座設施生產哪個產品、生產多少 (低階產品可以當場拿去給高階工廠用)，價值 = 產出市值 - 消耗原料市值。
+# 搜尋是純函式，以 (庫存, 設施, 市價, 事件) 為鍵快取；同一回合重複查詢或庫存沒變的玩家不必重算。
+
+PASSIVE_FACILITIES = ("Defense", "Prophet")  # 只有被動效果，不參與生產
+# 搜尋節點上限 (約 50~80 µs / 節點)：5 座以下可生產設施的盤面幾乎都在上限內找到最佳解，
+# 設施更多時所需節點成長很快 (9 座的 p90 約 8 萬)，超過上限的部分改用貪婪法，結果只是啟發式的建議
+PLAN_NODE_BUDGET = 2000
+PLAN_CACHE_SIZE = 4096
+
+# 設施在規劃中的描述：(factory_id, 名稱, 階級, has_produced, is_shutdown, current_product)
+FactoryKey = Tuple[str, str, int, bool, bool, Optional[str]]
+
+class _Producer:
+    """一座可生產的設施：可選的產品 (序號、配方、每批產量) 與是否固定只做 1 批。"""
+    __slots__ = ("factory_id", "products", "omni", "single_batch", "order")
+
+    def __init__(self, factory_id: str, products: list, omni: bool, single_batch: bool, order: int):
+        self.factory_id = factory_id
+        self.products = products  # [(物品序號, 配方, 每批產量), ...]
+        self.omni = omni
+        self.single_batch = single_batch
+        self.order = order
+
+def _producer(f: FactoryKey, event_effects: Tuple[Optional[str], Optional[str]]) -> Optional[_Producer]:
+    """依 process_production 的規則整理出設施能做什麼；本回合不能再生產時回傳 None。"""
+    factory_id, name, tier, has_produced, is_shutdown, current_product = f
+    special_effect, logic_key = event_effects
+    if is_shutdown or name in PASSIVE_FACILITIES:
+        return None
+
+    # 沒有原料的生產 (採集器、鑽石場) 以 1 批計算，與玩家畫面一致
+    if "Miner" in name:
+        if has_produced: return None
+        per_batch = config.MINER_OUTPUTS.get(tier, 3) + (1 if special_effect == "MINER_BOOST_1" else 0)
+        return _Producer(factory_id, [(i, (), per_batch) for i in config.TIER_INDEXES.get(0, ())], False, True, 0)
+
+    if name == "Diamond Mine":
+        if has_produced and current_product not in (None, "diamond"): return None
+        per_batch = 2 if logic_key == "DIAMOND_BOOST" else 1
+        return _Producer(factory_id, [(config.ITEM_INDEX["diamond"], config.RECIPES["diamond"], per_batch)], False, True, 4)
+
+    per_batch = 2 if name == "Accelerator" else 1
+    products = [
+        (i, config.RECIPES[config.ITEM_IDS[i]], per_batch)
+        for i in config.TIER_INDEXES.get(tier, ())
+        if config.ITEM_IDS[i] in config.RECIPES and config.ITEM_IDS[i] != "diamond"
+    ]
+    if has_produced and current_product: # 產線已鎖定
+        products = [p for p in products if config.ITEM_IDS[p[0]] == current_product]
+    if not products: return None
+    return _Producer(factory_id, products, name == "Omni Factory", False, tier)
+
+# --- 原料計算 (與 process_production 相同；萬能工廠一律以市價最低的替代品優先) ---
+def _max_batches(counts: Tuple[int, ...], recipe, omni: bool) -> int:
+    if not recipe:
+        return 1
+    if not omni:
+        return min(counts[ing] // qty for ing, qty in recipe)
+    # 萬能工廠：同階級的物品可以互相替代，每個階級的總量夠用即可
+    need: Dict[int, int] = {}
+    for ing, qty in recipe:
+        tier = config.ITEM_TIERS[ing]
+        need[tier] = need.get(tier, 0) + qty
+    return min(sum(counts[i] for i in config.TIER_INDEXES[tier]) // qty for tier, qty in need.items())
+
+
+def _quantities(max_q: int) -> List[int]:
+    """要嘗試的批數：全部或一半 (另一半原料留給後面的設施)，由大到小且不重複。"""
+    return sorted({max_q, (max_q + 1) // 2}, reverse=True)
+
+def _touched(recipe, omni: bool) -> frozenset:
+    """生產時可能減少的物品 (萬能工廠包含原料同階級的所有替代品)。"""
+    return frozenset(i for ing, _ in recipe for i in (config.TIER_INDEXES[config.ITEM_TIERS[ing]] if omni else (ing,)))
+
+def _cheapest_order(prices: Tuple[int, ...]):
+    """萬能工廠的替代順序 (市價最低的先用)，每個階級只排序一次。"""
+    order = substitution_order(PREFER_CHEAPEST, prices)
+    ranked = {tier: order(tier) for tier in config.TIER_INDEXES}
+    return ranked.__getitem__
+
+def _apply(counts: Tuple[int, ...], producer: _Producer, product, batches: int, prices: Tuple[int, ...], order):
+    item, recipe, per_batch = product
+    if producer.omni:
+        take, _ = allocate_ingredients(counts, recipe, batches, order)
+    else: # 一般工廠直接照配方扣 (呼叫前已確認原料足夠)
+        take = {ing: qty * batches for ing, qty in recipe}
+    after = list(counts)
+    for i, n in take.items():
+        after[i] -= n
+    produced = per_batch * batches
+    after[item] += produced
+    value = produced * prices[item] - sum(n * prices[i] for i, n in take.items())
+    return tuple(after), produced, value
+
+class _Search:
+    """
+    依產品階級由低到高逐一決定每座設施的產品與批數，以 (第幾座設施, 庫存) 記憶已算過的結果。
+    - 記憶的鍵只取後面的設施還用得到的物品，其餘庫存不影響剩下的決定。
+    - 原料沒有被後面的設施搶用、產品也不會被拿去再加工時，直接全部生產 (增值為負就不做)，
+      只有真的有取捨時才嘗試保留原料的較少批數。
+    - 相同的設施 (例如兩座 T2 加工廠) 交換產品是同一種組合，只依產品順序搜尋一次。
+    """
+    def __init__(self, producers: List[_Producer], prices: Tuple[int, ...]):
+        self.producers = producers
+        self.prices = prices
+        self.order = _cheapest_order(prices)
+        self.memo: Dict[tuple, Tuple[int, tuple]] = {}
+        self.nodes = 0
+        self.exact = True
+        # needs[i]：第 i 座 (含) 之後的設施可能消耗的物品
+        self.needs: List[frozenset] = [frozenset()] * (len(producers) + 1)
+        for i in range(len(producers) - 1, -1, -1):
+            p = producers[i]
+            self.needs[i] = self.needs[i + 1].union(*(_touched(recipe, p.omni) for _, recipe, _ in p.products))
+        self.keys = [tuple(sorted(n)) for n in self.needs]
+        # 每座設施的產品附上是否與後面的設施無關
+        self.options = [
+            [(product, product[0] not in self.needs[i + 1] and self.needs[i + 1].isdisjoint(_touched(product[1], p.omni)))
+             for product in p.products]
+            for i, p in enumerate(producers)
+        ]
+        self.same_as_next = [
+            i + 1 < len(producers) and (p.products, p.omni, p.single_batch) ==
+            (producers[i + 1].products, producers[i + 1].omni, producers[i + 1].single_batch)
+            for i, p in enumerate(producers)
+        ]
+
+    def best(self, i: int, counts: Tuple[int, ...], first: int = 0) -> Tuple[int, tuple]:
+        """first：前一座相同的設施選了第 first-1 個產品，這座只從第 first 個開始選 (閒置的設施排在最後)。"""
+        if i == len(self.producers):
+            return 0, ()
+        key = (i, first, tuple(counts[j] for j in self.keys[i]))
+        hit = self.memo.get(key)
+        if hit is not None:
+            return hit
+        self.nodes += 1
+        if self.nodes > PLAN_NODE_BUDGET:
+            self.exact = False
+            return self._greedy(i, counts)
+
+        producer, same = self.producers[i], self.same_as_next[i]
+        result = self.best(i + 1, counts, len(producer.products) if same else 0) # 這座設施閒置
+        for k in range(first, len(producer.products)):
+            product, independent = self.options[i][k]
+            max_q = _max_batches(counts, product[1], producer.omni)
+            if max_q <= 0: continue
+            for batches in ([1] if producer.single_batch else [max_q] if independent else _quantities(max_q)):
+                after, produced, value = _apply(counts, producer, product, batches, self.prices, self.order)
+                if independent and value <= 0: continue
+                rest_value, rest = self.best(i + 1, after, k + 1 if same else 0)
+                if value + rest_value > result[0]:
+                    step = (producer, product[0], batches, produced, value)
+                    result = (value + rest_value, (step,) + rest)
+        self.memo[key] = result
+        return result
+
+    def _greedy(self, i: int, counts: Tuple[int, ...]) -> Tuple[int, tuple]:
+        total, steps = 0, ()
+        for producer in self.producers[i:]:
+            choice = None
+            for product in producer.products:
+                max_q = _max_batches(counts, product[1], producer.omni)
+                if max_q <= 0: continue
+                after, produced, value = _apply(counts, producer, product, 1 if producer.single_batch else max_q, self.prices, self.order)
+                if value > 0 and (choice is None or value > choice[0]):
+                    choice = (value, after, (producer, product[0], produced // product[2], produced, value))
+            if choice:
+                total += choice[0]
+                counts = choice[1]
+                steps += (choice[2],)
+        return total, steps
+
+def _step_dict(step) -> dict:
+    producer, item, batches, produced, value = step
+    # 欄位與 /api/actions/batch 的 produce 指令相同，可以直接送出
+    return {"action": "produce", "factory_id": producer.factory_id, "target_item": config.ITEM_IDS[item],
+            "quantity": batches, "substitutes": PREFER_CHEAPEST if producer.omni else None,
+            "produced": produced, "value": value}
+
+@lru_cache(maxsize=PLAN_CACHE_SIZE)
+def plan_production(counts: Tuple[int, ...], factories: Tuple[FactoryKey, ...], prices: Tuple[int, ...],
+                    event_effects: Tuple[Optional[str], Optional[str]] = (None, None)) -> dict:
+    """
+    counts 與 prices 依物品序號排列；回傳
+    - plan：價值最高的生產步驟 (依執行順序)，value 為整份計畫的總增值
+    - options：每座設施以目前庫存單獨生產時的所有可行產品，依增值由高到低排列
+    - exact：是否在搜尋上限內完成；False 時後面的設施是以貪婪法決定，plan 是啟發式的結果，不保證最佳
+    - note：exact 為 False 時給玩家看的說明，否則為 None
+    純函式，可以在背景執行緒呼叫；回傳的 dict 由快取共用，呼叫端請勿修改。
+    """
+    producers = [p for p in (_producer(f, event_effects) for f in factories) if p is not None]
+    producers.sort(key=lambda p: p.order) # 低階先做，產出可以供給高階工廠
+    search = _Search(producers, prices)
+    value, steps = search.best(0, counts)
+
+    options = {}
+    for producer in producers:
+        ranked = []
+        for product in producer.products:
+            max_q = _max_batches(counts, product[1], producer.omni)
+            if max_q <= 0: continue
+            batches = 1 if producer.single_batch else max_q
+            _, produced, gain = _apply(counts, producer, product, batches, prices, search.order)
+            ranked.append({"target_item": config.ITEM_IDS[product[0]], "max_quantity": batches,
+                           "produced": produced, "value": gain})
+        ranked.sort(key=lambda o: -o["value"])
+        options[producer.factory_id] = ranked
+
+    note = None if search.exact else "設施較多，超過搜尋上限的部分以貪婪法決定：這是啟發式的建議，不保證是價值最高的組合"
+    return {"value": value, "plan": [_step_dict(s) for s in steps], "options": options, "exact": search.exact, "note": note}
@@ -0,0 +1,83 @@
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from core.engine import GameEngine
+from core.models import Order, PlayerState
+from core.Phases.phase2 import ACTION_COMMANDS
+from core.room import GameRoom
+
+Command = Tuple[str, Any]  # (指令, 參數)，與 StateManager.load_commands() 的格式相同
+GAME_START = ("create_room", "reset")  # 這兩個指令的參數帶有新一局的種子
+
+class ReplayError(Exception):
+    """重播時某個原本成功的指令被拒絕：代表重播出來的狀態已經和原本的遊戲分岔。"""
+
+# --- 玩家操作：與 main.py 各端點呼叫的引擎方法相同 (階段、玩家存在等前置檢查當時已通過) ---
+def _trade(engine: GameEngine, p: PlayerState, d: dict) -> Tuple[bool, str]:
+    order = Order(player_id=p.id, type=d["type"], item_id=d["item_id"], price=d["price"], quantity=d["quantity"])
+    success, msg = engine.validate_and_lock_assets(p, order)
+    if success:
+        if order.type == "GOV_ASK": engine.gov_orders.append(order)
+        else: engine.orders.add(order)
+    return success, msg
+
+def _batch(engine: GameEngine, p: PlayerState, d: dict) -> Tuple[bool, str]:
+    # 日誌只記下當時成功的指令，重播時每一個都必須再次成功
+    for cmd, (success, msg) in zip(d["actions"], engine.process_batch(p, d["actions"])):
+        if not success:
+            return False, f"{cmd['action']}: {msg}"
+    return True, ""
+
+PLAYER_COMMANDS: Dict[str, Callable[[GameEngine, PlayerState, dict], Tuple[bool, str]]] = {
+    **ACTION_COMMANDS,
+    "batch": _batch,
+    "trade": _trade,
+    "cancel_order": lambda e, p, d: e.cancel_order(p, d["order_id"]),
+    "amend_order": lambda e, p, d: e.amend_order(p, d["order_id"], d["price"], d.get("quantity")),
+}
+
+def apply_command(room: GameRoom, action: str, payload: Any):
+    """在房間上重新執行一個指令；不經過 HTTP，也不寫入存檔。"""
+    if action == "register":
+        room.register_player(payload["name"])
+    elif action == "next_phase":
+        room.advance_phase()
+    elif action == "end_game":
+        room.end_game()
+    elif action == "reset":
+        room.reset(payload["seed"])
+    elif action in PLAYER_COMMANDS:
+        p = room.players.get(payload["player_id"])
+        if p is None:
+            raise ReplayError(f"{action}: 找不到玩家 {payload['player_id']}")
+        success, msg = PLAYER_COMMANDS[action](room.engine, p, payload)
+        if not success:
+            raise ReplayError(f"{action} 在重播時失敗 (回合 {room.turn} 階段 {room.phase})：{msg}")
+    else:
+        raise ReplayError(f"未知的指令: {action}")
+
+def split_games(commands: List[Command]) -> List[List[Command]]:
+    """依「建立房間 / 重置」把指令切成一局一局；開頭沒有種子的指令 (舊版存檔) 會被略過。"""
+    games: List[List[Command]] = []
+    for action, payload in commands:
+        if action in GAME_START:
+            games.append([(action, payload)])
+        elif games:
+            games[-1].append((action, payload))
+    return games
+
+def replay(room_id: str, game: List[Command], turn: Optional[int] = None, phase: int = 1) -> Tuple[GameRoom, int]:
+    """
+    從一局的第一個指令 (帶種子) 開始重播。指定 turn 時，在房間進入 (turn, phase) 的那一刻停下；
+    否則重播到最後。回傳 (房間, 實際套用的指令數)。
+    """
+    (start, payload), rest = game[0], game[1:]
+    if start not in GAME_START:
+        raise ReplayError("這一局沒有記錄起始種子，無法重播")
+    room = GameRoom(room_id, seed=payload["seed"])
+    applied = 0
+    for action, payload in rest:
+        if turn is not None and (room.turn, room.phase) >= (turn, phase):
+            break
+        apply_command(room, action, payload)
+        applied += 1
+    return room, applied
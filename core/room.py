@@ -0,0 +1,514 @@
+import asyncio
+import copy
+import re
+import sys
+import time
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+import config
+from core.models import PlayerState, Factory, Order
+from core.engine import GameEngine
+from core.serialize import player_to_dict, order_to_dict
+from core.roster import Roster
+from core.metrics import PHASE_SECONDS
+from core.event_log import EventLog, LOG_SYSTEM, LOG_PLAYER, LOG_SETTLEMENT
+from core.broadcast import (
+    StateNotifier, ALL_SECTIONS, SECTION_PHASE, SECTION_EVENTS,
+    SECTION_PRICES, SECTION_PLAYERS, SECTION_LOGS, SECTION_BOOK
+)
+
+DEFAULT_ROOM_ID = "default"
+ROOM_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,32}$")
+MAX_LOGS = 100  # 記憶體中保留的日誌筆數，更舊的寫入存檔
+SNAPSHOT_EVERY = 500  # 每累積這麼多筆操作日誌就重新拍一次快照，縮短重啟時要重播的長度
+
+class GameRoom:
+    """
+    一場獨立的遊戲：擁有自己的引擎、玩家、階段、回合、日誌與最終排名。
+    同一個伺服器行程可以同時開很多房間，彼此狀態完全隔離。
+    """
+    def __init__(self, room_id: str, journal=None, seed: Optional[int] = None):
+        self.id = room_id
+        self.created_at = time.time()
+        # 版本號跨越重置持續遞增，客戶端手上的 since 才不會失效
+        self.notifier = StateNotifier()
+        self.journal = journal  # core.state_manager.StateManager，None 代表不持久化
+        self.events = EventLog(MAX_LOGS, archive=self._archive_logs if journal else None)
+        self._new_logs: List[dict] = []  # 上一次寫入日誌後新增的紀錄
+        self._actions_since_snapshot = 0
+        self._depth_cache: Tuple[int, dict] = (-1, {})  # (SECTION_BOOK 版本, 市場深度)
+        self._settling: Optional[asyncio.Event] = None  # 背景結算進行中時不為 None
+        self._init_game(seed)
+
+    def _init_game(self, seed: Optional[int] = None):
+        self.roster = Roster()
+        self._roster_version = -1  # 名單最後一次套用髒標記時的版本號
+        self._player_cache: Dict[str, Tuple[int, Tuple[dict, List[dict]]]] = {}
+        self.engine = GameEngine(seed)
+        self.engine.generate_daily_event(1)
+        self.players: Dict[str, PlayerState] = {}
+        self.phase = 1
+        self.turn = 1
+        self.final_ranking: List[dict] = []  # 儲存最終結算成績
+
+    # --- 日誌與通知 ---
+    def log_event(self, message: str, kind: str = LOG_SYSTEM, player_id: Optional[str] = None):
+        """寫入一筆日誌；指定 player_id 時只有該玩家 (與管理員) 看得到。"""
+        entry = self.events.append(message, kind, player_id)
+        if self.journal:
+            self._new_logs.append(entry)
+
+    def _archive_logs(self, entries: List[dict]):
+        self.journal.archive_logs(self.id, entries)
+
+    def notify(self, *sections: str, player_ids: List[str] = (), all_players: bool = False):
+        """任何會改變玩家或遊戲狀態的操作完成後呼叫：標記變動的區塊/玩家，並推播給所有 SSE 連線。"""
+        self.notifier.bump(*sections, player_ids=player_ids, all_players=all_players)
+
+    # --- 持久化 (快照 + 操作日誌) ---
+    def record(self, action: str, payload: dict, player_ids: List[str] = (), order: Optional[Order] = None,
+               removed_order_id: Optional[str] = None):
+        """
+        把一筆已成功的操作寫入日誌。redo 內容是受影響玩家的最新狀態、撤下/新掛的訂單與新增的日誌行，
+        重啟時直接套用即可，不必重新執行遊戲邏輯 (也就不受亂數、uuid 影響)。
+        """
+        if not self.journal:
+            return
+        redo = {
+            "players": {pid: player_to_dict(self.players[pid]) for pid in player_ids if pid in self.players},
+            "logs": self._new_logs,
+            "ids_drawn": self.engine.ids_drawn,
+        }
+        if removed_order_id is not None:
+            redo["removed_order"] = removed_order_id
+        if order is not None:
+            redo["order"] = order_to_dict(order)
+        self._new_logs = []
+        self.journal.append(self.id, action, payload, redo)
+
+        self._actions_since_snapshot += 1
+        if self._actions_since_snapshot >= SNAPSHOT_EVERY:
+            self.save_snapshot()
+
+    def save_snapshot(self, action: Optional[str] = None, payload: Optional[dict] = None):
+        """寫入整份房間快照；action 不為 None 時同時記下這個操作 (切換階段、重置、結算)。"""
+        if not self.journal:
+            return
+        if action:
+            self.journal.append(self.id, action, payload, None)
+        self.journal.snapshot(self.id, self.to_snapshot())
+        self._new_logs = []
+        self._actions_since_snapshot = 0
+
+    def to_snapshot(self) -> dict:
+        engine = self.engine
+        return {
+            "created_at": self.created_at,
+            "phase": self.phase,
+            "turn": self.turn,
+            "events": self.events.to_dict(),
+            "final_ranking": self.final_ranking,
+            "players": {pid: player_to_dict(p) for pid, p in self.players.items()},
+            "engine": {
+                "rng": engine.rng_state(),
+                "market_prices": dict(engine.market_prices),
+                # 事件只存代碼，還原時指回 config 中的同一份資料
+                "current_event": (engine.current_event or {}).get("id"),
+                "active_gov_event": (engine.active_gov_event or {}).get("id"),
+                "orders": [order_to_dict(o) for o in engine.orders],
+                "gov_orders": [order_to_dict(o) for o in engine.gov_orders],
+            },
+        }
+
+    @classmethod
+    def from_snapshot(cls, room_id: str, data: dict, journal=None) -> "GameRoom":
+        room = cls(room_id, journal=journal)
+        room.created_at = data["created_at"]
+        room.phase = data["phase"]
+        room.turn = data["turn"]
+        if "events" in data:
+            room.events.load(data["events"])
+        else: # 舊版快照：純文字日誌行，最新在前
+            for line in reversed(data["logs"]):
+                room.events.restore(line)
+        room.final_ranking = data["final_ranking"]
+        room.players = {pid: PlayerState(**p) for pid, p in data["players"].items()}
+
+        engine, saved = room.engine, data["engine"]
+        if "rng" in saved: # 舊版快照沒有亂數狀態，沿用新抽的種子
+            engine.set_rng_state(saved["rng"])
+        engine.market_prices = saved["market_prices"]
+        engine.current_event = _find_by_id(config.EVENTS_DB, saved["current_event"])
+        engine.active_gov_event = _find_by_id(config.GOV_ACQUISITIONS, saved["active_gov_event"])
+        for o in saved["orders"]:
+            engine.orders.add(Order(**o))
+        engine.gov_orders = [Order(**o) for o in saved["gov_orders"]]
+        return room
+
+    def apply_redo(self, redo: dict):
+        self.engine.sync_ids(redo.get("ids_drawn", 0)) # 接續配發代碼，不會和當機前發出去的重複
+        for pid, p in redo["players"].items():
+            self.players[pid] = PlayerState(**p)
+            self.engine.mark_dirty(self.players[pid])
+        if "removed_order" in redo:
+            self.engine.remove_order(redo["removed_order"])
+        if "order" in redo:
+            order = Order(**redo["order"])
+            if order.type == "GOV_ASK":
+                self.engine.gov_orders.append(order)
+            else:
+                self.engine.orders.add(order)
+        for entry in redo["logs"]:
+            self.events.restore(entry)
+
+    # --- 狀態組裝 (輪詢與推播共用) ---
+    def build_admin_data(self, log_cursor: Optional[int] = None) -> dict:
+        """log_cursor 為客戶端上次收到的 log_cursor：只附上之後新增的日誌。"""
+        # 根據金額排序 (有錢人排前面)；排行榜隨髒標記增量維護，不必每次重新排序
+        player_list = self._refreshed_roster().leaderboard()
+        logs_reset, logs = self.events.since(log_cursor)
+
+        return {
+            "room_id": self.id,
+            "phase": self.phase,
+            "turn": self.turn,
+            "players": player_list,
+            "logs": logs,
+            "logs_reset": logs_reset, # True 代表 logs 是完整的一份，客戶端應先清掉舊日誌
+            "log_cursor": self.events.seq,
+            "catalog_hash": config.CATALOG_HASH,
+            "market_prices": self.engine.market_prices
+        }
+
+    def build_state(self, player_id: Optional[str] = None, since: Optional[int] = None,
+                    include_meta: bool = False) -> Optional[dict]:
+        """
+        since=None 時回傳完整快照；否則只回傳版本號大於 since 的區塊，完全沒有變動時回傳 None。
+        客戶端帶來的游標先以 notifier.parse_cursor() 轉成版本號 (失效的游標得到 None，即完整快照)。
+        回應的 version 是下次要帶回來的游標 (epoch.版本號)。
+        物品資料改由 /api/catalog 提供，只有舊客戶端 (include_meta) 才會在快照裡附上 items_meta。
+        """
+        notifier = self.notifier
+        full = since is None
+
+        def changed(section: str) -> bool:
+            return full or notifier.section_version(section) > since
+
+        response = {"version": notifier.cursor()}
+        if full:
+            response["snapshot"] = True
+            response["catalog_hash"] = config.CATALOG_HASH
+        if changed(SECTION_PHASE):
+            response["turn"] = self.turn
+            response["phase"] = self.phase
+            # 新增：如果遊戲結束(Phase 5)，把最終排名傳給前端
+            if self.phase == 5:
+                response["final_ranking"] = self.final_ranking
+            elif not full:
+                response["final_ranking"] = None # 讓增量客戶端清掉上一局的排名
+        if changed(SECTION_EVENTS):
+            response["event"] = self.engine.current_event
+            response["gov_event"] = self.engine.active_gov_event
+        if changed(SECTION_PRICES):
+            response["market_prices"] = self.engine.market_prices
+        if changed(SECTION_BOOK):
+            response["order_book"] = self.market_depth()
+        if include_meta:
+            response["items_meta"] = config.ITEMS
+        if changed(SECTION_PLAYERS):
+            response["all_players"] = self._roster()
+        if player_id in self.players and (full or notifier.player_version(player_id) > since):
+            response["player"], response["orders"] = self._player_view(player_id)
+
+        if not full and len(response) == 1: # 只有 version
+            return None
+        if player_id and player_id not in self.players and not full:
+            response["player"] = None # 玩家已不存在 (例如遊戲被重置)
+        return response
+
+    def _roster(self) -> List[dict]:
+        """所有玩家的公開資料；同一版本只組一次，所有連線共用。"""
+        return self._refreshed_roster().public()
+
+    def _refreshed_roster(self) -> Roster:
+        # 版本號有變動時才取出引擎的髒標記，只重建被修改過的玩家
+        if self._roster_version != self.notifier.version:
+            self.roster.refresh(self.players, self.engine.take_dirty())
+            self._roster_version = self.notifier.version
+        return self.roster
+
+    def _player_view(self, player_id: str) -> Tuple[dict, List[dict]]:
+        """(玩家完整狀態, 玩家掛單)；快取到該玩家的版本號變動為止。"""
+        version = self.notifier.player_version(player_id)
+        cached = self._player_cache.get(player_id)
+        if cached is None or cached[0] != version:
+            view = (player_to_dict(self.players[player_id]),
+                    [order_to_dict(o) for o in self.engine.player_orders(player_id)])
+            cached = self._player_cache[player_id] = (version, view)
+        return cached[1]
+
+    def market_depth(self) -> dict:
+        """各物品的指示價格與深度；同一版本只計算一次，所有推播連線共用。"""
+        version = self.notifier.section_version(SECTION_BOOK)
+        if self._depth_cache[0] != version:
+            self._depth_cache = (version, self.engine.orders.market_depth(self.engine.market_prices))
+        return self._depth_cache[1]
+
+    # --- 遊戲流程 ---
+    def register_player(self, name: str) -> Tuple[str, bool]:
+        """回傳 (player_id, 是否為重連)。"""
+        # 🌟 攔截幽靈玩家：如果名字已經存在，直接讓他「登入」原帳號
+        for pid, p in self.players.items():
+            if p.name == name:
+                self.log_event(f"玩家重連: {name} 回到了遊戲", LOG_PLAYER)
+                self.record("register", {"name": name})
+                self.notify(SECTION_LOGS)
+                return pid, True
+
+        # 如果是全新的名字，才創建新帳號
+        new_id = self.engine.new_uuid()
+        init_factory = Factory(id=self.engine.new_id(8), tier=0, name="Miner")
+
+        #測試用
+        test_t2_factory = Factory(id=self.engine.new_id(8), tier=2, name="Factory")
+        cheat_inventory = {k: 50 for k in config.ITEMS.keys()}
+        new_player = PlayerState(
+            id=new_id,
+            name=name,
+            money=1000000, # 🌟 測試用：直接給一百萬初始資金 (原本是 config.INITIAL_MONEY)
+            inventory=cheat_inventory, # 🌟 測試用：載入作弊庫存
+            factories=[init_factory, test_t2_factory], # 🌟 把 T2 工廠加進初始設施列表裡
+            land_limit=config.INITIAL_LAND
+        )
+
+        # new_player = PlayerState(
+        #     id=new_id,
+        #     name=name,
+        #     money=config.INITIAL_MONEY,
+        #     inventory={k: 0 for k in config.ITEMS.keys()},
+        #     factories=[init_factory],
+        #     land_limit=config.INITIAL_LAND
+        # )
+
+        self.players[new_id] = new_player
+        self.engine.mark_dirty(new_player)
+        self.log_event(f"玩家註冊: {name} 加入了遊戲", LOG_PLAYER)
+        self.record("register", {"name": name}, player_ids=[new_id])
+        self.notify(SECTION_PLAYERS, SECTION_LOGS, player_ids=[new_id])
+        return new_id, False
+
+    def advance_phase(self) -> dict:
+        """同步版：直接在現有狀態上切換階段 (無伺服器的模擬、測試使用)。"""
+        phase, turn, messages = run_phase_transition(self.engine, self.players, self.phase, self.turn)
+        return self._publish_phase(self.engine, self.players, phase, turn, messages)
+
+    async def advance_phase_async(self) -> dict:
+        """
+        伺服器版：撮合與回合結算在背景執行緒、對狀態的深拷貝上執行，完成後一次換上新狀態。
+        結算期間讀取端 (輪詢、推播) 照常拿到結算前的狀態；寫入端會先 await wait_settled() 等待。
+        """
+        await self.wait_settled()
+        if self.phase not in (3, 4):
+            return self.advance_phase() # 1→2、2→3 只改階段編號，不值得丟到執行緒
+
+        self._settling = asyncio.Event()
+        try:
+            engine, players, phase, turn, messages = await asyncio.to_thread(self._settle_on_copy)
+            return self._publish_phase(engine, players, phase, turn, messages)
+        finally:
+            self._settling.set()
+            self._settling = None
+
+    async def wait_settled(self):
+        """有結算正在進行時等它完成；之後到下一個 await 之前的修改都會套用在結算後的新狀態上。"""
+        while self._settling is not None:
+            await self._settling.wait()
+
+    def _settle_on_copy(self):
+        # 結算期間所有寫入端都在等待，這裡只有讀取，可以安全地在執行緒中拷貝
+        engine, players = copy.deepcopy((self.engine, self.players), _shared_config_memo())
+        phase, turn, messages = run_phase_transition(engine, players, self.phase, self.turn)
+        return engine, players, phase, turn, messages
+
+    def _publish_phase(self, engine: GameEngine, players: Dict[str, PlayerState],
+                       phase: int, turn: int, messages: List[str]) -> dict:
+        self.engine, self.players, self.phase, self.turn = engine, players, phase, turn
+        engine.mark_all_dirty() # 換上新的玩家物件，名單整份重建
+        for message in messages:
+            self.log_event(message, LOG_SETTLEMENT)
+        self.save_snapshot("next_phase")
+        self.notify(*ALL_SECTIONS, all_players=True)
+        return {"status": "success", "new_phase": self.phase, "turn": self.turn}
+
+    def reset(self, seed: Optional[int] = None):
+        self._init_game(seed)
+        self.events.clear()
+        self.log_event("=== 遊戲已重置 ===")
+        self.save_snapshot("reset", {"seed": self.engine.seed}) # 新的一局從這個種子開始，重播由此起算
+        self.notify(*ALL_SECTIONS, all_players=True)
+
+    def end_game(self) -> List[dict]:
+        # 呼叫 GameEngine 的結算函式
+        ranked_players = self.engine.game_set(self.players)
+
+        # 將遊戲階段設為 5，代表「遊戲結束」
+        self.phase = 5
+
+        # 把格式整理好，讓玩家的 API 可以讀取
+        self.final_ranking = [
+            {"name": name, "scores": data} for name, data in ranked_players
+        ]
+
+        # 把結算結果寫入遊戲日誌，讓大家都能看到
+        self.log_event("=== 🛑 遊戲已由管理員強制結束，進行最終結算 ===")
+        for rank, p_data in enumerate(self.final_ranking, 1):
+            self.log_event(f"🏆 第 {rank} 名: {p_data['name']} | 總資產: ${p_data['scores']['total_score']}")
+        self.save_snapshot("end_game")
+        self.notify(SECTION_PHASE, SECTION_LOGS)
+        return self.final_ranking
+
+    # --- 房間監控 ---
+    def memory_usage(self) -> int:
+        """估算這個房間獨佔的記憶體 (bytes)，不含所有房間共用的 config 資料。"""
+        shared = {id(config.ITEMS), id(config.EVENTS_DB), id(config.GOV_ACQUISITIONS)}
+        shared.update(id(e) for e in config.EVENTS_DB)
+        shared.update(id(e) for e in config.GOV_ACQUISITIONS)
+        return _deep_sizeof((self.engine, self.players, self.events, self.final_ranking), shared)
+
+    def summary(self) -> dict:
+        return {
+            "room_id": self.id,
+            "phase": self.phase,
+            "turn": self.turn,
+            "player_count": len(self.players),
+            "created_at": self.created_at,
+            "memory_bytes": self.memory_usage(),
+        }
+
+def run_phase_transition(engine: GameEngine, players: Dict[str, PlayerState],
+                         phase: int, turn: int) -> Tuple[int, int, List[str]]:
+    """
+    管理員切換階段的遊戲邏輯：直接修改傳入的 engine / players，回傳 (新階段, 新回合, 要寫入日誌的訊息)。
+    不碰房間本身，所以可以在執行緒中對狀態拷貝執行。
+    """
+    start = time.perf_counter()
+    from_phase = phase
+    messages = [f"--- 管理員切換階段: 從 {phase} 結束 ---"]
+
+    if phase == 3:
+        # 🌟 核心修改：接收撮合引擎回傳的交易日誌 (List[str])
+        auction_logs = engine.match_market_orders(players)
+
+        # 如果有日誌，就把每一筆交易結果與失敗原因印到 Admin 廣播日誌上
+        if auction_logs:
+            messages.extend(auction_logs)
+
+        phase = 4
+        messages.append("=== 市場撮合完成，進入第 4 階段：結算階段 ===")
+
+        # 呼叫結算機制 (扣稅、事件懲罰、複利)
+        end_turn_logs = engine.process_end_of_turn(players)
+        if end_turn_logs:
+            messages.extend(end_turn_logs)
+
+    elif phase == 4:
+        for p in players.values():
+            for f in p.factories:
+                # 🌟 新增：如果中了停擺懲罰，這回合就不能生產
+                if getattr(f, "is_shutdown", False):
+                    f.has_produced = True  # 設為 True 代表本回合已耗盡
+                    f.is_shutdown = False  # 解除標記
+                else:
+                    f.has_produced = False
+                f.current_product = None
+        turn += 1
+        phase = 1
+        messages.append(f"=== 第 {turn} 回合 開始 ===")
+
+        new_event, phase1_logs = engine.generate_daily_event(turn)
+        messages.extend(phase1_logs)
+
+    else:
+        phase += 1
+
+    PHASE_SECONDS.observe(time.perf_counter() - start, str(from_phase))
+    return phase, turn, messages
+
+def _shared_config_memo() -> dict:
+    """deepcopy 的 memo：config 中的靜態資料 (事件、物品表) 直接共用，不跟著拷貝。"""
+    memo = {id(config.ITEMS): config.ITEMS, id(config.EVENTS_DB): config.EVENTS_DB,
+            id(config.GOV_ACQUISITIONS): config.GOV_ACQUISITIONS}
+    for entry in config.EVENTS_DB + config.GOV_ACQUISITIONS:
+        memo[id(entry)] = entry
+    return memo
+
+def _find_by_id(entries: List[dict], entry_id: Optional[str]) -> Optional[dict]:
+    return next((e for e in entries if e.get("id") == entry_id), None)
+
+def _deep_sizeof(obj, seen: set) -> int:
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(_deep_sizeof(k, seen) + _deep_sizeof(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(_deep_sizeof(x, seen) for x in obj)
+    elif hasattr(obj, "__dict__"):
+        size += _deep_sizeof(vars(obj), seen)
+    elif hasattr(obj, "__slots__"):
+        size += sum(_deep_sizeof(getattr(obj, name), seen) for name in obj.__slots__ if hasattr(obj, name))
+    return size
+
+class RoomRegistry:
+    """
+    房間登錄表：以房間代碼查找 GameRoom，預設房間 (default) 永遠存在，供舊網址使用。
+    有 journal 時，啟動會從最新快照加上之後的日誌還原所有房間。
+    """
+    def __init__(self, max_rooms: int = 100, journal=None):
+        self.max_rooms = max_rooms
+        self.journal = journal
+        self._rooms: Dict[str, GameRoom] = {}
+        if journal:
+            for room_id, (snapshot, tail) in journal.load().items():
+                room = GameRoom.from_snapshot(room_id, snapshot, journal=journal)
+                for redo in tail:
+                    room.apply_redo(redo)
+                self._rooms[room_id] = room
+        if DEFAULT_ROOM_ID not in self._rooms:
+            self._add(DEFAULT_ROOM_ID)
+
+    def _add(self, room_id: str) -> GameRoom:
+        room = GameRoom(room_id, journal=self.journal)
+        room.log_event(f"=== 房間 {room_id} 已建立 ===")
+        room.save_snapshot("create_room", {"seed": room.engine.seed})
+        self._rooms[room_id] = room
+        return room
+
+    def get(self, room_id: str) -> Optional[GameRoom]:
+        return self._rooms.get(room_id)
+
+    def create(self, room_id: Optional[str] = None) -> GameRoom:
+        room_id = room_id or uuid.uuid4().hex[:8]
+        if not ROOM_ID_PATTERN.match(room_id):
+            raise ValueError("房間代碼只能包含英數字、底線與連字號 (最多 32 字)")
+        if room_id in self._rooms:
+            raise ValueError("房間代碼已存在")
+        if len(self._rooms) >= self.max_rooms:
+            raise ValueError(f"房間數量已達上限 ({self.max_rooms})")
+        return self._add(room_id)
+
+    def remove(self, room_id: str) -> bool:
+        if room_id == DEFAULT_ROOM_ID or room_id not in self._rooms:
+            return False
+        del self._rooms[room_id]
+        if self.journal:
+            self.journal.drop(room_id)
+        return True
+
+    def rooms(self) -> List[GameRoom]:
+        return list(self._rooms.values())
+
+    def __len__(self) -> int:
+        return len(self._rooms)
@@ -0,0 +1,78 @@
+import bisect
+from typing import Dict, List, Optional, Set, Tuple
+from core.models import PlayerState
+from core.serialize import factory_to_dict
+
+class Roster:
+    """
+    玩家名單快取：/api/state 的 all_players 與 /admin/data 的依金額排行。
+    只重建被標記為「髒」的玩家 (引擎各階段修改玩家時會標記)，排行榜以 bisect 增量維護，
+    不必每次請求都走過所有玩家與工廠再重新排序。
+    """
+    def __init__(self):
+        self._public: Dict[str, dict] = {}   # player_id -> all_players 中的一筆
+        self._admin: Dict[str, dict] = {}    # player_id -> 管理員排行中的一筆
+        self._keys: Dict[str, Tuple[int, int, str]] = {}  # player_id -> 排行鍵 (-金額, 加入順序, id)
+        self._board: List[Tuple[int, int, str]] = []      # 依排行鍵排序 (有錢人在前，同額先加入者在前)
+        self._joined: Dict[str, int] = {}
+        self._players: Dict[str, PlayerState] = {}
+        self._public_list: Optional[List[dict]] = None
+        self._admin_list: Optional[List[dict]] = None
+
+    def refresh(self, players: Dict[str, PlayerState], dirty: Optional[Set[str]]):
+        """套用髒標記；dirty 為 None 時整份重建 (重置、切換階段後)。"""
+        if dirty is None:
+            self._public.clear(); self._admin.clear(); self._keys.clear()
+            self._board.clear(); self._joined.clear()
+            dirty = players.keys()
+        elif not dirty and players is self._players:
+            return
+        for pid in dirty:
+            p = players.get(pid)
+            if p is None: self._drop(pid)
+            else: self._update(p)
+        self._public_list = None
+        self._admin_list = None
+        self._players = players
+
+    def _update(self, p: PlayerState):
+        land = f"{len(p.factories)}/{p.land_limit}"
+        self._public[p.id] = {
+            "name": p.name,
+            "money": p.money,
+            "factories": [factory_to_dict(f) for f in p.factories],
+            "land": land
+        }
+        self._admin[p.id] = {
+            "name": p.name,
+            "money": p.money,
+            "land": land,
+            "inventory_count": p.inventory.total()
+        }
+        joined = self._joined.setdefault(p.id, len(self._joined))
+        key = (-p.money, joined, p.id)
+        old = self._keys.get(p.id)
+        if old == key: return
+        if old is not None:
+            del self._board[bisect.bisect_left(self._board, old)]
+        bisect.insort(self._board, key)
+        self._keys[p.id] = key
+
+    def _drop(self, pid: str):
+        self._public.pop(pid, None)
+        self._admin.pop(pid, None)
+        old = self._keys.pop(pid, None)
+        if old is not None:
+            del self._board[bisect.bisect_left(self._board, old)]
+
+    def public(self) -> List[dict]:
+        """all_players：依玩家加入順序。"""
+        if self._public_list is None:
+            self._public_list = [self._public[pid] for pid in self._players if pid in self._public]
+        return self._public_list
+
+    def leaderboard(self) -> List[dict]:
+        """管理員名單：依金額由高到低。"""
+        if self._admin_list is None:
+            self._admin_list = [self._admin[pid] for _, _, pid in self._board]
+        return self._admin_list
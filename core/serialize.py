@@ -0,0 +1,66 @@
+import json
+from typing import Any, Dict, Optional, Tuple
+from core.models import Factory, Order, PlayerState
+
+try:
+    import orjson  # 選用：比標準 json 快數倍
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack  # 選用：客戶端以 Accept: application/msgpack 要求時使用
+except ImportError:
+    msgpack = None
+
+JSON_MEDIA_TYPE = "application/json"
+MSGPACK_MEDIA_TYPES = ("application/msgpack", "application/x-msgpack")
+
+# --- 直接從引擎狀態組出純 dict (欄位與 pydantic 的 model_dump() 相同，但不經過驗證/序列化框架) ---
+def factory_to_dict(f: Factory) -> Dict[str, Any]:
+    return {
+        "id": f.id,
+        "tier": f.tier,
+        "name": f.name,
+        "has_produced": f.has_produced,
+        "is_shutdown": f.is_shutdown,
+        "current_product": f.current_product,
+    }
+
+def player_to_dict(p: PlayerState) -> Dict[str, Any]:
+    return {
+        "id": p.id,
+        "name": p.name,
+        "money": p.money,
+        "inventory": p.inventory.to_dict(),
+        "locked_inventory": p.locked_inventory.to_dict(),
+        "locked_money": p.locked_money,
+        "factories": [factory_to_dict(f) for f in p.factories],
+        "land_limit": p.land_limit,
+    }
+
+def order_to_dict(o: Order) -> Dict[str, Any]:
+    return {
+        "id": o.id,
+        "player_id": o.player_id,
+        "type": o.type,
+        "item_id": o.item_id,
+        "price": o.price,
+        "quantity": o.quantity,
+        "timestamp": o.timestamp,
+    }
+
+# --- 編碼 ---
+def dumps(obj: Any) -> bytes:
+    """緊湊的 UTF-8 JSON；有 orjson 時使用 orjson。"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def wants_msgpack(accept: Optional[str]) -> bool:
+    return msgpack is not None and bool(accept) and any(t in accept for t in MSGPACK_MEDIA_TYPES)
+
+def encode(obj: Any, accept: Optional[str] = None) -> Tuple[bytes, str]:
+    """依 Accept 標頭選擇編碼，回傳 (內容, media type)。預設為 JSON。"""
+    if wants_msgpack(accept):
+        return msgpack.packb(obj, use_bin_type=True), MSGPACK_MEDIA_TYPES[0]
+    return dumps(obj), JSON_MEDIA_TYPE
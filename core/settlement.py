@@ -0,0 +1,178 @@
+import heapq
+from typing import List, Tuple
+
+import config
+from core.models import PlayerState
+
+try:
+    import numpy as np  # 選用：人數多的房間改用 玩家 × 物品 矩陣一次算完
+except ImportError:
+    np = None
+
+NUMPY_MIN_PLAYERS = 200  # 玩家數達到這個數量才轉成矩陣 (小房間建矩陣反而較慢)
+
+ROBIN_HOOD_TOP = 3       # 反壟斷法：現金最多的前幾名
+ROBIN_HOOD_RATE = 0.3
+
+# 回合結算的倉儲稅：超出免稅額的數量 <= 3 / <= 7 / 其餘，整批依同一個單價計稅
+STORAGE_TAX_LOW, STORAGE_TAX_MID, STORAGE_TAX_HIGH = 100, 200, 500
+
+# 事件檢定的結果
+DEFENSE_PAID, DEFENSE_SHIELDED, DEFENSE_HIT = 0, 1, 2
+
+class SettlementBatch:
+    """
+    一次結算中所有玩家的批次資料，每個階段對全部玩家一次套用：
+    - money：現金向量
+    - counts：玩家 × 物品 的庫存矩陣 (依物品序號)，只讀，需要扣庫存的階段直接改玩家的 Inventory
+    - 設施彙總 (免稅額、工廠點數、防災中心) 取自 Factories 隨建造/升級維護的彙總值
+    玩家數達到 NUMPY_MIN_PLAYERS 且有安裝 NumPy 時以陣列運算，否則逐一計算；兩者結果相同。
+    各階段只更新 money，最後由 commit() 寫回玩家。
+    """
+    def __init__(self, players: List[PlayerState]):
+        self.players = players
+        self.initial_money = [p.money for p in players]
+        self.vectorized = np is not None and len(players) >= NUMPY_MIN_PLAYERS
+        if self.vectorized:
+            self.money = np.array(self.initial_money, dtype=np.int64)
+            # Inventory 的底層是 array("q")，直接串起來就是矩陣的記憶體內容
+            buf = b"".join(p.inventory.values() for p in players)
+            self.counts = np.frombuffer(buf, dtype=np.int64).reshape(len(players), config.ITEM_COUNT)
+        else:
+            self.money = list(self.initial_money)
+            self.counts = [p.inventory.values() for p in players]
+
+    def _vector(self, values) -> "np.ndarray":
+        return np.fromiter(values, dtype=np.int64, count=len(self.players))
+
+    # --- 階段 1：反壟斷法 ---
+    def robin_hood_tax(self) -> int:
+        """現金最多的前 3 名 (同額時依加入順序) 繳 30%，平分給其餘玩家；回傳稅金總額。"""
+        n = len(self.players)
+        if self.vectorized:
+            top = np.argsort(-self.money, kind="stable")[:ROBIN_HOOD_TOP].tolist()
+        else:
+            top = heapq.nlargest(ROBIN_HOOD_TOP, range(n), key=self.money.__getitem__)
+        tax_pool = 0
+        for i in top:
+            tax = int(int(self.money[i]) * ROBIN_HOOD_RATE)
+            self.money[i] -= tax
+            tax_pool += tax
+
+        others = n - len(top)
+        if others and tax_pool > 0:
+            share = tax_pool // others
+            if self.vectorized:
+                self.money += share
+                self.money[top] -= share
+            else:
+                taxed = set(top)
+                for i in range(n):
+                    if i not in taxed: self.money[i] += share
+        return tax_pool
+
+    # --- 階段 2：回合結算的倉儲稅 ---
+    def storage_tax(self) -> list:
+        """免稅額 = Factories.storage_capacity；扣款並回傳每位玩家的稅額。"""
+        if self.vectorized:
+            excess = self.counts - self._vector(p.factories.storage_capacity for p in self.players)[:, None]
+            rate = np.where(excess <= 3, STORAGE_TAX_LOW, np.where(excess <= 7, STORAGE_TAX_MID, STORAGE_TAX_HIGH))
+            taxes = (np.maximum(excess, 0) * rate).sum(axis=1)
+            self.money -= taxes
+            return taxes.tolist()
+
+        taxes = []
+        for i, p in enumerate(self.players):
+            capacity = p.factories.storage_capacity
+            tax_total = 0
+            for qty in self.counts[i]:
+                if qty > capacity:
+                    excess = qty - capacity
+                    if excess <= 3: tax_total += excess * STORAGE_TAX_LOW
+                    elif excess <= 7: tax_total += excess * STORAGE_TAX_MID
+                    else: tax_total += excess * STORAGE_TAX_HIGH
+            self.money[i] -= tax_total
+            taxes.append(tax_total)
+        return taxes
+
+    # --- 階段 3：事件檢定 ---
+    def defense_check(self, req_item: str, req_qty: int) -> list:
+        """
+        持有足夠物品者上繳 (直接扣玩家庫存)，否則有防災中心者免疫，其餘命中懲罰。
+        回傳每位玩家的結果 (DEFENSE_PAID / DEFENSE_SHIELDED / DEFENSE_HIT)。
+        """
+        col = config.ITEM_INDEX[req_item]
+        if self.vectorized:
+            outcome = np.where(self.counts[:, col] >= req_qty, DEFENSE_PAID, DEFENSE_HIT)
+            unpaid = np.flatnonzero(outcome == DEFENSE_HIT)  # 只有沒上繳的玩家需要查防災中心
+            shielded = np.fromiter((self.players[i].factories.has_defense for i in unpaid.tolist()), dtype=bool, count=len(unpaid))
+            outcome[unpaid[shielded]] = DEFENSE_SHIELDED
+            outcome = outcome.tolist()
+        else:
+            outcome = [
+                DEFENSE_PAID if self.counts[i][col] >= req_qty else DEFENSE_SHIELDED if p.factories.has_defense else DEFENSE_HIT
+                for i, p in enumerate(self.players)
+            ]
+        for p, result in zip(self.players, outcome):
+            if result == DEFENSE_PAID: p.inventory[req_item] -= req_qty
+        return outcome
+
+    # --- 階段 4：懲罰 (現金的部分；設施停擺/摧毀由引擎逐一處理) ---
+    def halve_cash(self, hit: list) -> list:
+        """命中的玩家現金減半 (無條件捨去至整數)；回傳每位玩家的損失。"""
+        if self.vectorized:
+            mask = np.array(hit, dtype=bool)
+            half = (self.money * 0.5).astype(np.int64) # 與 int() 相同，往 0 捨去
+            lost = np.where(mask, self.money - half, 0)
+            self.money = np.where(mask, half, self.money)
+            return lost.tolist()
+
+        lost = []
+        for i, is_hit in enumerate(hit):
+            if not is_hit:
+                lost.append(0)
+                continue
+            half = int(self.money[i] * 0.5)
+            lost.append(self.money[i] - half)
+            self.money[i] = half
+        return lost
+
+    # --- 撮合後的庫存盤點 ---
+    def storage_penalty(self) -> Tuple[list, list]:
+        """
+        上限 = BASE_STORAGE_LIMIT + Factories.cp_total，超出的部分分段累進計罰 (前 3 個、再 4 個、其餘)。
+        逐項扣款時一旦付不出來就歸零，之後的罰款也只會讓現金停在 0，
+        所以等同：有罰款且現金 < 罰款總額 → 歸零，否則扣除總額。回傳 (每位玩家的罰款總額, 是否觸發破產保護)。
+        """
+        if self.vectorized:
+            limits = self._vector(config.BASE_STORAGE_LIMIT + p.factories.cp_total for p in self.players)
+            excess = np.maximum(self.counts - limits[:, None], 0)
+            fines = (np.minimum(excess, 3) * config.PENALTY_LOW
+                     + np.clip(excess - 3, 0, 4) * config.PENALTY_MID
+                     + np.maximum(excess - 7, 0) * config.PENALTY_HIGH).sum(axis=1)
+            bankrupt = (excess > 0).any(axis=1) & (self.money < fines)
+            self.money = np.where(bankrupt, 0, self.money - fines)
+            return fines.tolist(), bankrupt.tolist()
+
+        fines, bankrupt = [], []
+        for i, p in enumerate(self.players):
+            limit = config.BASE_STORAGE_LIMIT + p.factories.cp_total
+            total, fined = 0, False
+            for qty in self.counts[i]:
+                if qty > limit:
+                    excess = qty - limit
+                    fined = True
+                    total += min(excess, 3) * config.PENALTY_LOW
+                    if excess > 3: total += min(excess - 3, 4) * config.PENALTY_MID
+                    if excess > 7: total += (excess - 7) * config.PENALTY_HIGH
+            broke = fined and self.money[i] < total
+            self.money[i] = 0 if broke else self.money[i] - total
+            fines.append(total)
+            bankrupt.append(broke)
+        return fines, bankrupt
+
+    def commit(self):
+        """把現金寫回玩家 (只寫有變動的，PlayerState 的屬性賦值比讀取貴得多)。"""
+        money = self.money.tolist() if self.vectorized else self.money
+        for p, before, after in zip(self.players, self.initial_money, money):
+            if after != before: p.money = after
@@ -0,0 +1,202 @@
+import json
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+class StateManager:
+    """
+    遊戲狀態持久化：SQLite (WAL 模式) 的「快照 + 操作日誌」。
+    - 每個修改狀態的操作 (生產、建造、掛單...) 追加一筆日誌，內含受影響玩家的最新狀態 (redo 記錄)。
+    - 切換階段、重置、結算或累積一定筆數後寫入整份快照，並刪除該房間快照之前的舊日誌。
+    - 所有寫入都交給背景執行緒批次提交 (每次 commit 都會 fsync)，不阻塞 API 請求。
+    - 另外把每個操作的指令 (不含 redo) 永久保存在 commands 表，不隨快照刪除，
+      搭配引擎的種子可以從頭重播整場遊戲 (core/replay.py)。
+    - 從記憶體日誌 (core/event_log.py) 擠出去的舊紀錄存進 event_logs 表，可用游標往回查詢。
+    啟動時讀取每個房間最新的快照，再依序套用之後的日誌即可還原遊戲。
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._queue: "queue.Queue[Tuple]" = queue.Queue()
+        conn = self._connect()
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS actions (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                room_id TEXT NOT NULL,
+                action TEXT NOT NULL,
+                payload TEXT,
+                redo TEXT,
+                created_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_actions_room ON actions (room_id, seq);
+            CREATE TABLE IF NOT EXISTS commands (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                room_id TEXT NOT NULL,
+                action TEXT NOT NULL,
+                payload TEXT,
+                created_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_commands_room ON commands (room_id, seq);
+            CREATE TABLE IF NOT EXISTS event_logs (
+                room_id TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                ts REAL,
+                kind TEXT NOT NULL,
+                player_id TEXT,
+                message TEXT NOT NULL,
+                PRIMARY KEY (room_id, seq)
+            );
+            CREATE TABLE IF NOT EXISTS snapshots (
+                room_id TEXT PRIMARY KEY,
+                seq INTEGER NOT NULL,
+                data TEXT NOT NULL,
+                created_at REAL NOT NULL
+            );
+        """)
+        conn.close()
+        self._writer = threading.Thread(target=self._run, name="state-writer", daemon=True)
+        self._writer.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=FULL")
+        return conn
+
+    # --- 寫入 (只放進佇列，由背景執行緒處理) ---
+    def append(self, room_id: str, action: str, payload: Any, redo: Optional[dict]):
+        self._queue.put(("append", room_id, action, payload, redo, time.time()))
+
+    def snapshot(self, room_id: str, data: dict):
+        self._queue.put(("snapshot", room_id, data, time.time()))
+
+    def archive_logs(self, room_id: str, entries: List[dict]):
+        self._queue.put(("archive", room_id, entries))
+
+    def drop(self, room_id: str):
+        self._queue.put(("drop", room_id))
+
+    def flush(self):
+        """等待目前佇列中的所有寫入完成落盤。"""
+        self._queue.join()
+
+    def close(self):
+        self._queue.put(("stop",))
+        self._writer.join()
+
+    def _run(self):
+        conn = self._connect()
+        running = True
+        while running:
+            # 阻塞等待第一筆，再把佇列中累積的全部取出，一次交易提交 (group commit)
+            batch = [self._queue.get()]
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                with conn:
+                    for op in batch:
+                        if op[0] == "stop":
+                            running = False
+                        else:
+                            self._write(conn, op)
+            except Exception: # 任何錯誤都不能讓寫入執行緒結束 (之後的 flush 會永遠等不到)
+                logger.exception("寫入失敗，本批 %s 筆未保存", len(batch))
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+        conn.close()
+
+    def _write(self, conn: sqlite3.Connection, op: Tuple):
+        kind = op[0]
+        if kind == "append":
+            _, room_id, action, payload, redo, created_at = op
+            conn.execute(
+                "INSERT INTO actions (room_id, action, payload, redo, created_at) VALUES (?, ?, ?, ?, ?)",
+                (room_id, action, _dumps(payload), _dumps(redo), created_at)
+            )
+            conn.execute(
+                "INSERT INTO commands (room_id, action, payload, created_at) VALUES (?, ?, ?, ?)",
+                (room_id, action, _dumps(payload), created_at)
+            )
+        elif kind == "snapshot":
+            _, room_id, data, created_at = op
+            # 佇列依操作順序處理，目前最大的 seq 之前的日誌都已包含在這份快照裡
+            seq = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM actions").fetchone()[0]
+            conn.execute(
+                "INSERT OR REPLACE INTO snapshots (room_id, seq, data, created_at) VALUES (?, ?, ?, ?)",
+                (room_id, seq, _dumps(data), created_at)
+            )
+            conn.execute("DELETE FROM actions WHERE room_id = ? AND seq <= ?", (room_id, seq))
+        elif kind == "archive":
+            _, room_id, entries = op
+            # 重啟套用日誌時同一筆紀錄可能再被擠出一次，以 (房間, 序號) 去重
+            conn.executemany(
+                "INSERT OR IGNORE INTO event_logs (room_id, seq, ts, kind, player_id, message) VALUES (?, ?, ?, ?, ?, ?)",
+                [(room_id, e["seq"], e["ts"], e["kind"], e.get("player_id"), e["message"]) for e in entries]
+            )
+        elif kind == "drop":
+            conn.execute("DELETE FROM actions WHERE room_id = ?", (op[1],))
+            conn.execute("DELETE FROM event_logs WHERE room_id = ?", (op[1],))
+            conn.execute("DELETE FROM commands WHERE room_id = ?", (op[1],))
+            conn.execute("DELETE FROM snapshots WHERE room_id = ?", (op[1],))
+
+    # --- 讀取 (啟動時還原) ---
+    def load(self) -> Dict[str, Tuple[dict, List[dict]]]:
+        """回傳 {room_id: (最新快照, 快照之後依序的 redo 記錄)}。"""
+        conn = self._connect()
+        try:
+            rooms = {}
+            for room_id, seq, data in conn.execute("SELECT room_id, seq, data FROM snapshots"):
+                tail = [
+                    json.loads(redo) for (redo,) in conn.execute(
+                        "SELECT redo FROM actions WHERE room_id = ? AND seq > ? AND redo IS NOT NULL ORDER BY seq",
+                        (room_id, seq)
+                    )
+                ]
+                rooms[room_id] = (json.loads(data), tail)
+            return rooms
+        finally:
+            conn.close()
+
+    def load_commands(self, room_id: str) -> List[Tuple[str, Any]]:
+        """這個房間從建立以來依序的 (指令, 參數)。"""
+        conn = self._connect()
+        try:
+            return [
+                (action, json.loads(payload) if payload is not None else None)
+                for action, payload in conn.execute(
+                    "SELECT action, payload FROM commands WHERE room_id = ? ORDER BY seq", (room_id,)
+                )
+            ]
+        finally:
+            conn.close()
+
+    def load_logs(self, room_id: str, after: int, limit: int) -> List[dict]:
+        """存檔中序號大於 after 的舊日誌 (由舊到新，最多 limit 筆)。"""
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                "SELECT seq, ts, kind, player_id, message FROM event_logs WHERE room_id = ? AND seq > ? ORDER BY seq LIMIT ?",
+                (room_id, after, limit)
+            )
+            return [_log_entry(*row) for row in rows]
+        finally:
+            conn.close()
+
+def _log_entry(seq: int, ts: Optional[float], kind: str, player_id: Optional[str], message: str) -> dict:
+    entry = {"seq": seq, "ts": ts, "kind": kind, "message": message}
+    if player_id is not None:
+        entry["player_id"] = player_id
+    return entry
+
+def _dumps(obj: Any) -> Optional[str]:
+    if obj is None:
+        return None
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
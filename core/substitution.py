@@ -0,0 +1,81 @@
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+import config
+
+# --- 萬能工廠的同階級替代 ---
+# 原料不足時，萬能工廠可以用同階級的其他物品補足。整份配方一次算好：
+# 每種原料先用自己的庫存，剩下的缺口依階級合併，再依玩家指定的順序從該階級的剩餘庫存扣除，
+# 同一個物品不會同時被兩種原料的缺口重複計算。
+# 與舊版的差異：舊版每種原料各自檢查「同階級的其他物品總量」是否補得了自己的缺口，
+# 兩種原料可能把同一個替代品各算一次 (例如晶圓、鋼樑都缺 1，只有 1 個燃料也算夠)，扣料時再默默少扣。
+# 這類配方現在會被拒絕；舊版扣料正確的情況，預設順序的扣料與舊版相同 (tests/test_substitution.py)。
+
+PREFER_DEFAULT = "default"    # 依物品序號 (data.json 的順序)
+PREFER_CHEAPEST = "cheapest"  # 市價最低的先用
+PREFER_PRICIEST = "priciest"  # 市價最高的先用 (留下便宜的)
+PREFERENCES = (PREFER_DEFAULT, PREFER_CHEAPEST, PREFER_PRICIEST)
+
+# 替代順序：上面的名稱，或物品代碼的列表 (列出的先用，其餘依序號排在後面)；None 等同 default
+Preference = Union[None, str, Sequence[str]]
+
+def check_preference(preference: Preference) -> Optional[str]:
+    """檢查玩家傳入的替代順序，有問題時回傳錯誤訊息。"""
+    if preference is None or preference in PREFERENCES:
+        return None
+    if isinstance(preference, str):
+        return f"未知的替代順序: {preference} (可用 {', '.join(PREFERENCES)} 或物品代碼列表)"
+    unknown = [item_id for item_id in preference if item_id not in config.ITEM_INDEX]
+    if unknown:
+        return f"替代順序中有未知的物品: {', '.join(map(str, unknown))}"
+    return None
+
+def substitution_order(preference: Preference, prices: Sequence[int] = ()) -> Callable[[int], Tuple[int, ...]]:
+    """
+    回傳 階級 -> 該階級物品序號 (依替代的優先順序) 的函式；同一次生產只對實際缺料的階級排序。
+    prices 為依物品序號排列的市價 (core.inventory.price_vector)，只有依價格排序時才用到。
+    """
+    if preference is None or preference == PREFER_DEFAULT:
+        return lambda tier: config.TIER_INDEXES[tier]
+    if preference in (PREFER_CHEAPEST, PREFER_PRICIEST):
+        sign = 1 if preference == PREFER_CHEAPEST else -1
+        # 價格相同時依序號，結果固定，重播時扣除同樣的物品
+        return lambda tier: tuple(sorted(config.TIER_INDEXES[tier], key=lambda i: sign * prices[i]))
+    ranked = [config.ITEM_INDEX[item_id] for item_id in preference]
+    return lambda tier: tuple(dict.fromkeys([i for i in ranked if config.ITEM_TIERS[i] == tier] + list(config.TIER_INDEXES[tier])))
+
+def allocate_ingredients(counts: Sequence[int], recipe, batches: int,
+                         order: Optional[Callable[[int], Sequence[int]]] = None) -> Tuple[Dict[int, int], Optional[int]]:
+    """
+    計算生產 batches 批所需的確切扣料，不修改 counts。
+    recipe 為 config.RECIPES 的 ((原料序號, 數量), ...)；order 為 None 時不允許替代 (一般工廠)。
+    回傳 (物品序號 -> 扣除數量, 無法補足的原料序號)；第二項為 None 代表可以生產。
+    """
+    if order is None: # 不允許替代：照配方扣，第一個不夠的原料就是缺料
+        for ing, qty in recipe:
+            if counts[ing] < qty * batches:
+                return {}, ing
+        return {ing: qty * batches for ing, qty in recipe}, None
+
+    take: Dict[int, int] = {}
+    shortages: Dict[int, List[int]] = {}  # 階級 -> [缺口總量, 第一個缺料的原料]
+    for ing, qty in recipe: # 配方中的原料不重複
+        need = qty * batches
+        have = counts[ing]
+        if have >= need:
+            take[ing] = need
+            continue
+        if have > 0: take[ing] = have
+        shortage = shortages.setdefault(config.ITEM_TIERS[ing], [0, ing])
+        shortage[0] += need - max(have, 0)
+
+    for tier, (missing, first_ing) in shortages.items():
+        for sub in order(tier):
+            free = counts[sub] - take.get(sub, 0)
+            if free <= 0: continue
+            used = min(free, missing)
+            take[sub] = take.get(sub, 0) + used
+            missing -= used
+            if not missing: break
+        if missing:
+            return take, first_ing
+    return take, None
@@ -1,343 +1,489 @@
-import uuid
-from datetime import datetime
-from typing import Dict, List, Optional
-from fastapi import FastAPI, Request, HTTPException, Body
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Annotated, Callable, List, Literal, Optional, Union
+from fastapi import FastAPI, APIRouter, Depends, Request, HTTPException, Body
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from fastapi.responses import JSONResponse
-from pydantic import BaseModel
+from fastapi.responses import Response, StreamingResponse
+from pydantic import BaseModel, Field
 
 import config
-from core.models import PlayerState, Order, Factory
-from core.engine import GameEngine
-
-app = FastAPI()
+from core.models import Order
+from core.planner import plan_production
+from core.room import GameRoom, RoomRegistry, DEFAULT_ROOM_ID
+from core.broadcast import SECTION_PLAYERS, SECTION_LOGS, SECTION_BOOK
+from core.event_log import LOG_ACTION
+from core.state_manager import StateManager
+from core.serialize import dumps, encode, wants_msgpack
+from core.metrics import REGISTRY, CONTENT_TYPE, Gauge, MetricsMiddleware, monitor_loop_lag
+
+# --- 持久化 ---
+# 設定 GAME_STATE_DB="" 可關閉存檔 (純記憶體模式)
+state_manager = StateManager(config.STATE_DB_PATH) if config.STATE_DB_PATH else None
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    lag_monitor = asyncio.create_task(monitor_loop_lag())
+    yield
+    lag_monitor.cancel()
+    if state_manager:
+        state_manager.flush()  # 關機前把佇列中的日誌全部寫入
+        state_manager.close()
+
+ROOM_PREFIX = "/rooms/{room_id}"
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(MetricsMiddleware, route_prefix=ROOM_PREFIX)
 app.mount("/static", StaticFiles(directory="static"), name="static")
 templates = Jinja2Templates(directory="templates")
 
 # --- 全域變數 ---
-engine = GameEngine()
-engine.generate_daily_event(1)
-players: Dict[str, PlayerState] = {}
-current_phase = 1
-current_turn = 1
-game_logs: List[str] = []  # 儲存遊戲日誌
-final_ranking_data: List[dict] = []  # 新增：儲存最終結算成績
-
-# --- 日誌輔助函式 ---
-def log_event(message: str):
-    time_str = datetime.now().strftime("%H:%M:%S")
-    log_entry = f"[{time_str}] {message}"
-    game_logs.insert(0, log_entry) # 最新訊息插在最前面
-    if len(game_logs) > 100: # 只保留最近 100 筆
-        game_logs.pop()
+# 每個房間 (GameRoom) 各自擁有引擎、玩家、階段與日誌；舊網址 (/api/...) 對應預設房間
+# 啟動時會從存檔還原上次的所有房間
+rooms = RoomRegistry(journal=state_manager)
+router = APIRouter()
+
+STREAM_KEEPALIVE_SECONDS = 15
+
+def get_room(room_id: str = DEFAULT_ROOM_ID) -> GameRoom:
+    # 掛在 /rooms/{room_id} 底下時 room_id 來自路徑，舊網址則使用預設房間
+    room = rooms.get(room_id)
+    if not room: raise HTTPException(404, "找不到該房間")
+    return room
+
+def room_base_path(request: Request, room: GameRoom) -> str:
+    return f"/rooms/{room.id}" if request.url.path.startswith("/rooms/") else ""
 
 # --- API Models ---
 class RegisterModel(BaseModel): name: str
 class TradeModel(BaseModel): player_id: str; type: str; item_id: str; price: int; quantity: int
-class ProduceModel(BaseModel): player_id: str; factory_id: str; target_item: str; quantity: int = 1
-class BuildModel(BaseModel): player_id: str; target_tier: int = 1; payment_materials: List[str] = [] 
+# substitutes：萬能工廠的替代順序，"default" / "cheapest" / "priciest" 或物品代碼列表 (見 core.substitution)
+class ProduceModel(BaseModel): player_id: str; factory_id: str; target_item: str; quantity: int = 1; substitutes: Optional[Union[str, List[str]]] = None
+class BuildModel(BaseModel): player_id: str; target_tier: int = 1; payment_materials: List[str] = []
 class UpgradeModel(BaseModel): player_id: str; factory_id: str; payment_materials: List[str] = []
 class BankSellModel(BaseModel): player_id: str; item_id: str; quantity: int
 class DemolishModel(BaseModel): player_id: str; factory_id: str
 class BuildSpecialModel(BaseModel): player_id: str; building_type: str; payment_materials: List[str] = []
+class AmendOrderModel(BaseModel): player_id: str; price: int; quantity: Optional[int] = None
+class CreateRoomModel(BaseModel): room_id: Optional[str] = None
+
+# 批次行動：每個指令的欄位與對應的單一端點相同 (不含 player_id)，以 action 區分
+class BatchProduce(BaseModel): action: Literal["produce"]; factory_id: str; target_item: str; quantity: int = 1; substitutes: Optional[Union[str, List[str]]] = None
+class BatchBuild(BaseModel): action: Literal["build"]; target_tier: int = 1; payment_materials: List[str] = []
+class BatchBuildSpecial(BaseModel): action: Literal["build_special"]; building_type: str; payment_materials: List[str] = []
+class BatchUpgrade(BaseModel): action: Literal["upgrade"]; factory_id: str; payment_materials: List[str] = []
+class BatchDemolish(BaseModel): action: Literal["demolish"]; factory_id: str
+class BatchBankSell(BaseModel): action: Literal["bank_sell"]; item_id: str; quantity: int
+BatchCommand = Annotated[Union[BatchProduce, BatchBuild, BatchBuildSpecial, BatchUpgrade, BatchDemolish, BatchBankSell],
+                         Field(discriminator="action")]
+class BatchActionModel(BaseModel): player_id: str; actions: List[BatchCommand]; atomic: bool = False
+
+MAX_BATCH_ACTIONS = 50
+# 日誌中各指令的動詞，與單一端點寫入的日誌相同
+ACTION_LOG_VERBS = {"produce": "生產", "build": "建造", "build_special": "執行特殊建設",
+                    "upgrade": "升級", "demolish": "拆除", "bank_sell": "銀行交易"}
+
+@router.get("/")
+async def get_player_ui(request: Request, room: GameRoom = Depends(get_room)):
+    return templates.TemplateResponse(request, "player_ui.html", {"api_base": room_base_path(request, room)})
+
+@router.get("/admin")
+async def get_admin_dashboard(request: Request, room: GameRoom = Depends(get_room)):
+    return templates.TemplateResponse(request, "admin_dashboard.html", {"api_base": room_base_path(request, room)})
+
+# --- 回應輔助函式 (輪詢與推播共用) ---
+def sse_response(request: Request, room: GameRoom, build: Callable[[Optional[int]], Optional[dict]]) -> StreamingResponse:
+    """
+    Server-Sent Events 推播：第一筆送完整快照，之後只在版本號變動時送出有變動的區塊。
+    閒置時每 STREAM_KEEPALIVE_SECONDS 秒送一次註解行維持連線。
+    """
+    notifier = room.notifier
+
+    async def event_source():
+        sent_version = None
+        while not await request.is_disconnected():
+            seen_version = notifier.version
+            payload = build(sent_version)
+            if payload is not None:
+                yield b"data: " + dumps(payload) + b"\n\n"
+            sent_version = seen_version
+            if not await notifier.wait_for_change(seen_version, STREAM_KEEPALIVE_SECONDS):
+                yield ": keep-alive\n\n"
+
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
-@app.get("/")
-async def get_player_ui(request: Request):
-    return templates.TemplateResponse("player_ui.html", {"request": request})
-
-@app.get("/admin")
-async def get_admin_dashboard(request: Request):
-    return templates.TemplateResponse("admin_dashboard.html", {"request": request})
-
-# --- Admin 專用資料接口 ---
-@app.get("/admin/data")
-async def get_admin_data():
-    player_list = []
-    for p in players.values():
-        player_list.append({
-            "name": p.name,
-            "money": p.money,
-            "land": f"{len(p.factories)}/{p.land_limit}",
-            "inventory_count": sum(p.inventory.values())
-        })
-    # 根據金額排序 (有錢人排前面)
-    player_list.sort(key=lambda x: x["money"], reverse=True)
-    
+def etag_response(request: Request, etag: str, build: Callable[[], Optional[dict]]) -> Response:
+    """
+    If-None-Match 命中或內容沒有變動時回 304，否則回傳內容並附上 ETag。
+    預設為 JSON；客戶端帶 Accept: application/msgpack 時改回傳 MessagePack。
+    """
+    accept = request.headers.get("accept")
+    if wants_msgpack(accept):
+        etag = etag[:-1] + '-msgpack"' # 不同編碼要有不同的 ETag
+    headers = {"ETag": etag, "Cache-Control": "no-cache", "Vary": "Accept"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    content = build()
+    if content is None:
+        return Response(status_code=304, headers=headers)
+    body, media_type = encode(content, accept)
+    return Response(body, media_type=media_type, headers=headers)
+
+# --- 房間管理 (全域) ---
+@app.get("/admin/rooms")
+async def list_rooms():
+    return {"rooms": [r.summary() for r in rooms.rooms()]}
+
+@app.post("/admin/rooms")
+async def create_room(data: CreateRoomModel = Body(default=CreateRoomModel())):
+    try:
+        room = rooms.create(data.room_id)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
     return {
-        "phase": current_phase,
-        "turn": current_turn,
-        "players": player_list,
-        "logs": game_logs,
-        "items_meta": config.ITEMS,
-        "market_prices": engine.market_prices
+        "status": "success",
+        "room_id": room.id,
+        "player_url": f"/rooms/{room.id}/",
+        "admin_url": f"/rooms/{room.id}/admin"
     }
 
-@app.post("/api/register")
-async def register_player(data: RegisterModel):
-    # 🌟 攔截幽靈玩家：如果名字已經存在，直接讓他「登入」原帳號
-    for pid, p in players.items():
-        if p.name == data.name:
-            log_event(f"玩家重連: {data.name} 回到了遊戲")
-            return {"status": "success", "player_id": pid, "name": data.name}
-
-    # 如果是全新的名字，才創建新帳號
-    new_id = str(uuid.uuid4())
-    init_factory = Factory(id=str(uuid.uuid4())[:8], tier=0, name="Miner")
-
-    #測試用
-    test_t2_factory = Factory(id=str(uuid.uuid4())[:8], tier=2, name="Factory")
-    cheat_inventory = {k: 50 for k in config.ITEMS.keys()}
-    new_player = PlayerState(
-        id=new_id,
-        name=data.name,
-        money=1000000, # 🌟 測試用：直接給一百萬初始資金 (原本是 config.INITIAL_MONEY)
-        inventory=cheat_inventory, # 🌟 測試用：載入作弊庫存
-        factories=[init_factory, test_t2_factory], # 🌟 把 T2 工廠加進初始設施列表裡
-        land_limit=config.INITIAL_LAND
-    )
+@app.delete("/admin/rooms/{room_id}")
+async def delete_room(room_id: str):
+    if not rooms.remove(room_id): raise HTTPException(400, "找不到該房間，或預設房間無法刪除")
+    return {"status": "success"}
+
+# --- 監控指標 (Prometheus 文字格式) ---
+# 房間狀態類的數值只在被抓取時才計算，平常不需要維護
+REGISTRY.register(Gauge("game_rooms", "目前的房間數", collect=lambda: [((), len(rooms.rooms()))]))
+REGISTRY.register(Gauge("game_players", "各房間玩家數", ("room",),
+                        collect=lambda: [((r.id,), len(r.players)) for r in rooms.rooms()]))
+REGISTRY.register(Gauge("game_resting_orders", "各房間掛單中的訂單數 (含政府收購標單)", ("room",),
+                        collect=lambda: [((r.id,), len(r.engine.orders) + len(r.engine.gov_orders)) for r in rooms.rooms()]))
+REGISTRY.register(Gauge("game_locked_money", "各房間掛單鎖定中的資金總額", ("room",),
+                        collect=lambda: [((r.id,), sum(p.locked_money for p in r.players.values())) for r in rooms.rooms()]))
+
+@app.get("/metrics")
+async def metrics():
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+@app.get("/api/catalog")
+async def get_catalog(request: Request):
+    # 內容只隨 data.json 改變；客戶端以 ?v=catalog_hash 取用，可永久快取
+    headers = {"ETag": f'"{config.CATALOG_HASH}"', "Cache-Control": "public, max-age=31536000, immutable"}
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=304, headers=headers)
+    return Response(config.CATALOG_JSON, media_type="application/json", headers=headers)
+
+# --- Admin 專用資料接口 ---
+@router.get("/admin/data")
+async def get_admin_data(request: Request, log_cursor: Optional[int] = None, room: GameRoom = Depends(get_room)):
+    # 帶上次收到的 log_cursor 時只回傳之後新增的日誌
+    return etag_response(request, room.notifier.etag(room.notifier.version), lambda: room.build_admin_data(log_cursor))
+
+@router.get("/admin/stream")
+async def stream_admin_data(request: Request, room: GameRoom = Depends(get_room)):
+    log_cursor = None # 每條推播連線各自記住送到哪一筆日誌
+
+    def build(since: Optional[int]) -> Optional[dict]:
+        nonlocal log_cursor
+        if since == room.notifier.version: return None
+        data = room.build_admin_data(log_cursor)
+        log_cursor = data["log_cursor"]
+        return data
+
+    return sse_response(request, room, build)
+
+@router.get("/admin/logs")
+async def get_admin_logs(after: int = 0, limit: int = 500, room: GameRoom = Depends(get_room)):
+    # 查詢歷史日誌：已擠出記憶體的部分從存檔讀取，之後接上記憶體中的紀錄
+    limit = max(1, min(limit, 5000))
+    entries = []
+    if after < room.events.base and room.journal:
+        entries = await asyncio.to_thread(room.journal.load_logs, room.id, after, limit)
+        if entries: after = entries[-1]["seq"]
+    if len(entries) < limit:
+        _, recent = room.events.since(max(after, room.events.base))
+        entries += recent[:limit - len(entries)]
+    cursor = entries[-1]["seq"] if entries else after
+    return {"entries": entries, "cursor": cursor, "more": cursor < room.events.seq}
+
+@router.get("/api/logs")
+async def get_player_logs(player_id: str, after: Optional[int] = None, room: GameRoom = Depends(get_room)):
+    # 公開日誌加上自己的操作紀錄；logs_reset 為 True 時客戶端應先清掉舊日誌
+    logs_reset, entries = room.events.since(after, viewer=player_id)
+    return {"logs": entries, "logs_reset": logs_reset, "log_cursor": room.events.seq}
+
+@router.post("/api/register")
+async def register_player(data: RegisterModel, room: GameRoom = Depends(get_room)):
+    await room.wait_settled() # 背景結算進行中時先等待，避免修改到即將被換掉的舊狀態
+    player_id, _ = room.register_player(data.name)
+    return {"status": "success", "player_id": player_id, "name": data.name}
+
+@router.get("/api/state")
+async def get_state(request: Request, player_id: Optional[str] = None, since: Optional[str] = None,
+                    items_meta: bool = True, room: GameRoom = Depends(get_room)):
+    # 舊客戶端預設仍會拿到 items_meta；新版 game.js 帶 items_meta=false 並改用 /api/catalog
+    # since 是上次回應的 version (epoch.版本號)；伺服器重啟過或游標無效時改送完整快照
+    notifier = room.notifier
+    etag = notifier.etag(notifier.view_version(player_id))
+    since_version = notifier.parse_cursor(since)
+    return etag_response(request, etag, lambda: room.build_state(player_id, since_version, items_meta and since_version is None))
+
+@router.get("/api/stream")
+async def stream_state(request: Request, player_id: Optional[str] = None, room: GameRoom = Depends(get_room)):
+    # 推播版的 /api/state；舊客戶端仍可繼續輪詢 /api/state
+    return sse_response(request, room, lambda since: room.build_state(player_id, since))
+
+@router.get("/api/market/depth")
+async def get_market_depth(request: Request, room: GameRoom = Depends(get_room)):
+    # 交易階段的指示結算價與深度；只在訂單簿變動時重新計算，其餘一律 304
+    etag = room.notifier.etag(room.notifier.section_version(SECTION_BOOK))
+    return etag_response(request, etag, lambda: {"phase": room.phase, "items": room.market_depth()})
+
+@router.get("/api/plan")
+async def get_production_plan(player_id: str, room: GameRoom = Depends(get_room)):
+    # 依目前庫存、設施與市價建議的生產計畫；plan 的每一步都可以直接當作 /api/actions/batch 的指令送出
+    # exact 為 False 時是啟發式的結果 (見 core.planner)，不保證最佳
+    if player_id not in room.players: raise HTTPException(404, "Player not found")
+    inputs = room.engine.plan_inputs(room.players[player_id]) # 快照在事件迴圈上取
+    plan = await asyncio.to_thread(plan_production, *inputs) # 搜尋可能要數十毫秒，不佔住其他房間的請求與推播
+    return {"phase": room.phase, **plan}
+
+@router.post("/api/produce")
+async def produce_item(data: ProduceModel, room: GameRoom = Depends(get_room)):
+    await room.wait_settled()
+    if room.phase != 2: raise HTTPException(400, "非行動階段")
+    if data.player_id not in room.players: raise HTTPException(404, "Player not found")
+
+    p = room.players[data.player_id]
+    success, msg = room.engine.process_production(p, data.factory_id, data.target_item, data.quantity, data.substitutes)
 
-    # new_player = PlayerState(
-    #     id=new_id,
-    #     name=data.name,
-    #     money=config.INITIAL_MONEY,
-    #     inventory={k: 0 for k in config.ITEMS.keys()},
-    #     factories=[init_factory],
-    #     land_limit=config.INITIAL_LAND
-    # )
-    
-    players[new_id] = new_player
-    log_event(f"玩家註冊: {data.name} 加入了遊戲")
-    return {"status": "success", "player_id": new_id, "name": data.name}
-
-@app.get("/api/state")
-async def get_state(player_id: Optional[str] = None):
-    response = {
-        "turn": current_turn,
-        "phase": current_phase,
-        "event": engine.current_event,
-        "gov_event": engine.active_gov_event,
-        "market_prices": engine.market_prices,
-        "items_meta": config.ITEMS,
-        "all_players": [
-            {
-                "name": p.name, 
-                "money": p.money, 
-                "factories": [f.dict() for f in p.factories],
-                "land": f"{len(p.factories)}/{p.land_limit}"
-            } for p in players.values()
-        ]
-    }
-    if player_id and player_id in players:
-        p = players[player_id]
-        response["player"] = p.dict()
-        
-    # 新增：如果遊戲結束(Phase 5)，把最終排名傳給前端
-    if current_phase == 5:
-        response["final_ranking"] = final_ranking_data
-
-    return response
-
-@app.post("/api/produce")
-async def produce_item(data: ProduceModel):
-    if current_phase != 2: raise HTTPException(400, "非行動階段")
-    if data.player_id not in players: raise HTTPException(404, "Player not found")
-    
-    p = players[data.player_id]
-    success, msg = engine.process_production(p, data.factory_id, data.target_item, data.quantity)
-    
     if not success: raise HTTPException(400, msg)
-    log_event(f"{p.name} 生產: {msg}")
+    room.log_event(f"{p.name} 生產: {msg}", LOG_ACTION, p.id)
+    room.record("produce", data.model_dump(), player_ids=[p.id])
+    room.notify(SECTION_PLAYERS, SECTION_LOGS, player_ids=[p.id])
     return {"status": "success", "message": msg}
 
-@app.post("/api/build")
-async def build_factory(data: BuildModel):
-    if current_phase != 2: raise HTTPException(400, "非行動階段")
-    if data.player_id not in players: raise HTTPException(404, "Player not found")
+@router.post("/api/produce/preview")
+async def preview_production(data: ProduceModel, room: GameRoom = Depends(get_room)):
+    # 試算生產 (不修改狀態)：回傳確切的扣料，萬能工廠會列出用了哪些替代品
+    if data.player_id not in room.players: raise HTTPException(404, "Player not found")
+    success, result = room.engine.preview_production(room.players[data.player_id], data.factory_id, data.target_item,
+                                                     data.quantity, data.substitutes)
+    if not success: raise HTTPException(400, result)
+    return {"status": "success", **result}
+
+@router.post("/api/build")
+async def build_factory(data: BuildModel, room: GameRoom = Depends(get_room)):
+    await room.wait_settled()
+    if room.phase != 2: raise HTTPException(400, "非行動階段")
+    if data.player_id not in room.players: raise HTTPException(404, "Player not found")
+
+    p = room.players[data.player_id]
+    success, msg = room.engine.process_build_new(p, data.target_tier, data.payment_materials)
 
-    p = players[data.player_id]
-    success, msg = engine.process_build_new(p, data.target_tier, data.payment_materials)
-    
     if not success: raise HTTPException(400, msg)
-    log_event(f"{p.name} 建造: {msg}")
+    room.log_event(f"{p.name} 建造: {msg}", LOG_ACTION, p.id)
+    room.record("build", data.model_dump(), player_ids=[p.id])
+    room.notify(SECTION_PLAYERS, SECTION_LOGS, player_ids=[p.id])
     return {"status": "success", "message": msg}
 
-@app.post("/api/build_special")
-async def build_special(data: BuildSpecialModel):
-    if current_phase != 2: raise HTTPException(400, "非行動階段")
-    if data.player_id not in players: raise HTTPException(404, "Player not found")
+@router.post("/api/build_special")
+async def build_special(data: BuildSpecialModel, room: GameRoom = Depends(get_room)):
+    await room.wait_settled()
+    if room.phase != 2: raise HTTPException(400, "非行動階段")
+    if data.player_id not in room.players: raise HTTPException(404, "Player not found")
+
+    p = room.players[data.player_id]
+    success, msg = room.engine.process_build_special(p, data.building_type, data.payment_materials)
 
-    p = players[data.player_id]
-    success, msg = engine.process_build_special(p, data.building_type, data.payment_materials)
-    
     if not success: raise HTTPException(400, msg)
-    log_event(f"{p.name} 執行特殊建設: {msg}")
+    room.log_event(f"{p.name} 執行特殊建設: {msg}", LOG_ACTION, p.id)
+    room.record("build_special", data.model_dump(), player_ids=[p.id])
+    room.notify(SECTION_PLAYERS, SECTION_LOGS, player_ids=[p.id])
     return {"status": "success", "message": msg}
 
-@app.post("/api/upgrade")
-async def upgrade_factory(data: UpgradeModel):
-    if current_phase != 2: raise HTTPException(400, "非行動階段")
-    if data.player_id not in players: raise HTTPException(404, "Player not found")
+@router.post("/api/upgrade")
+async def upgrade_factory(data: UpgradeModel, room: GameRoom = Depends(get_room)):
+    await room.wait_settled()
+    if room.phase != 2: raise HTTPException(400, "非行動階段")
+    if data.player_id not in room.players: raise HTTPException(404, "Player not found")
+
+    p = room.players[data.player_id]
+    success, msg = room.engine.process_upgrade(p, data.factory_id, data.payment_materials)
 
-    p = players[data.player_id]
-    success, msg = engine.process_upgrade(p, data.factory_id, data.payment_materials)
-    
     if not success: raise HTTPException(400, msg)
-    log_event(f"{p.name} 升級: {msg}")
+    room.log_event(f"{p.name} 升級: {msg}", LOG_ACTION, p.id)
+    room.record("upgrade", data.model_dump(), player_ids=[p.id])
+    room.notify(SECTION_PLAYERS, SECTION_LOGS, player_ids=[p.id])
     return {"status": "success", "message": msg}
 
-@app.post("/api/demolish")
-async def demolish_factory(data: DemolishModel):
-    if current_phase != 2: raise HTTPException(400, "只有在行動階段才能拆除")
-    if data.player_id not in players: raise HTTPException(404, "Player not found")
-    
-    p = players[data.player_id]
-    success, msg = engine.process_demolish(p, data.factory_id)
-    
+@router.post("/api/demolish")
+async def demolish_factory(data: DemolishModel, room: GameRoom = Depends(get_room)):
+    await room.wait_settled()
+    if room.phase != 2: raise HTTPException(400, "只有在行動階段才能拆除")
+    if data.player_id not in room.players: raise HTTPException(404, "Player not found")
+
+    p = room.players[data.player_id]
+    success, msg = room.engine.process_demolish(p, data.factory_id)
+
     if not success: raise HTTPException(400, msg)
-    log_event(f"{p.name} 拆除: {msg}")
+    room.log_event(f"{p.name} 拆除: {msg}", LOG_ACTION, p.id)
+    room.record("demolish", data.model_dump(), player_ids=[p.id])
+    room.notify(SECTION_PLAYERS, SECTION_LOGS, player_ids=[p.id])
     return {"status": "success", "message": msg}
 
-@app.post("/api/bank_sell")
-async def sell_to_bank(data: BankSellModel):
-    if current_phase != 2: raise HTTPException(400, "非行動階段")
-    if data.player_id not in players: raise HTTPException(404, "Player not found")
-    
-    p = players[data.player_id]
-    success, msg = engine.process_bank_sell(p, data.item_id, data.quantity)
-    
+@router.post("/api/bank_sell")
+async def sell_to_bank(data: BankSellModel, room: GameRoom = Depends(get_room)):
+    await room.wait_settled()
+    if room.phase != 2: raise HTTPException(400, "非行動階段")
+    if data.player_id not in room.players: raise HTTPException(404, "Player not found")
+
+    p = room.players[data.player_id]
+    success, msg = room.engine.process_bank_sell(p, data.item_id, data.quantity)
+
     if not success: raise HTTPException(400, msg)
-    log_event(f"{p.name} 銀行交易: {msg}")
+    room.log_event(f"{p.name} 銀行交易: {msg}", LOG_ACTION, p.id)
+    room.record("bank_sell", data.model_dump(), player_ids=[p.id])
+    room.notify(SECTION_PLAYERS, SECTION_LOGS, player_ids=[p.id])
     return {"status": "success", "message": msg}
 
-@app.post("/api/trade")
-async def place_order(data: TradeModel):
-    if current_phase != 3: raise HTTPException(400, "非交易階段")
-    if data.player_id not in players: raise HTTPException(404, "Player not found")
+@router.post("/api/actions/batch")
+async def run_batch_actions(data: BatchActionModel, room: GameRoom = Depends(get_room)):
+    """
+    一次送出多個行動階段指令 (依序執行)，省下逐一呼叫各端點的往返。
+    atomic 為 True 時只要有一個失敗，整批都不生效。回傳每個指令各自的結果。
+    """
+    await room.wait_settled()
+    if room.phase != 2: raise HTTPException(400, "非行動階段")
+    if data.player_id not in room.players: raise HTTPException(404, "Player not found")
+    if not data.actions: raise HTTPException(400, "沒有任何指令")
+    if len(data.actions) > MAX_BATCH_ACTIONS: raise HTTPException(400, f"一次最多 {MAX_BATCH_ACTIONS} 個指令")
+
+    p = room.players[data.player_id]
+    commands = [cmd.model_dump() for cmd in data.actions]
+    results = room.engine.process_batch(p, commands, atomic=data.atomic)
+
+    applied = [(cmd, msg) for cmd, (ok, msg) in zip(commands, results) if ok]
+    if applied:
+        for cmd, msg in applied:
+            room.log_event(f"{p.name} {ACTION_LOG_VERBS[cmd['action']]}: {msg}", LOG_ACTION, p.id)
+        # 日誌只記下成功的指令；重播時依序再執行一次
+        room.record("batch", {"player_id": p.id, "actions": [cmd for cmd, _ in applied]}, player_ids=[p.id])
+        room.notify(SECTION_PLAYERS, SECTION_LOGS, player_ids=[p.id])
+    return {
+        "status": "success" if len(applied) == len(commands) else "error",
+        "applied": len(applied),
+        "results": [{"action": cmd["action"], "success": ok, "message": msg}
+                    for cmd, (ok, msg) in zip(commands, results)],
+    }
+
+@router.post("/api/trade")
+async def place_order(data: TradeModel, room: GameRoom = Depends(get_room)):
+    await room.wait_settled()
+    engine = room.engine
+    if room.phase != 3: raise HTTPException(400, "非交易階段")
+    if data.player_id not in room.players: raise HTTPException(404, "Player not found")
 
     if engine.current_event and engine.current_event.get("type") == "TRADE_BAN":
         if data.item_id == engine.current_event["target"]:
             raise HTTPException(400, f" 核災恐慌：本回合禁止交易 {config.ITEMS[data.item_id]['label']}！")
-    
-    p = players[data.player_id]
+
+    p = room.players[data.player_id]
     order_type = data.type
-    
+
     if order_type == "GOV_ASK":
         if not engine.active_gov_event: raise HTTPException(400, "無政府收購")
         if data.item_id not in engine.active_gov_event["targets"]: raise HTTPException(400, "非收購目標")
-        
+
         market_p = engine.market_prices.get(data.item_id, config.ITEMS[data.item_id]["base_price"])
         max_price = int(market_p * config.GOV_BUY_RATIO)
         if data.price > max_price: raise HTTPException(400, "出價過高")
-            
+
     order = Order(
-        player_id=data.player_id, 
-        type=order_type, 
-        item_id=data.item_id, 
-        price=data.price, 
+        player_id=data.player_id,
+        type=order_type,
+        item_id=data.item_id,
+        price=data.price,
         quantity=data.quantity
     )
-    
+
     success, msg = engine.validate_and_lock_assets(p, order)
     if not success: raise HTTPException(400, msg)
-    
+
     if order_type == "GOV_ASK":
         engine.gov_orders.append(order)
-        log_event(f"{p.name} 投標政府合約: {data.quantity}個 {data.item_id} @ ${data.price}")
+        room.log_event(f"{p.name} 投標政府合約: {data.quantity}個 {data.item_id} @ ${data.price}", LOG_ACTION, p.id)
     else:
-        engine.orders.append(order)
+        engine.orders.add(order)
         type_str = "買入" if data.type == "BID" else "賣出"
-        log_event(f"{p.name} 掛單{type_str}: {data.quantity}個 {data.item_id} @ ${data.price}")
-        
-    return {"status": "accepted", "message": msg}
-
-@app.post("/admin/next_phase")
-async def next_phase():
-    global current_phase, current_turn
-    
-    log_event(f"--- 管理員切換階段: 從 {current_phase} 結束 ---")
-
-    if current_phase == 3:
-        # 🌟 核心修改：接收撮合引擎回傳的交易日誌 (List[str])
-        auction_logs = engine.match_market_orders(players)
-        
-        # 如果有日誌，就把每一筆交易結果與失敗原因印到 Admin 廣播日誌上
-        if auction_logs:
-            for alog in auction_logs:
-                log_event(alog)
-                
-        current_phase = 4
-        log_event("=== 市場撮合完成，進入第 4 階段：結算階段 ===")
-        
-        # 呼叫結算機制 (扣稅、事件懲罰、複利)
-        end_turn_logs = engine.process_end_of_turn(players)
-        if end_turn_logs:
-            for l in end_turn_logs:
-                log_event(l)
-            
-    elif current_phase == 4:
-        for p in players.values():
-            for f in p.factories: 
-                # 🌟 新增：如果中了停擺懲罰，這回合就不能生產
-                if getattr(f, "is_shutdown", False):
-                    f.has_produced = True  # 設為 True 代表本回合已耗盡
-                    f.is_shutdown = False  # 解除標記
-                else:
-                    f.has_produced = False
-                f.current_product = None
-        current_turn += 1
-        engine.generate_daily_event(current_turn)
-        current_phase = 1
-        log_event(f"=== 第 {current_turn} 回合 開始 ===")
-
-        new_event, phase1_logs = engine.generate_daily_event(current_turn)
-        for log_msg in phase1_logs:
-            log_event(log_msg)
-        
-    else:
-        current_phase += 1
-
-    return {"status": "success", "new_phase": current_phase, "turn": current_turn}
-
-@app.post("/admin/reset")
-async def reset_game():
-    # 新增 final_ranking_data，確保重置時清空成績
-    global players, current_phase, engine, current_turn, game_logs, final_ranking_data
-    players = {}
-    current_phase = 1
-    current_turn = 1
-    game_logs = [] 
-    final_ranking_data = [] # 清空成績
-    engine = GameEngine()
-    engine.generate_daily_event(current_turn)
-    log_event("=== 遊戲已重置 ===")
+        room.log_event(f"{p.name} 掛單{type_str}: {data.quantity}個 {data.item_id} @ ${data.price}", LOG_ACTION, p.id)
+
+    room.record("trade", data.model_dump(), player_ids=[p.id], order=order)
+    room.notify(SECTION_PLAYERS, SECTION_LOGS, SECTION_BOOK, player_ids=[p.id])
+    return {"status": "accepted", "message": msg, "order_id": order.id}
+
+@router.delete("/api/orders/{order_id}")
+async def cancel_order(order_id: str, player_id: str, room: GameRoom = Depends(get_room)):
+    await room.wait_settled()
+    if room.phase != 3: raise HTTPException(400, "非交易階段")
+    if player_id not in room.players: raise HTTPException(404, "Player not found")
+
+    p = room.players[player_id]
+    success, msg = room.engine.cancel_order(p, order_id)
+
+    if not success: raise HTTPException(400, msg)
+    room.log_event(msg, LOG_ACTION, p.id)
+    room.record("cancel_order", {"order_id": order_id, "player_id": player_id}, player_ids=[p.id], removed_order_id=order_id)
+    room.notify(SECTION_PLAYERS, SECTION_LOGS, SECTION_BOOK, player_ids=[p.id])
+    return {"status": "success", "message": msg}
+
+@router.patch("/api/orders/{order_id}")
+async def amend_order(order_id: str, data: AmendOrderModel, room: GameRoom = Depends(get_room)):
+    await room.wait_settled()
+    if room.phase != 3: raise HTTPException(400, "非交易階段")
+    if data.player_id not in room.players: raise HTTPException(404, "Player not found")
+
+    p = room.players[data.player_id]
+    success, msg = room.engine.amend_order(p, order_id, data.price, data.quantity)
+
+    if not success: raise HTTPException(400, msg)
+    room.log_event(msg, LOG_ACTION, p.id)
+    room.record("amend_order", {"order_id": order_id, **data.model_dump()}, player_ids=[p.id],
+                order=room.engine.orders.get(order_id), removed_order_id=order_id)
+    room.notify(SECTION_PLAYERS, SECTION_LOGS, SECTION_BOOK, player_ids=[p.id])
+    return {"status": "success", "message": msg}
+
+@router.post("/admin/next_phase")
+async def next_phase(room: GameRoom = Depends(get_room)):
+    # 撮合與結算在背景執行緒進行，期間其他玩家的輪詢與推播不受阻塞
+    return await room.advance_phase_async()
+
+@router.post("/admin/reset")
+async def reset_game(room: GameRoom = Depends(get_room)):
+    await room.wait_settled()
+    # 只重置這個房間，其他房間不受影響
+    room.reset()
     return {"status": "reset complete"}
 
-@app.post("/admin/end_game")
-async def end_game():
-    global current_phase, final_ranking_data # 加入 global 變數
-    
-    if not players:
+@router.post("/admin/end_game")
+async def end_game(room: GameRoom = Depends(get_room)):
+    await room.wait_settled()
+    if not room.players:
         return {"status": "error", "message": "目前沒有玩家，無法結算。"}
 
-    # 呼叫 GameEngine 的結算函式
-    ranked_players = engine.game_set(players)
-    
-    # 將遊戲階段設為 5，代表「遊戲結束」
-    current_phase = 5
-    
-    # 把格式整理好，存到全域變數裡讓玩家的 API 可以讀取
-    final_ranking_data = [
-        {"name": name, "scores": data} for name, data in ranked_players
-    ]
-    
-    # 把結算結果寫入遊戲日誌，讓大家都能看到
-    log_event("=== 🛑 遊戲已由管理員強制結束，進行最終結算 ===")
-    for rank, p_data in enumerate(final_ranking_data, 1):
-        log_event(f"🏆 第 {rank} 名: {p_data['name']} | 總資產: ${p_data['scores']['total_score']}")
-        
+    final_ranking = room.end_game()
+
     return {
-        "status": "success", 
-        "message": "遊戲已結算", 
-        "ranking": final_ranking_data
-    }
\ No newline at end of file
+        "status": "success",
+        "message": "遊戲已結算",
+        "ranking": final_ranking
+    }
+
+# 同一組路由掛兩次：舊網址對應預設房間，/rooms/{room_id}/... 對應指定房間
+app.include_router(router)
+app.include_router(router, prefix=ROOM_PREFIX)
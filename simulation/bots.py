@@ -0,0 +1,220 @@
+"""
+無頭模擬用的機器人策略。每個機器人只透過 GameEngine 的公開方法行動 (與 HTTP 端點呼叫的是同一批方法)，
+所以模擬結果會反映真實遊戲的規則。
+
+- act()：行動階段 (第 2 階段) 的生產、建造、升級、銀行回收
+- trade()：交易階段 (第 3 階段) 的掛單
+新增策略只要繼承 Bot、覆寫這兩個方法，再登記到 BOTS 即可。
+"""
+import random
+from typing import Dict, List, Optional, Tuple, Type
+
+import config
+from core.engine import GameEngine
+from core.inventory import TIER_ITEMS
+from core.models import Factory, Order, PlayerState
+
+# --- 共用的小工具 ---
+def storage_capacity(player: PlayerState) -> int:
+    """每種物品的免稅庫存量 (與 process_end_of_turn 的倉儲稅計算相同)。"""
+    return player.factories.storage_capacity
+
+def craftable(player: PlayerState, item_id: str) -> int:
+    """以目前庫存最多能生產幾份 item_id (不含萬能工廠的替代)。"""
+    recipe = config.ITEMS[item_id].get("recipe")
+    if not recipe: return 0
+    return min(player.inventory[ing] // qty for ing, qty in recipe.items())
+
+def miners(player: PlayerState) -> List[Factory]:
+    return [f for f in player.factories if "Miner" in f.name]
+
+def ready_factories(player: PlayerState, tier: int) -> List[Factory]:
+    """本回合還能生產的一般加工廠。"""
+    return [f for f in player.factories
+            if "Miner" not in f.name and f.tier == tier and not f.has_produced and not f.is_shutdown]
+
+def mine_all(engine: GameEngine, player: PlayerState, item_id: str):
+    for f in miners(player):
+        if not f.has_produced and not f.is_shutdown:
+            engine.process_production(player, f.id, item_id, 1)
+
+def produce_max(engine: GameEngine, player: PlayerState, factory: Factory, item_id: str) -> bool:
+    qty = craftable(player, item_id)
+    return qty > 0 and engine.process_production(player, factory.id, item_id, qty)[0]
+
+def sell_excess_raw(engine: GameEngine, player: PlayerState, keep: Optional[int] = None):
+    """把超過免稅量的 T0 原料賣給銀行，避免被課倉儲稅。"""
+    if keep is None: keep = storage_capacity(player)
+    for item_id in TIER_ITEMS[0]:
+        excess = player.inventory[item_id] - keep
+        if excess > 0:
+            engine.process_bank_sell(player, item_id, excess)
+
+def place_order(engine: GameEngine, player: PlayerState, order_type: str, item_id: str,
+                price: int, quantity: int) -> Tuple[bool, str]:
+    """與 /api/trade 相同的檢查與掛單流程 (不含房間日誌)。"""
+    event = engine.current_event or {}
+    if event.get("type") == "TRADE_BAN" and item_id == event["target"]:
+        return False, "本回合禁止交易"
+    if order_type == "GOV_ASK":
+        gov = engine.active_gov_event
+        if not gov or item_id not in gov["targets"]: return False, "非收購目標"
+        if price > int(engine.market_prices[item_id] * config.GOV_BUY_RATIO): return False, "出價過高"
+
+    order = Order(player_id=player.id, type=order_type, item_id=item_id, price=price, quantity=quantity)
+    success, msg = engine.validate_and_lock_assets(player, order)
+    if not success: return False, msg
+    if order_type == "GOV_ASK": engine.gov_orders.append(order)
+    else: engine.orders.add(order)
+    return True, msg
+
+def build_t1(engine: GameEngine, player: PlayerState) -> bool:
+    """用庫存最多的兩種 T0 原料蓋一座 T1 加工廠。"""
+    rule = config.BUILD_T1_COST
+    raws = sorted(TIER_ITEMS[0], key=lambda i: player.inventory[i], reverse=True)[:rule["unique_types"]]
+    if any(player.inventory[i] < rule["qty_per_type"] for i in raws): return False
+    return engine.process_build_new(player, 1, raws)[0]
+
+def upgrade_miners(engine: GameEngine, player: PlayerState):
+    """有足夠的 T1 / T2 材料時順手升級採集器。"""
+    for f in miners(player):
+        rule = config.MINER_UPGRADE_RULES.get(f.tier)
+        if not rule or rule["complex"]: continue
+        mats = [i for i in TIER_ITEMS[rule["req_tier"]] if player.inventory[i] >= rule["qty"]]
+        if mats:
+            engine.process_upgrade(player, f.id, mats[:1])
+
+def best_raw(engine: GameEngine) -> str:
+    return max(TIER_ITEMS[0], key=lambda i: engine.market_prices[i])
+
+# --- 策略 ---
+class Bot:
+    name = "idle"
+
+    def __init__(self, rng: random.Random):
+        self.rng = rng
+
+    def act(self, engine: GameEngine, player: PlayerState, turn: int):
+        pass
+
+    def trade(self, engine: GameEngine, player: PlayerState, turn: int):
+        pass
+
+class MinerBot(Bot):
+    """專心採礦：把土地蓋滿採集器、有材料就升級，超出免稅量的原料全部賣給銀行。"""
+    name = "miner"
+    CASH_RESERVE = 2000
+
+    def act(self, engine, player, turn):
+        mine_all(engine, player, best_raw(engine))
+        upgrade_miners(engine, player)
+        while len(player.factories) < player.land_limit and player.money >= 500 + self.CASH_RESERVE:
+            if not engine.process_build_new(player, 0, [])[0]: break
+        sell_excess_raw(engine, player)
+
+class TraderBot(Bot):
+    """
+    做市商：採礦、蓋一座 T1 加工廠做半成品，交易階段對原料掛低買單、
+    對手上超過免稅量的物品掛高賣單，賺取買賣價差。
+    """
+    name = "trader"
+    SPREAD = 0.1
+    BUDGET_RATIO = 0.2  # 每回合最多拿多少比例的現金出來掛買單
+
+    def act(self, engine, player, turn):
+        mine_all(engine, player, self.rng.choice(TIER_ITEMS[0]))
+        if not any(f.tier == 1 and "Miner" not in f.name for f in player.factories) \
+                and len(player.factories) < player.land_limit:
+            build_t1(engine, player)
+        for f in ready_factories(player, 1):
+            target = max(TIER_ITEMS[1], key=lambda i: craftable(player, i))
+            produce_max(engine, player, f, target)
+
+    def trade(self, engine, player, turn):
+        keep = storage_capacity(player)
+        for item_id, qty in list(player.inventory.items()):
+            if qty > keep:
+                price = int(engine.market_prices[item_id] * (1 + self.SPREAD))
+                place_order(engine, player, "ASK", item_id, price, qty - keep)
+
+        budget = int(player.money * self.BUDGET_RATIO)
+        for item_id in TIER_ITEMS[0]:
+            price = int(engine.market_prices[item_id] * (1 - self.SPREAD))
+            qty = min(budget // len(TIER_ITEMS[0]) // max(price, 1), keep - player.inventory[item_id])
+            if qty > 0:
+                place_order(engine, player, "BID", item_id, price, qty)
+
+class GovHunterBot(Bot):
+    """政府合約獵人：盯著當回合的收購目標生產，交易階段以最高允許價格投標政府合約。"""
+    name = "gov"
+
+    def act(self, engine, player, turn):
+        targets = (engine.active_gov_event or {}).get("targets", [])
+        # 原料挑目標配方最缺的那種，沒有收購案時挑市價最高的
+        wanted = [ing for t in targets for ing in config.ITEMS[t].get("recipe", {}) if ing in TIER_ITEMS[0]]
+        mine_all(engine, player, wanted[0] if wanted else best_raw(engine))
+
+        t1_count = sum(1 for f in player.factories if "Miner" not in f.name and f.tier >= 1)
+        if t1_count < 2 and len(player.factories) < player.land_limit:
+            build_t1(engine, player)
+
+        for tier in (2, 1):
+            for f in ready_factories(player, tier):
+                options = [t for t in targets if config.ITEMS[t]["tier"] == tier] or TIER_ITEMS[tier]
+                target = max(options, key=lambda i: craftable(player, i))
+                produce_max(engine, player, f, target)
+
+        # 錢夠就把一座 T1 升成 T2，中後期的收購目標多是 T2
+        if turn >= 3:
+            for f in player.factories:
+                if "Miner" not in f.name and f.tier == 1:
+                    mats = [i for i in TIER_ITEMS[1] if player.inventory[i] >= config.UPGRADE_TO_T2["qty_per_type"]]
+                    if len(mats) >= config.UPGRADE_TO_T2["unique_types"]:
+                        engine.process_upgrade(player, f.id, mats)
+                    break
+        sell_excess_raw(engine, player)
+
+    def trade(self, engine, player, turn):
+        gov = engine.active_gov_event
+        if not gov: return
+        for item_id in gov["targets"]:
+            qty = player.inventory[item_id]
+            if qty > 0:
+                price = int(engine.market_prices[item_id] * config.GOV_BUY_RATIO)
+                place_order(engine, player, "GOV_ASK", item_id, price, qty)
+
+class RandomBot(Bot):
+    """隨機玩家：每回合隨機做幾件 (多半合法的) 事，當作對照組。"""
+    name = "random"
+
+    def act(self, engine, player, turn):
+        rng = self.rng
+        mine_all(engine, player, rng.choice(TIER_ITEMS[0]))
+        for _ in range(rng.randint(0, 3)):
+            choice = rng.random()
+            if choice < 0.25:
+                engine.process_build_new(player, 0, [])
+            elif choice < 0.5:
+                build_t1(engine, player)
+            elif choice < 0.75:
+                factories = [f for f in player.factories if "Miner" not in f.name and 1 <= f.tier <= 3]
+                if factories:
+                    f = rng.choice(factories)
+                    produce_max(engine, player, f, rng.choice(TIER_ITEMS[f.tier]))
+            else:
+                item_id = rng.choice(TIER_ITEMS[0])
+                if player.inventory[item_id]:
+                    engine.process_bank_sell(player, item_id, rng.randint(1, player.inventory[item_id]))
+
+    def trade(self, engine, player, turn):
+        rng = self.rng
+        limit = config.PRICE_FLUCTUATION_LIMIT
+        for _ in range(rng.randint(0, 3)):
+            item_id = rng.choice(TIER_ITEMS[rng.randint(0, 1)])
+            price = int(engine.market_prices[item_id] * rng.uniform(1 - limit / 2, 1 + limit / 2))
+            if rng.random() < 0.5:
+                place_order(engine, player, "BID", item_id, price, rng.randint(1, 3))
+            elif player.inventory[item_id]:
+                place_order(engine, player, "ASK", item_id, price, rng.randint(1, player.inventory[item_id]))
+
+BOTS: Dict[str, Type[Bot]] = {cls.name: cls for cls in (MinerBot, TraderBot, GovHunterBot, RandomBot)}
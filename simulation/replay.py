@@ -0,0 +1,109 @@
+"""
+從存檔的指令記錄重播一局遊戲：不經過 HTTP，用同一個種子重新執行每個被接受的指令，
+可以快轉到任一回合 / 階段，用來重現結算問題，或在當機後重新產生狀態。
+
+- 每個房間的每一局都從「建立房間」或「重置」開始 (記錄了該局的種子)，--game 選第幾局 (預設最後一局)。
+- --turn / --phase 指定停在哪裡；不指定則重播到最後一個指令。
+- --verify 把重播到最後的結果與存檔還原 (快照 + 日誌) 的狀態逐項比對，確認重播是否分岔。
+- --out 把重播後的狀態存成快照 JSON；--restore 直接寫回存檔成為該房間的最新快照 (請先關閉伺服器)。
+
+執行方式 (在專案根目錄)：
+    python -m simulation.replay --room default --verify
+    python -m simulation.replay --room classA --turn 5 --phase 3 --out turn5.json
+"""
+import argparse
+import json
+import sys
+import time
+
+import config
+from core.replay import ReplayError, replay, split_games
+from core.room import GameRoom
+from core.serialize import order_to_dict, player_to_dict
+from core.state_manager import StateManager
+
+def comparable(room: GameRoom) -> dict:
+    """比對用的遊戲狀態 (不含日誌、時間戳這些不影響遊戲結果的欄位)。"""
+    engine = room.engine
+    def orders(source):
+        return sorted(({k: v for k, v in order_to_dict(o).items() if k != "timestamp"} for o in source),
+                      key=lambda o: o["id"])
+    return {
+        "phase": room.phase,
+        "turn": room.turn,
+        "players": {pid: player_to_dict(p) for pid, p in room.players.items()},
+        "market_prices": dict(engine.market_prices),
+        "current_event": (engine.current_event or {}).get("id"),
+        "active_gov_event": (engine.active_gov_event or {}).get("id"),
+        "orders": orders(engine.orders),
+        "gov_orders": orders(engine.gov_orders),
+        "rng": json.loads(json.dumps(engine.rng_state())),
+    }
+
+def diff(a, b, path="") -> list:
+    if isinstance(a, dict) and isinstance(b, dict):
+        out = []
+        for k in a.keys() | b.keys():
+            out += diff(a.get(k), b.get(k), f"{path}.{k}" if path else str(k))
+        return out
+    return [] if a == b else [path]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default=config.STATE_DB_PATH, help="存檔路徑 (預設同伺服器)")
+    parser.add_argument("--room", default="default")
+    parser.add_argument("--game", type=int, default=-1, help="第幾局 (0 起算，負數從最後一局倒數)")
+    parser.add_argument("--turn", type=int, help="快轉到這個回合")
+    parser.add_argument("--phase", type=int, default=1, help="搭配 --turn：停在該回合的這個階段開始時")
+    parser.add_argument("--verify", action="store_true", help="與存檔還原的狀態比對 (需重播到最後)")
+    parser.add_argument("--out", help="把重播後的狀態存成快照 JSON")
+    parser.add_argument("--restore", action="store_true", help="把重播結果寫回存檔成為最新快照")
+    args = parser.parse_args()
+    if not args.db:
+        sys.exit("沒有存檔路徑 (GAME_STATE_DB 設為空字串時伺服器不會記錄指令)")
+
+    journal = StateManager(args.db)
+    try:
+        games = split_games(journal.load_commands(args.room))
+        if not games:
+            sys.exit(f"房間 {args.room} 沒有可重播的指令記錄")
+        game = games[args.game]
+
+        start = time.perf_counter()
+        try:
+            room, applied = replay(args.room, game, args.turn, args.phase)
+        except ReplayError as e:
+            sys.exit(f"重播失敗：{e}")
+        elapsed = time.perf_counter() - start
+
+        print(f"房間 {args.room} 第 {args.game % len(games)} 局 (共 {len(games)} 局)，種子 {room.engine.seed}")
+        print(f"重播 {applied}/{len(game) - 1} 個指令、{room.turn} 回合，耗時 {elapsed * 1000:.1f} ms "
+              f"({room.turn / max(elapsed, 1e-9):,.0f} 回合/秒)，停在第 {room.turn} 回合第 {room.phase} 階段")
+        for p in sorted(room.players.values(), key=lambda p: p.money, reverse=True):
+            print(f"  {p.name:<16} 現金 ${p.money:>12,} | 設施 {len(p.factories)}/{p.land_limit} | 庫存 {p.inventory.total()}")
+
+        if args.verify:
+            snapshot, tail = journal.load().get(args.room, (None, []))
+            if snapshot is None:
+                sys.exit("存檔中沒有這個房間的快照")
+            saved = GameRoom.from_snapshot(args.room, snapshot)
+            for redo in tail:
+                saved.apply_redo(redo)
+            mismatches = diff(comparable(room), comparable(saved))
+            if mismatches:
+                sys.exit(f"重播結果與存檔不一致：{', '.join(sorted(mismatches)[:20])}")
+            print("比對通過：重播結果與存檔還原的狀態完全一致")
+
+        if args.out:
+            with open(args.out, "w", encoding="utf-8") as f:
+                json.dump(room.to_snapshot(), f, ensure_ascii=False)
+            print(f"狀態已寫入 {args.out}")
+        if args.restore:
+            journal.snapshot(args.room, room.to_snapshot())
+            journal.flush()
+            print(f"已寫回 {args.db}，下次啟動伺服器時房間 {args.room} 會從重播結果開始")
+    finally:
+        journal.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""
+無頭遊戲模擬：不啟動伺服器，直接用 GameEngine 跑完整的 1→2→3→4 階段循環，
+由機器人策略 (simulation/bots.py) 代替玩家操作，用來做平衡測試。
+
+- 每一場以種子決定所有亂數 (事件、機器人決策)，同一個種子可以重現同一場遊戲。
+- 多場遊戲分散到多個行程平行執行，每場結果以一行 JSON 寫入輸出檔：
+  最終 game_set 分數、每回合結算後的市價、每回合各物品的成交量、觸發的事件。
+- 階段切換與伺服器共用 core.room.run_phase_transition，規則完全相同。
+
+執行方式 (在專案根目錄)：
+    python -m simulation.runner --games 10000 --turns 20
+    python -m simulation.runner --games 200 --lineup miner trader gov random --workers 4 --out sim.jsonl
+"""
+import argparse
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+import config
+from core.engine import GameEngine
+from core.inventory import ITEM_IDS
+from core.models import Factory, PlayerState
+from core.room import run_phase_transition
+from core.serialize import dumps
+from simulation.bots import BOTS
+
+DEFAULT_LINEUP = ("miner", "trader", "gov", "random")
+
+def new_player(player_id: str, name: str) -> PlayerState:
+    """正式規則的開局 (初始資金、一座採集器)，不是 register_player 目前的測試用作弊開局。"""
+    return PlayerState(
+        id=player_id,
+        name=name,
+        money=config.INITIAL_MONEY,
+        inventory={},
+        factories=[Factory(id=f"{player_id}-m0", tier=0, name="Miner")], # 固定代碼，同一個種子的結果才可重現
+        land_limit=config.INITIAL_LAND
+    )
+
+def locked_totals(players: Dict[str, PlayerState]) -> List[int]:
+    """各物品所有玩家鎖定庫存的總量 (依物品序號)。"""
+    totals = [0] * len(ITEM_IDS)
+    for p in players.values():
+        for i, qty in enumerate(p.locked_inventory.values()):
+            totals[i] += qty
+    return totals
+
+def settle_trades(engine: GameEngine, players: Dict[str, PlayerState], phase: int, turn: int) -> Tuple[int, int, List[int]]:
+    """
+    3 → 4 (撮合 + 回合結算)，另外回傳各物品實際成交的數量 (依物品序號)。
+    這一步只有成交會減少賣方的鎖定庫存，所以成交量 = 鎖定庫存減少的數量；
+    因鎖定庫存異常被移出訂單簿的賣單沒有交割，不算成交。
+    """
+    locked = locked_totals(players)
+    phase, turn, _ = run_phase_transition(engine, players, phase, turn)
+    return phase, turn, [before - after for before, after in zip(locked, locked_totals(players))]
+
+def run_game(seed: int, lineup: Sequence[str], turns: int = 20) -> dict:
+    """跑完一場 turns 回合的遊戲，回傳這場的摘要。"""
+    engine = GameEngine(seed) # 事件抽選、災害懲罰都用引擎自己的亂數
+    engine.generate_daily_event(1)
+    table = random.Random(seed) # 每回合的行動順序
+
+    players: Dict[str, PlayerState] = {}
+    bots = {}
+    for i, strategy in enumerate(lineup):
+        pid = f"p{i}"
+        players[pid] = new_player(pid, f"{strategy}-{i}")
+        bots[pid] = BOTS[strategy](random.Random(f"{seed}:{i}"))
+    seating = list(bots)
+
+    prices: Dict[str, List[int]] = {item_id: [] for item_id in ITEM_IDS}
+    volumes: Dict[str, List[int]] = {item_id: [] for item_id in ITEM_IDS}
+    events = []
+    phase, turn = 1, 1
+    while True:
+        events.append([(engine.current_event or {}).get("id"), (engine.active_gov_event or {}).get("id")])
+        phase, turn, _ = run_phase_transition(engine, players, phase, turn) # 1 → 2
+        table.shuffle(seating) # 每回合重新決定行動順序，避免固定座位佔到時間優先
+        for pid in seating:
+            bots[pid].act(engine, players[pid], turn)
+
+        phase, turn, _ = run_phase_transition(engine, players, phase, turn) # 2 → 3
+        for pid in seating:
+            bots[pid].trade(engine, players[pid], turn)
+
+        phase, turn, traded = settle_trades(engine, players, phase, turn) # 3 → 4
+        for item_id, qty in zip(ITEM_IDS, traded):
+            prices[item_id].append(engine.market_prices[item_id])
+            volumes[item_id].append(qty)
+
+        if turn >= turns: break
+        phase, turn, _ = run_phase_transition(engine, players, phase, turn) # 4 → 1
+
+    ranking = engine.game_set(players)
+    strategy_of = {players[pid].name: lineup[i] for i, pid in enumerate(players)}
+    return {
+        "seed": seed,
+        "turns": turns,
+        "ranking": [{"name": name, "strategy": strategy_of[name], **scores} for name, scores in ranking],
+        "prices": prices,
+        "volumes": volumes,
+        "events": events,
+    }
+
+def _run_job(job) -> dict:
+    return run_game(*job)
+
+def run_many(seeds: Sequence[int], lineup: Sequence[str], turns: int, workers: int) -> Iterator[dict]:
+    """依種子順序逐場產出結果；workers > 1 時分散到行程池。"""
+    jobs = [(seed, tuple(lineup), turns) for seed in seeds]
+    if workers <= 1:
+        yield from map(_run_job, jobs)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        yield from pool.map(_run_job, jobs, chunksize=max(1, len(jobs) // (workers * 8)))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--games", type=int, default=1000)
+    parser.add_argument("--turns", type=int, default=20)
+    parser.add_argument("--lineup", nargs="+", default=list(DEFAULT_LINEUP), choices=sorted(BOTS),
+                        help="每場的玩家策略 (可重複，例如 miner miner trader)")
+    parser.add_argument("--seed", type=int, default=0, help="第一場的種子，之後依序 +1")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--out", default="sim_results.jsonl", help="每場摘要的輸出檔 (JSON Lines)")
+    args = parser.parse_args()
+
+    wins = dict.fromkeys(args.lineup, 0)
+    totals = dict.fromkeys(args.lineup, 0)
+    start = time.perf_counter()
+    with open(args.out, "wb") as out:
+        seeds = range(args.seed, args.seed + args.games)
+        for result in run_many(seeds, args.lineup, args.turns, args.workers):
+            out.write(dumps(result) + b"\n")
+            wins[result["ranking"][0]["strategy"]] += 1
+            for entry in result["ranking"]:
+                totals[entry["strategy"]] += entry["total_score"]
+    elapsed = time.perf_counter() - start
+
+    print(f"{args.games} 場 × {args.turns} 回合，{args.workers} 個行程，耗時 {elapsed:.1f} 秒 "
+          f"({args.games / elapsed:.0f} 場/秒)，結果寫入 {args.out}")
+    seats = {s: args.lineup.count(s) for s in args.lineup}
+    for strategy in sorted(wins, key=lambda s: totals[s] / seats[s], reverse=True):
+        print(f"  {strategy:<8} 勝率 {wins[strategy] / args.games:6.1%} | "
+              f"平均總資產 ${totals[strategy] / (args.games * seats[strategy]):,.0f}")
+
+if __name__ == "__main__":
+    main()
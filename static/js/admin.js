@@ -1,69 +1,101 @@
+// 多房間：頁面由 /rooms/{id}/admin 提供時，所有 API 都加上該房間的前綴
+const API_BASE = window.API_BASE || "";
 let lastPrices = {};
+let itemsMeta = {};
+let catalogHash = null;
+let logCursor = null; // 最後收到的日誌序號，輪詢時帶給伺服器只取回之後的紀錄
+const MAX_LOG_LINES = 100;
+
+let pollTimer = null;
 
 async function updateStatus() {
     try {
-        const res = await fetch("/admin/data");
-        const data = await res.json();
-        
-        // 1. 顯示階段與回合 (中文化)
-        // 後端傳來的 phase 是數字 1, 2, 3, 4, 5
-        const phaseNames = {1: "新聞階段", 2: "行動階段", 3: "交易階段", 4: "結算階段", 5:"遊戲結束"};
-        const phaseName = phaseNames[data.phase] || "未知";
-        
-        if(data.phase != 5){
-            document.getElementById("current-phase").innerText = `階段 ${data.phase}: ${phaseName}`;
-        }
-        else{
-            document.getElementById("current-phase").innerText = `${phaseName}`;        
-        }
-        document.getElementById("current-turn").innerText = `第 ${data.turn} 回合`;
-
-        // 2. 更新市場價格表
-        if(data.market_prices || data.items_meta) {
-             // 這裡假設我們有個方式取得 items_meta，或是後端 admin/data 已經包含了
-             // 如果沒有，通常建議在 admin/data 裡一起回傳 items_meta
-             // 為了保險，這裡做個簡單的檢查
-             const prices = data.market_prices || {};
-             // 為了拿到中文名稱，我們可能需要呼叫一次 /api/state 或是讓 admin/data 回傳 items_meta
-             // 這裡假設您已經在 main.py 的 /admin/data 加入了 items_meta
-             // 如果還沒，這裡先用 key 顯示
-             const meta = data.items_meta || {}; 
-             updateMarketTable(prices, meta);
-        }
-
-        // 3. 更新玩家排行榜
-        const playerHtml = data.players.map((p, index) => {
-            return `<tr>
-                <td style="text-align: center;">#${index + 1}</td>
-                <td style="font-weight: bold;">${p.name}</td>
-                <td class="money-col">$${p.money.toLocaleString()}</td>
-                <td class="center-col">${p.land}</td>
-                <td class="center-col">${p.inventory_count}</td>
-            </tr>`;
-        }).join("");
-        document.getElementById("player-table").innerHTML = playerHtml;
-
-        // 4. 更新日誌
-        const logWindow = document.getElementById("log-window");
-        if (data.logs) {
-            const logsHtml = data.logs.map(log => {
-                const match = log.match(/^\[(.*?)\] (.*)/);
-                if (match) {
-                    return `<div class="log-entry"><span class="log-time">${match[1]}</span> ${match[2]}</div>`;
-                }
-                return `<div class="log-entry">${log}</div>`;
-            }).join("");
-            
-            if (logWindow.innerHTML !== logsHtml) {
-                logWindow.innerHTML = logsHtml;
-            }
-        }
-
+        const query = logCursor === null ? "" : `?log_cursor=${logCursor}`;
+        const res = await fetch(`${API_BASE}/admin/data${query}`);
+        await renderStatus(await res.json());
     } catch (e) {
         console.error("Connection lost", e);
     }
 }
 
+// 物品名稱等靜態資料由 /api/catalog 提供，只在 catalog_hash 改變時重新下載
+async function ensureCatalog(hash) {
+    if (!hash || hash === catalogHash) return;
+    const res = await fetch(`/api/catalog?v=${hash}`);
+    itemsMeta = (await res.json()).items;
+    catalogHash = hash;
+}
+
+async function renderStatus(data) {
+    await ensureCatalog(data.catalog_hash);
+
+    // 1. 顯示階段與回合 (中文化)
+    // 後端傳來的 phase 是數字 1, 2, 3, 4, 5
+    const phaseNames = {1: "新聞階段", 2: "行動階段", 3: "交易階段", 4: "結算階段", 5:"遊戲結束"};
+    const phaseName = phaseNames[data.phase] || "未知";
+    
+    if(data.phase != 5){
+        document.getElementById("current-phase").innerText = `階段 ${data.phase}: ${phaseName}`;
+    }
+    else{
+        document.getElementById("current-phase").innerText = `${phaseName}`;        
+    }
+    document.getElementById("current-turn").innerText = `第 ${data.turn} 回合`;
+
+    // 2. 更新市場價格表
+    if(data.market_prices) {
+         updateMarketTable(data.market_prices, itemsMeta);
+    }
+
+    // 3. 更新玩家排行榜
+    const playerHtml = data.players.map((p, index) => {
+        return `<tr>
+            <td style="text-align: center;">#${index + 1}</td>
+            <td style="font-weight: bold;">${p.name}</td>
+            <td class="money-col">$${p.money.toLocaleString()}</td>
+            <td class="center-col">${p.land}</td>
+            <td class="center-col">${p.inventory_count}</td>
+        </tr>`;
+    }).join("");
+    document.getElementById("player-table").innerHTML = playerHtml;
+
+    // 4. 更新日誌 (只收到游標之後的新紀錄，新的插在最上面)
+    renderLogs(data.logs, data.logs_reset);
+    logCursor = data.log_cursor;
+}
+
+function renderLogs(entries, reset) {
+    const logWindow = document.getElementById("log-window");
+    if (reset) logWindow.innerHTML = "";
+    // 推播與手動輪詢可能送來同一段紀錄，已經顯示過的跳過
+    if (!reset && logCursor !== null) entries = (entries || []).filter(entry => entry.seq > logCursor);
+    if (!entries || entries.length === 0) return;
+
+    const logsHtml = entries.slice(-MAX_LOG_LINES).reverse().map(entry => {
+        const time = entry.ts ? new Date(entry.ts * 1000).toLocaleTimeString("zh-TW", {hour12: false}) : "";
+        return `<div class="log-entry log-${entry.kind}"><span class="log-time">${time}</span> ${entry.message}</div>`;
+    }).join("");
+    logWindow.insertAdjacentHTML("afterbegin", logsHtml);
+    while (logWindow.children.length > MAX_LOG_LINES) {
+        logWindow.lastElementChild.remove();
+    }
+}
+
+// 優先使用伺服器推播 (SSE)，不支援或連線中斷時退回每秒輪詢
+function startStatusStream() {
+    if (!window.EventSource) {
+        pollTimer = setInterval(updateStatus, 1000);
+        return;
+    }
+    const source = new EventSource(`${API_BASE}/admin/stream`);
+    source.onmessage = (e) => renderStatus(JSON.parse(e.data));
+    source.onerror = () => {
+        if (source.readyState === EventSource.CLOSED && !pollTimer) {
+            pollTimer = setInterval(updateStatus, 1000);
+        }
+    };
+}
+
 function updateMarketTable(prices, meta) {
     const marketHtml = Object.entries(prices).map(([k, p]) => {
         // 嘗試取得中文名稱，如果沒有則顯示代碼
@@ -90,14 +122,14 @@ function updateMarketTable(prices, meta) {
 
 // 移除切換階段的警告視窗，點擊後直接執行
 async function nextPhase() { 
-    await fetch("/admin/next_phase", {method: "POST"}); 
+    await fetch(`${API_BASE}/admin/next_phase`, {method: "POST"}); 
     updateStatus(); 
 }
 
 // 重置遊戲保留警告，避免誤觸
 async function resetGame() { 
     if(!confirm("警告：確定要「重置遊戲」嗎？\n所有玩家數據將被清空，無法復原！")) return;
-    await fetch("/admin/reset", {method: "POST"}); 
+    await fetch(`${API_BASE}/admin/reset`, {method: "POST"}); 
     updateStatus(); 
 }
 
@@ -107,7 +139,7 @@ async function endGame() {
     }
     
     try {
-        const response = await fetch('/admin/end_game', {
+        const response = await fetch(`${API_BASE}/admin/end_game`, {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json'
@@ -128,5 +160,4 @@ async function endGame() {
     }
 }
 
-setInterval(updateStatus, 1000);
-updateStatus();
\ No newline at end of file
+startStatusStream();
\ No newline at end of file
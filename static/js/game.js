@@ -1,4 +1,7 @@
-let playerId = localStorage.getItem("io_player_id");
+// 多房間：頁面由 /rooms/{id}/ 提供時，所有 API 都加上該房間的前綴
+const API_BASE = window.API_BASE || "";
+const PLAYER_ID_KEY = API_BASE ? `io_player_id:${API_BASE}` : "io_player_id";
+let playerId = localStorage.getItem(PLAYER_ID_KEY);
 let itemsMeta = {};
 let lastSeenEventId = null;
 let isNewsOpen = false;
@@ -11,6 +14,12 @@ let pendingAction = null;
 let pendingTargetId = null; 
 let selectedMaterials = [];
 
+let pollTimer = null;
+let clientState = {};       // 合併後的本地狀態 (伺服器只送出有變動的區塊)
+let stateVersion = null;
+let catalogHash = null;
+let stateQueue = Promise.resolve();
+
 if (playerId) {
     document.getElementById("login-section").classList.add("hidden");
     document.getElementById("game-ui").classList.remove("hidden");
@@ -257,10 +266,10 @@ async function register() {
     const name = document.getElementById("player-name").value;
     if (!name) return showToast("請輸入公司名稱！", "error");
     try {
-        const res = await fetch("/api/register", { method: "POST", headers: {"Content-Type": "application/json"}, body: JSON.stringify({name}) });
+        const res = await fetch(`${API_BASE}/api/register`, { method: "POST", headers: {"Content-Type": "application/json"}, body: JSON.stringify({name}) });
         const data = await res.json();
         playerId = data.player_id;
-        localStorage.setItem("io_player_id", playerId);
+        localStorage.setItem(PLAYER_ID_KEY, playerId);
         showToast("公司註冊成功！", "success");
         document.getElementById("login-section").classList.add("hidden");
         document.getElementById("game-ui").classList.remove("hidden");
@@ -268,28 +277,90 @@ async function register() {
     } catch (e) { showToast("無法連接伺服器", "error"); }
 }
 
-function startPolling() { setInterval(fetchState, 1000); }
+// 優先使用伺服器推播 (SSE)，瀏覽器不支援或連線中斷時退回每秒輪詢
+function startPolling() {
+    if (!window.EventSource) {
+        startIntervalPolling();
+        return;
+    }
+    const url = playerId ? `${API_BASE}/api/stream?player_id=${playerId}` : `${API_BASE}/api/stream`;
+    const source = new EventSource(url);
+    source.onmessage = (e) => enqueueState(JSON.parse(e.data));
+    source.onerror = () => {
+        if (source.readyState === EventSource.CLOSED) startIntervalPolling();
+    };
+}
+
+function startIntervalPolling() {
+    if (!pollTimer) pollTimer = setInterval(fetchState, 1000);
+}
+
+// 物品/配方等靜態資料只在 catalog_hash 改變時下載一次，並存在 localStorage
+async function ensureCatalog(hash) {
+    if (hash === catalogHash) return;
+    let catalog = null;
+    try {
+        const cached = JSON.parse(localStorage.getItem("io_catalog") || "null");
+        if (cached && cached.hash === hash) catalog = cached.data;
+    } catch (e) { /* 快取損毀就重新下載 */ }
+
+    if (!catalog) {
+        const res = await fetch(`/api/catalog?v=${hash}`);
+        catalog = await res.json();
+        try {
+            localStorage.setItem("io_catalog", JSON.stringify({hash, data: catalog}));
+        } catch (e) { /* 儲存空間不足時只用記憶體快取 */ }
+    }
+    itemsMeta = catalog.items;
+    catalogHash = hash;
+}
 
 async function fetchState() {
     try {
-        const url = playerId ? `/api/state?player_id=${playerId}` : '/api/state';
-        const res = await fetch(url);
-        const state = await res.json();
-        itemsMeta = state.items_meta;
-        currentMarketPrices = state.market_prices;
-
-        if (playerId && !state.player) {
-            alert("遊戲已重置，請重新創立公司！", "系統通知");
-            localStorage.removeItem("io_player_id");
-            setTimeout(() => location.reload(), 2000);
-            return;
-        }
-        updateUI(state);
+        const params = new URLSearchParams({items_meta: "false"});
+        if (playerId) params.set("player_id", playerId);
+        if (stateVersion !== null) params.set("since", stateVersion); // 只取回有變動的區塊
+        const res = await fetch(`${API_BASE}/api/state?${params}`);
+        if (res.status === 304) return; // 狀態沒有變動
+        await enqueueState(await res.json());
     } catch (e) {
         console.error("Polling error", e);
     }
 }
 
+// 推播與輪詢可能同時到達，依序處理避免舊資料覆蓋新資料
+function enqueueState(delta) {
+    stateQueue = stateQueue.then(() => handleState(delta)).catch(e => console.error("State error", e));
+    return stateQueue;
+}
+
+// version 是 "epoch.版本號"；epoch 相同時才比較版本號 (伺服器重啟後一律先收到完整快照)
+function isStale(version) {
+    if (stateVersion === null) return false;
+    const [epoch, seq] = version.split(".");
+    const [knownEpoch, knownSeq] = stateVersion.split(".");
+    return epoch === knownEpoch && Number(seq) <= Number(knownSeq);
+}
+
+// 伺服器只送出有變動的區塊，合併進本地狀態後再重繪
+async function handleState(delta) {
+    if (!delta.snapshot && isStale(delta.version)) return;
+    if (delta.catalog_hash) await ensureCatalog(delta.catalog_hash);
+    clientState = delta.snapshot ? delta : Object.assign(clientState, delta);
+    stateVersion = delta.version;
+    const state = clientState;
+
+    currentMarketPrices = state.market_prices;
+
+    if (playerId && !state.player) {
+        alert("遊戲已重置，請重新創立公司！", "系統通知");
+        localStorage.removeItem(PLAYER_ID_KEY);
+        setTimeout(() => location.reload(), 2000);
+        return;
+    }
+    updateUI(state);
+}
+
 function updateUI(state) {
     const phase = state.phase;
     const event = state.event || { id: "none", title: "等待訊號...", description: "", effect_text: "" };
@@ -390,12 +461,15 @@ function updateUI(state) {
         invDiv.innerHTML = invHtml || `<div style="color: #555; font-style: italic;">(倉庫是空的)</div>`;
 
         renderFactoriesSmart(state.player.factories, state.phase);
+        renderMyOrders(state.orders || []);
     }
     
+    if (state.order_book) renderMarketDepth(state.order_book);
+
     // 5. 下拉選單更新
-    populateDropdown("trade-item", state.items_meta, state.market_prices, 1.0);
+    populateDropdown("trade-item", itemsMeta, state.market_prices, 1.0);
     const rawMaterialsMeta = {};
-    for (const [k, v] of Object.entries(state.items_meta)) {
+    for (const [k, v] of Object.entries(itemsMeta)) {
         if (v.tier === 0) rawMaterialsMeta[k] = v;
     }
     populateDropdown("bank-item", rawMaterialsMeta, state.market_prices, 0.85);
@@ -645,6 +719,36 @@ async function produce(factoryId) {
     await post("/api/produce", {player_id: playerId, factory_id: factoryId, target_item: item, quantity: qty});
 }
 
+// 依照每座設施目前選擇的產品與數量，一次送出所有生產指令 (/api/actions/batch)
+async function produceAll() {
+    const actions = [];
+    document.querySelectorAll("#factory-list [id^='prod-']").forEach(select => {
+        const factoryId = select.id.slice("prod-".length);
+        if (!select.value) return; // 只有還能生產的設施才會有產品選單
+        const qtyInput = document.getElementById(`qty-${factoryId}`);
+        const qty = qtyInput ? (parseInt(qtyInput.value) || 1) : 1;
+        actions.push({action: "produce", factory_id: factoryId, target_item: select.value, quantity: qty});
+    });
+    if (actions.length === 0) return showToast("沒有可生產的設施", "error");
+
+    try {
+        const res = await fetch(API_BASE + "/api/actions/batch", {
+            method: "POST",
+            headers: {"Content-Type": "application/json"},
+            body: JSON.stringify({player_id: playerId, actions: actions}),
+        });
+        const json = await res.json();
+        if (res.status !== 200) return showToast("錯誤: " + (json.detail || "未知錯誤"), "error");
+
+        const failed = json.results.filter(r => !r.success);
+        if (failed.length === 0) showToast(`成功: ${json.applied} 座設施完成生產`, "success");
+        else showToast(`完成 ${json.applied} 座，失敗 ${failed.length} 座: ${failed.map(r => r.message).join("；")}`, "error");
+        await fetchState();
+    } catch (e) {
+        showToast("連接失敗", "error");
+    }
+}
+
 function demolish(fid, cost) {
     showConfirm(`確定要拆除這座設施嗎？\n這將花費 $${cost} 的清潔費，且設施將永久消失！`, "拆除確認", 
         async function() { await post("/api/demolish", {player_id: playerId, factory_id: fid}); }
@@ -683,9 +787,55 @@ async function submitOrder() {
     }
 }
 
+function renderMarketDepth(book) {
+    const box = document.getElementById("market-depth");
+    if (!box) return;
+    box.innerHTML = Object.entries(book).map(([itemId, d]) => {
+        const bestBid = d.bids.length ? `$${d.bids[0][0]} x${d.bids[0][1]}` : "-";
+        const bestAsk = d.asks.length ? `$${d.asks[0][0]} x${d.asks[0][1]}` : "-";
+        const indicative = d.volume > 0 ? `<span style="color:#2ecc71;">$${d.indicative_price}</span> (可成交 ${d.volume})` : `<span style="color:#7f8c8d;">尚無交集</span>`;
+        return `<div class="row"><span>${itemsMeta[itemId]?.label || itemId}</span> <span>${indicative} | 買 ${bestBid} / 賣 ${bestAsk}</span></div>`;
+    }).join("") || `<div style="color: #555; font-style: italic;">(目前沒有掛單)</div>`;
+}
+
+function renderMyOrders(orders) {
+    const box = document.getElementById("my-orders");
+    if (!box) return;
+    const typeNames = {BID: "買入", ASK: "賣出", GOV_ASK: "政府投標"};
+    box.innerHTML = orders.map(o => `
+        <div class="row">
+            <span>${typeNames[o.type] || o.type} ${itemsMeta[o.item_id]?.label || o.item_id} x${o.quantity} @ $${o.price}</span>
+            <span>
+                ${o.type !== "GOV_ASK" ? `<button class="btn" style="background: #34495e; padding: 2px 8px;" onclick="amendOrder('${o.id}', ${o.price}, ${o.quantity})">改價</button>` : ""}
+                <button class="btn" style="background: #c0392b; padding: 2px 8px;" onclick="cancelOrder('${o.id}')">取消</button>
+            </span>
+        </div>`).join("") || `<div style="color: #555; font-style: italic;">(目前沒有掛單)</div>`;
+}
+
+async function cancelOrder(orderId) {
+    await send("DELETE", `/api/orders/${orderId}?player_id=${encodeURIComponent(playerId)}`);
+}
+
+async function amendOrder(orderId, price, qty) {
+    const input = prompt(`輸入新的單價與數量 (以空白分隔)`, `${price} ${qty}`);
+    if (!input) return;
+    const [newPrice, newQty] = input.trim().split(/\s+/).map(v => parseInt(v));
+    if (!newPrice || !newQty) return showToast("請輸入有效的價格與數量", "error");
+    await send("PATCH", `/api/orders/${orderId}`, {player_id: playerId, price: newPrice, quantity: newQty});
+}
+
 async function post(url, data) {
+    await send("POST", url, data);
+}
+
+async function send(method, url, data) {
     try {
-        const res = await fetch(url, { method: "POST", headers: {"Content-Type": "application/json"}, body: JSON.stringify(data) });
+        const options = { method: method };
+        if (data !== undefined) {
+            options.headers = {"Content-Type": "application/json"};
+            options.body = JSON.stringify(data);
+        }
+        const res = await fetch(API_BASE + url, options);
         const json = await res.json();
         if (res.status !== 200) {
             showToast("錯誤: " + (json.detail || "未知錯誤"), "error");
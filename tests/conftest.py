@@ -0,0 +1,6 @@
+import os
+import sys
+
+# 測試不寫存檔；專案根目錄加入匯入路徑 (直接執行 pytest 時也找得到 config / core)
+os.environ.setdefault("GAME_STATE_DB", "")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
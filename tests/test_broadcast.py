@@ -0,0 +1,32 @@
+from core.broadcast import StateNotifier, SECTION_PHASE
+from core.room import GameRoom
+
+def test_cursor_round_trip():
+    n = StateNotifier()
+    n.bump(SECTION_PHASE)
+    n.bump(SECTION_PHASE)
+    assert n.cursor() == f"{n.epoch}.2"
+    assert n.parse_cursor(n.cursor()) == 2
+    assert n.parse_cursor(n.cursor(1)) == 1
+    assert n.etag(2) == f'"{n.epoch}.2"'
+
+def test_stale_or_foreign_cursor_means_full_snapshot():
+    n = StateNotifier()
+    n.bump(SECTION_PHASE)
+    restarted = StateNotifier() # 伺服器重啟：版本號從 0 重新開始，epoch 不同
+    restarted.bump(SECTION_PHASE)
+    restarted.bump(SECTION_PHASE)
+    assert restarted.epoch != n.epoch
+    for cursor in [n.cursor(), n.cursor(0), "2", f"{restarted.epoch}.9", f"{restarted.epoch}.x", "", None]:
+        assert restarted.parse_cursor(cursor) is None, cursor
+    assert n.etag(1) != restarted.etag(1)
+
+def test_room_sends_snapshot_after_restart():
+    before = GameRoom("r")
+    cursor = before.build_state()["version"]
+    after = GameRoom("r")
+    after.notifier.bump(SECTION_PHASE) # 重啟後的版本號追上 (甚至超過) 舊的游標也不會被誤用
+    after.notifier.bump(SECTION_PHASE)
+    state = after.build_state(since=after.notifier.parse_cursor(cursor))
+    assert state["snapshot"] and state["version"] == after.notifier.cursor()
+    assert after.build_state(since=after.notifier.parse_cursor(state["version"])) is None
@@ -0,0 +1,56 @@
+from core.engine import GameEngine
+from core.models import Order
+from simulation.runner import new_player
+
+def dirty_after(engine: GameEngine, call) -> set:
+    engine.take_dirty()
+    call()
+    return engine.take_dirty()
+
+# --- 掛單 / 撤單 / 改單：只有成功才標記玩家 ---
+def test_trading_marks_only_successful_changes():
+    engine = GameEngine(seed=1)
+    p = new_player("p", "P")
+    price = engine.market_prices["iron"]
+    bid = lambda qty, px=price: Order(player_id="p", type="BID", item_id="iron", price=px, quantity=qty)
+
+    assert dirty_after(engine, lambda: engine.validate_and_lock_assets(p, bid(0))) == set()
+    assert dirty_after(engine, lambda: engine.validate_and_lock_assets(p, bid(1, price * 10))) == set()
+    assert dirty_after(engine, lambda: engine.validate_and_lock_assets(p, bid(10 ** 9))) == set()
+    order = bid(1)
+    assert dirty_after(engine, lambda: engine.validate_and_lock_assets(p, order)) == {"p"}
+    engine.orders.add(order)
+
+    assert dirty_after(engine, lambda: engine.amend_order(p, "missing", price)) == set()
+    assert dirty_after(engine, lambda: engine.amend_order(p, order.id, price, 0)) == set()
+    assert dirty_after(engine, lambda: engine.amend_order(p, order.id, price, 10 ** 9)) == set()
+    assert dirty_after(engine, lambda: engine.amend_order(p, order.id, price, 2)) == {"p"}
+
+    assert dirty_after(engine, lambda: engine.cancel_order(new_player("q", "Q"), order.id)) == set()
+    assert dirty_after(engine, lambda: engine.cancel_order(p, order.id)) == {"p"}
+
+# --- 行動階段：被拒絕的行動不標記 ---
+def test_actions_mark_only_successful_changes():
+    engine = GameEngine(seed=1)
+    p = new_player("p", "P")
+    miner = p.factories[0].id
+    rejected = [
+        lambda: engine.process_production(p, "missing", "iron", 1),
+        lambda: engine.process_production(p, miner, "wafer", 1),
+        lambda: engine.process_build_new(p, 1, ["silicon", "iron"]),
+        lambda: engine.process_build_special(p, "special_land", ["quantum"]),
+        lambda: engine.process_upgrade(p, miner, ["wafer"]),
+        lambda: engine.process_demolish(p, "missing"),
+        lambda: engine.process_bank_sell(p, "iron", 1),
+    ]
+    for call in rejected:
+        assert dirty_after(engine, call) == set()
+
+    assert dirty_after(engine, lambda: engine.process_production(p, miner, "iron", 1)) == {"p"}
+    assert dirty_after(engine, lambda: engine.process_bank_sell(p, "iron", 1)) == {"p"}
+    assert dirty_after(engine, lambda: engine.process_build_new(p, 0, [])) == {"p"}
+    assert dirty_after(engine, lambda: engine.process_demolish(p, miner)) == {"p"}
+
+    # 批次：只有成功的指令標記玩家
+    q = new_player("q", "Q")
+    assert dirty_after(engine, lambda: engine.process_batch(q, [{"action": "bank_sell", "item_id": "iron", "quantity": 1}])) == set()
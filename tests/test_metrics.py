@@ -0,0 +1,29 @@
+import pytest
+from fastapi import APIRouter, FastAPI
+from fastapi.testclient import TestClient
+
+from core.metrics import Counter, Metric, MetricsMiddleware, HTTP_REQUESTS
+
+def test_metric_requires_render():
+    with pytest.raises(TypeError):
+        Metric("m", "help")
+    c = Counter("c", "help")
+    c.inc()
+    assert c.render()[-1] == "c 1"
+
+def test_room_prefix_is_merged_into_one_route_label():
+    # 與 main.py 相同：同一組路由掛兩次，標籤去掉房間前綴
+    router = APIRouter()
+    router.get("/")(lambda: {})
+    router.get("/api/orders/{order_id}")(lambda order_id: {})
+    app = FastAPI()
+    app.add_middleware(MetricsMiddleware, route_prefix="/rooms/{room_id}")
+    app.include_router(router)
+    app.include_router(router, prefix="/rooms/{room_id}")
+
+    before = dict(HTTP_REQUESTS._values)
+    client = TestClient(app)
+    for url in ["/", "/rooms/a/", "/api/orders/1", "/rooms/a/api/orders/2", "/rooms/b/api/orders/3"]:
+        assert client.get(url).status_code == 200
+    counts = {k: v - before.get(k, 0) for k, v in HTTP_REQUESTS._values.items() if v != before.get(k, 0)}
+    assert counts == {("GET", "/", "200"): 2, ("GET", "/api/orders/{order_id}", "200"): 3}
@@ -0,0 +1,60 @@
+import random
+
+import pytest
+
+from core.models import Order
+from core.orderbook import clearing_price
+
+def legacy_calc_price(bids, asks, last_price):
+    """舊版 Phase4Settlement._calc_price (逐價位加總)，作為差異比對的基準。"""
+    if not bids or not asks: return last_price, 0
+    prices = sorted(list(set([o.price for o in bids] + [o.price for o in asks])))
+    max_vol = 0
+    best_price = last_price
+    candidates = []
+    for p in prices:
+        demand = sum(o.quantity for o in bids if o.price >= p)
+        supply = sum(o.quantity for o in asks if o.price <= p)
+        vol = min(demand, supply)
+        if vol > max_vol:
+            max_vol = vol
+            candidates = [p]
+        elif vol == max_vol and vol > 0:
+            candidates.append(p)
+    if max_vol == 0:
+        return best_price, 0
+    candidates.sort(key=lambda x: abs(x - last_price))
+    return candidates[0], max_vol
+
+def order(side: str, price: int, quantity: int) -> Order:
+    return Order(player_id="p", type=side, item_id="x", price=price, quantity=quantity)
+
+def random_book(rng: random.Random, n: int, spread: int):
+    """價位集中在少數整數附近，刻意製造大量同量、等距的平手情況。"""
+    center = rng.randint(50, 150)
+    orders = [order(rng.choice(("BID", "ASK")), max(1, center + rng.randint(-spread, spread)), rng.randint(1, 5))
+              for _ in range(n)]
+    bids = [o for o in orders if o.type == "BID"]
+    asks = [o for o in orders if o.type == "ASK"]
+    return bids, asks, center + rng.randint(-spread, spread)
+
+@pytest.mark.parametrize("seed", range(10))
+def test_clearing_price_matches_legacy(seed):
+    rng = random.Random(seed)
+    for i in range(300):
+        bids, asks, last = random_book(rng, rng.randint(0, 60), rng.randint(0, 10))
+        assert clearing_price(bids, asks, last) == legacy_calc_price(bids, asks, last), f"第 {i} 組"
+
+def test_one_side_empty_keeps_last_price():
+    assert clearing_price([order("BID", 100, 3)], [], 90) == (90, 0)
+    assert clearing_price([], [order("ASK", 100, 3)], 90) == (90, 0)
+
+def test_no_overlap_keeps_last_price():
+    assert clearing_price([order("BID", 90, 3)], [order("ASK", 100, 3)], 95) == (95, 0)
+
+def test_tie_prefers_closest_then_lower_price():
+    # 100 與 110 成交量都是 2，距離上次市價 105 一樣遠 → 取較低的 100
+    bids = [order("BID", 110, 2)]
+    asks = [order("ASK", 100, 2)]
+    assert clearing_price(bids, asks, 105) == (100, 2)
+    assert clearing_price(bids, asks, 108) == (110, 2)
@@ -0,0 +1,120 @@
+import copy
+import random
+
+import pytest
+
+import config
+from core.engine import GameEngine
+from core.models import Factory, PlayerState
+from tests import legacy_phase2
+from tests.legacy_phase2 import Phase2Action as LegacyPhase2
+
+class LegacyEngine(LegacyPhase2, GameEngine):
+    """舊版的行動階段驗證，其餘 (亂數代碼、市價) 與目前的引擎相同。"""
+
+UNKNOWN = "unobtainium"
+MATERIALS = list(config.ITEM_IDS) + [UNKNOWN, ""]
+T3 = [k for k, v in config.ITEMS.items() if v["tier"] == 3]
+FACILITIES = [("Miner", 0), ("Miner", 1), ("Miner", 2), ("Factory T1", 1), ("Factory T2", 2), ("Factory T3", 3),
+              ("Accelerator", 3), ("Defense", 3), ("Diamond Mine", 4)]
+
+def random_player(rng: random.Random) -> PlayerState:
+    p = PlayerState(id="p", name="P", money=rng.choice([0, 500, rng.randint(0, 100000)]), land_limit=rng.randint(1, 6),
+                    inventory={k: rng.choice([0, rng.randint(0, 4), rng.randint(0, 15)]) for k in config.ITEM_IDS},
+                    factories=[])
+    for j in range(rng.randint(0, 5)):
+        name, tier = rng.choice(FACILITIES)
+        p.factories.append(Factory(id=f"f{j}", tier=tier, name=name, has_produced=rng.random() < 0.2))
+    return p
+
+def random_action(rng: random.Random, p: PlayerState):
+    """隨機挑一個行動 (含不存在的設施、未知或重複的材料、非正數數量)，回傳 (種類, 對引擎與玩家執行的函式)。"""
+    materials = [rng.choice(MATERIALS) for _ in range(rng.randint(0, 4))]
+    factory_id = rng.choice([f.id for f in p.factories] + ["missing"])
+    item_id, qty = rng.choice(MATERIALS[:-1]), rng.choice([-1, 0, 1, 2, 5])
+    kind = rng.choice(["produce", "build", "build_special", "land", "upgrade", "bank_sell"])
+    if kind == "produce":
+        # 萬能工廠的替代邏輯後來刻意改過 (tests/test_substitution.py)，這裡只比對一般設施
+        return kind, lambda e, pl: e.process_production(pl, factory_id, item_id, qty)
+    if kind == "build":
+        tier = rng.choice([0, 1, 2])
+        return kind, lambda e, pl: e.process_build_new(pl, tier, materials)
+    if kind == "build_special":
+        b_type = rng.choice(list(config.SPECIAL_FACILITIES) + ["special_unknown"])
+        return kind, lambda e, pl: e.process_build_special(pl, b_type, materials)
+    if kind == "land":
+        # 擴充土地：選超過需要的 T3 種類時，扣哪幾種取決於去重後的順序
+        materials = [rng.choice(T3) for _ in range(rng.randint(3, 6))]
+        return kind, lambda e, pl: e.process_build_special(pl, "special_land", materials)
+    if kind == "upgrade":
+        return kind, lambda e, pl: e.process_upgrade(pl, factory_id, materials)
+    return kind, lambda e, pl: e.process_bank_sell(pl, item_id, qty)
+
+def snapshot(p: PlayerState) -> tuple:
+    return (p.money, p.land_limit, p.inventory.to_dict(),
+            [(f.id, f.name, f.tier, f.has_produced, f.current_product) for f in p.factories])
+
+def run(engine_cls, seed: int, player: PlayerState, action):
+    engine = engine_cls(seed=seed)
+    player = copy.deepcopy(player)
+    try:
+        result = action(engine, player)
+    except KeyError as e:
+        result = ("KeyError", str(e))
+    return result, snapshot(player)
+
+@pytest.fixture
+def ordered_set(monkeypatch):
+    """
+    舊版擴充土地用 list(set(材料)) 去除重複，挑中哪幾種材料取決於字串雜湊 (每個行程不同)；
+    現在依玩家選擇的順序。比對時把舊版的 set 換成保留順序的去重，其餘邏輯不變。
+    """
+    monkeypatch.setattr(legacy_phase2, "set", lambda items: dict.fromkeys(items), raising=False)
+
+def test_validators_match_legacy(ordered_set):
+    rng = random.Random(20)
+    unknown_rejected = 0
+    for case in range(3000):
+        p = random_player(rng)
+        kind, action = random_action(rng, p)
+
+        old, old_state = run(LegacyEngine, case, p, action)
+        new, new_state = run(GameEngine, case, p, action)
+        if old[0] == "KeyError":
+            # 刻意的改變 1：未知的材料以一般的錯誤訊息拒絕，不再丟出 KeyError (HTTP 500)，玩家狀態不變
+            assert new[0] is False, (case, kind, new)
+            assert new_state == snapshot(p), (case, kind)
+            unknown_rejected += 1
+            continue
+        assert new == old, (case, kind)
+        assert new_state == old_state, (case, kind)
+    assert unknown_rejected > 0 # 隨機資料中確實出現了未知材料的情況
+
+# --- 刻意的改變，逐一固定下來 ---
+def player_with(**stock) -> PlayerState:
+    return PlayerState(id="p", name="P", money=10000, land_limit=3, inventory=stock, factories=[])
+
+@pytest.mark.parametrize("call", [
+    lambda e, p: e.process_build_new(p, 1, ["silicon", UNKNOWN]),
+    lambda e, p: e.process_upgrade(p, "m", [UNKNOWN]),
+    lambda e, p: e.process_upgrade(p, "t1", [UNKNOWN, "silicon", "iron"]),
+])
+def test_unknown_material_is_rejected_not_raised(call):
+    p = player_with(silicon=10, iron=10)
+    p.factories.append(Factory(id="m", tier=0, name="Miner"))
+    p.factories.append(Factory(id="t1", tier=1, name="Factory T1"))
+    with pytest.raises(KeyError):
+        call(LegacyEngine(seed=1), copy.deepcopy(p))
+
+    before = snapshot(p)
+    ok, msg = call(GameEngine(seed=1), p)
+    assert not ok and msg
+    assert snapshot(p) == before
+
+def test_land_expansion_uses_the_players_material_order():
+    # 選了四種 T3，只需要三種：依玩家的順序取前三種 (舊版依 set 的順序，重播時可能扣到不同的物品)
+    p = player_with(quantum=1, upload=1, elevator=1, terraform=1)
+    ok, msg = GameEngine(seed=1).process_build_special(p, "special_land", ["terraform", "quantum", "terraform", "elevator", "upload"])
+    assert ok, msg
+    assert p.land_limit == 4
+    assert {k: v for k, v in p.inventory.items() if v} == {"upload": 1}
@@ -0,0 +1,161 @@
+import copy
+import random
+
+import pytest
+
+import config
+import core.settlement as settlement
+from core.engine import GameEngine
+from core.models import Factory, PlayerState
+
+# --- 舊版：逐一玩家結算 (改成批次前的 process_end_of_turn / 庫存盤點)，作為差異比對的基準 ---
+def legacy_end_of_turn(rng: random.Random, event: dict, players: dict) -> list:
+    logs = []
+    if event.get("type") == "SPECIAL" and event.get("logic_key") == "ROBIN_HOOD_TAX":
+        sorted_players = sorted(players.values(), key=lambda x: x.money, reverse=True)
+        top_3, others = sorted_players[:3], sorted_players[3:]
+        tax_pool = 0
+        for tp in top_3:
+            tax = int(tp.money * 0.3)
+            tp.money -= tax
+            tax_pool += tax
+        if others and tax_pool > 0:
+            share = tax_pool // len(others)
+            for op in others: op.money += share
+        logs.append(f"⚖️ 反壟斷法：前 3 名玩家扣除 30% 稅金共 ${tax_pool}，已平分給其餘玩家！")
+
+    for p in players.values():
+        player_logs = []
+        capacity = p.factories.storage_capacity
+        tax_total = 0
+        for qty in p.inventory.values():
+            if qty > capacity:
+                excess = qty - capacity
+                if excess <= 3: tax_total += excess * 100
+                elif excess <= 7: tax_total += excess * 200
+                else: tax_total += excess * 500
+        if tax_total > 0:
+            p.money -= tax_total
+            player_logs.append(f"倉儲超載稅：扣除 ${tax_total}")
+
+        if event.get("type") == "DEFENSE_CHECK":
+            req_item, req_qty = event["req_item"], event["req_qty"]
+            if p.inventory.get(req_item, 0) >= req_qty:
+                p.inventory[req_item] -= req_qty
+                player_logs.append(f" 成功上繳 {req_qty} 個 {config.ITEMS[req_item]['label']} 抵禦災害！")
+            elif p.factories.has_defense:
+                player_logs.append(f" 防災中心啟動！完美抵禦了災害！")
+            else:
+                penalty = event["penalty"]
+                if penalty == "SHUTDOWN_FACILITIES":
+                    for f in p.factories: f.is_shutdown = True
+                    player_logs.append(" 災害命中：所有設施下回合停擺！")
+                elif penalty == "HALVE_CASH":
+                    lost = p.money - int(p.money * 0.5)
+                    p.money = int(p.money * 0.5)
+                    player_logs.append(f" 災害命中：現金減半 (損失 ${lost})！")
+                elif penalty == "DESTROY_FACTORY":
+                    if p.factories:
+                        destroyed = rng.choice(p.factories)
+                        p.factories.remove(destroyed)
+                        player_logs.append(f" 災害命中：{destroyed.name} (Lv.{destroyed.tier}) 被摧毀了！")
+        if player_logs:
+            logs.append(f"【{p.name}】" + "".join(player_logs))
+    return logs
+
+def legacy_storage_penalty(players: dict):
+    for p in players.values():
+        limit = config.BASE_STORAGE_LIMIT + p.factories.cp_total
+        for _, v in p.inventory.items():
+            if v > limit:
+                excess = v - limit
+                penalty = min(excess, 3) * config.PENALTY_LOW
+                if excess > 3: penalty += min(excess - 3, 4) * config.PENALTY_MID
+                if excess > 7: penalty += (excess - 7) * config.PENALTY_HIGH
+                if p.money < penalty: p.money = 0
+                else: p.money -= penalty
+
+# --- 隨機狀態 ---
+FACILITY_NAMES = ["Miner", "Factory T1", "Accelerator", "Omni Factory", "Defense", "Prophet", "Diamond Mine"]
+
+def random_players(rng: random.Random, n: int) -> dict:
+    players = {}
+    for k in range(n):
+        # 常見的現金值重複出現，刻意製造反壟斷法的同額平手；也包含負數現金
+        money = rng.choice([rng.randint(-3000, 50000), 1000, 1000, 0, -1])
+        p = PlayerState(id=f"p{k}", name=f"P{k}", money=money, inventory={}, factories=[])
+        for item_id in config.ITEM_IDS:
+            p.inventory[item_id] = rng.choice([0, 0, rng.randint(0, 30), rng.randint(0, 8)])
+        for j in range(rng.randint(0, 6)):
+            p.factories.append(Factory(id=f"f{k}-{j}", tier=rng.randint(0, 3), name=rng.choice(FACILITY_NAMES)))
+        players[p.id] = p
+    return players
+
+def snapshot(players: dict) -> list:
+    return [(p.id, p.money, p.inventory.to_dict(), [(f.id, f.tier, f.is_shutdown) for f in p.factories])
+            for p in players.values()]
+
+DEFENSE_EVENTS = [e for e in config.EVENTS_DB if e["type"] == "DEFENSE_CHECK"]
+ROBIN_HOOD = next(e for e in config.EVENTS_DB if e.get("logic_key") == "ROBIN_HOOD_TAX")
+EVENTS = DEFENSE_EVENTS + [ROBIN_HOOD, {}]
+
+@pytest.fixture(params=["python", "numpy"])
+def backend(request, monkeypatch):
+    if request.param == "numpy":
+        if settlement.np is None: pytest.skip("未安裝 NumPy")
+        monkeypatch.setattr(settlement, "NUMPY_MIN_PLAYERS", 1)
+    else:
+        monkeypatch.setattr(settlement, "NUMPY_MIN_PLAYERS", 10 ** 9)
+    return request.param
+
+def test_events_cover_every_defense_penalty():
+    assert {e["penalty"] for e in DEFENSE_EVENTS} == {"SHUTDOWN_FACILITIES", "HALVE_CASH", "DESTROY_FACTORY"}
+
+@pytest.mark.parametrize("event", EVENTS, ids=lambda e: e.get("penalty") or e.get("logic_key") or "none")
+@pytest.mark.parametrize("size", [0, 1, 3, 4, 20, 250])
+def test_end_of_turn_matches_legacy(backend, event, size):
+    rng = random.Random(f"{size}-{event.get('id')}")
+    for trial in range(8):
+        players = random_players(rng, size)
+        expected_players = copy.deepcopy(players)
+        engine = GameEngine(seed=trial)
+        engine.current_event = event
+        # 舊版與引擎用同一顆種子的亂數，摧毀設施時才會選到同一座
+        expected_logs = legacy_end_of_turn(GameEngine(seed=trial).rng, event, expected_players)
+        assert engine.process_end_of_turn(players) == expected_logs
+        assert snapshot(players) == snapshot(expected_players)
+        assert all(type(p.money) is int for p in players.values())
+
+@pytest.mark.parametrize("size", [0, 1, 5, 250])
+def test_storage_penalty_matches_legacy(backend, size):
+    rng = random.Random(size)
+    for trial in range(10):
+        players = random_players(rng, size)
+        expected = copy.deepcopy(players)
+        legacy_storage_penalty(expected)
+        GameEngine(seed=trial).execute_call_auction(players)
+        assert snapshot(players) == snapshot(expected)
+
+def test_robin_hood_ties_follow_join_order(backend):
+    players = {f"p{k}": PlayerState(id=f"p{k}", name=f"P{k}", money=m, inventory={}, factories=[])
+               for k, m in enumerate([500, 1000, 1000, 1000, 1000, -200])}
+    engine = GameEngine(seed=1)
+    engine.current_event = ROBIN_HOOD
+    engine.process_end_of_turn(players)
+    # 同額的 p1~p4 中，先加入的 p1~p3 被課稅；稅金 900 平分給 p0、p4、p5
+    assert [p.money for p in players.values()] == [800, 700, 700, 700, 1300, 100]
+
+def test_negative_cash_penalties(backend):
+    halve = next(e for e in DEFENSE_EVENTS if e["penalty"] == "HALVE_CASH")
+    players = {f"p{k}": PlayerState(id=f"p{k}", name=f"P{k}", money=m, inventory={}, factories=[])
+               for k, m in enumerate([-101, -1, 0, 7])}
+    engine = GameEngine(seed=1)
+    engine.current_event = halve
+    engine.process_end_of_turn(players)
+    assert [p.money for p in players.values()] == [-50, 0, 0, 3] # 與 int() 相同，往 0 捨去
+
+    # 庫存盤點：有罰款且現金不足 (包含負數現金) 一律歸零
+    for p in players.values(): p.inventory[config.ITEM_IDS[0]] = config.BASE_STORAGE_LIMIT + 1
+    players["p3"].money = 10 ** 6
+    engine.execute_call_auction(players)
+    assert [p.money for p in players.values()] == [0, 0, 0, 10 ** 6 - config.PENALTY_LOW]
@@ -0,0 +1,24 @@
+import config
+from core.engine import GameEngine
+from simulation.bots import place_order
+from simulation.runner import new_player, run_game, settle_trades, DEFAULT_LINEUP
+
+def test_same_seed_same_game():
+    assert run_game(7, DEFAULT_LINEUP, turns=4) == run_game(7, DEFAULT_LINEUP, turns=4)
+    assert new_player("p0", "a").factories[0].id == new_player("p0", "b").factories[0].id
+
+def test_volume_counts_fills_not_dropped_asks():
+    engine = GameEngine(seed=1)
+    players = {pid: new_player(pid, pid) for pid in ("buyer", "seller", "broken")}
+    players["seller"].inventory["iron"] = 3
+    players["broken"].inventory["iron"] = 5
+    price = engine.market_prices["iron"]
+    assert place_order(engine, players["broken"], "ASK", "iron", price - 1, 5)[0]
+    assert place_order(engine, players["seller"], "ASK", "iron", price, 3)[0]
+    assert place_order(engine, players["buyer"], "BID", "iron", price, 6)[0]
+    players["broken"].locked_inventory["iron"] = 0 # 最優先的賣單因鎖定庫存異常被移出訂單簿，沒有成交
+
+    _, _, traded = settle_trades(engine, players, 3, 1)
+    assert traded[config.ITEM_INDEX["iron"]] == 3 # 以前以「從訂單簿消失的數量」計算會得到 8
+    assert players["buyer"].inventory["iron"] == 3
+    assert sum(traded) == 3
@@ -0,0 +1,168 @@
+import random
+
+import pytest
+
+import config
+from core.engine import GameEngine
+from core.models import Factory, PlayerState
+from core.substitution import (
+    PREFER_CHEAPEST, PREFER_DEFAULT, PREFER_PRICIEST, allocate_ingredients, check_preference, substitution_order,
+)
+
+I = config.ITEM_INDEX
+
+def counts_of(**stock) -> list:
+    counts = [0] * config.ITEM_COUNT
+    for item_id, qty in stock.items(): counts[I[item_id]] = qty
+    return counts
+
+def counts_to_dict(counts: list) -> dict:
+    return dict(zip(config.ITEM_IDS, counts))
+
+def named(take: dict) -> dict:
+    return {config.ITEM_IDS[i]: n for i, n in take.items() if n}
+
+# --- 舊版：每種原料各自檢查同階級的替代品總量，再依序扣除 (改成整份配方一起分配前的 process_production) ---
+def legacy_omni(counts: list, recipe, batches: int):
+    """回傳 (是否接受, 扣完後的庫存)。"""
+    counts = list(counts)
+    for ing, qty in recipe:
+        need = qty * batches
+        if counts[ing] >= need: continue
+        subs = sum(counts[s] for s in config.TIER_INDEXES[config.ITEM_TIERS[ing]] if s != ing)
+        if subs < need - counts[ing]: return False, counts
+    for ing, qty in recipe:
+        need = qty * batches
+        have = counts[ing]
+        if have >= need:
+            counts[ing] -= need
+            continue
+        counts[ing] = 0
+        shortage = need - have
+        for s in config.TIER_INDEXES[config.ITEM_TIERS[ing]]:
+            if shortage <= 0: break
+            if s != ing:
+                take = min(counts[s], shortage)
+                counts[s] -= take
+                shortage -= take
+    return True, counts
+
+DEFAULT = substitution_order(PREFER_DEFAULT)
+
+# --- 兩種原料共用同一個替代品 ---
+def test_shared_substitute_is_not_counted_twice():
+    # 曲速引擎：反應爐 x3 (T2) + 晶圓 x1 + 鋼樑 x1 (都是 T1)；晶圓與鋼樑都缺，唯一的 T1 替代品是 1 個燃料
+    recipe = config.RECIPES["warp_core"]
+    counts = counts_of(reactor=3, fuel=1)
+
+    accepted, _ = legacy_omni(counts, recipe, 1)
+    assert accepted # 舊版：兩種原料各自看到「還有 1 個燃料」，都算夠
+    take, missing = allocate_ingredients(counts, recipe, 1, DEFAULT)
+    assert missing == I["wafer"] # 現在：T1 缺口合計 2，只有 1 個燃料，拒絕生產
+
+    take, missing = allocate_ingredients(counts_of(reactor=3, fuel=2), recipe, 1, DEFAULT)
+    assert missing is None
+    assert named(take) == {"reactor": 3, "fuel": 2}
+
+def test_own_stock_is_used_before_substitutes():
+    # 晶圓自己夠用，鋼樑缺 1：不能拿晶圓去補鋼樑，只能用燃料
+    recipe = config.RECIPES["warp_core"]
+    take, missing = allocate_ingredients(counts_of(reactor=3, wafer=1, fuel=1), recipe, 1, DEFAULT)
+    assert missing is None
+    assert named(take) == {"reactor": 3, "wafer": 1, "fuel": 1}
+    _, missing = allocate_ingredients(counts_of(reactor=3, wafer=2), recipe, 1, DEFAULT)
+    assert missing is None
+
+def test_plain_factory_never_substitutes():
+    recipe = config.RECIPES["warp_core"]
+    _, missing = allocate_ingredients(counts_of(reactor=3, wafer=1, fuel=1), recipe, 1)
+    assert missing == I["beam"]
+
+@pytest.mark.parametrize("seed", range(5))
+def test_matches_legacy_except_double_counted_substitutes(seed):
+    """
+    與舊版的差異比對：
+    - 舊版扣料正確 (扣除總量 = 需求總量) 時，預設順序的扣料與舊版完全相同
+    - 舊版接受、現在拒絕的只有同一個替代品被兩種原料重複計算、實際少扣的情況
+    - 現在接受的，舊版一定也接受
+    """
+    rng = random.Random(seed)
+    omni_recipes = [r for item_id, r in config.RECIPES.items() if config.ITEMS[item_id]["tier"] >= 2]
+    changed = 0
+    for _ in range(4000):
+        recipe = rng.choice(omni_recipes)
+        batches = rng.randint(1, 2)
+        counts = [rng.choice([0, 0, 1, 2, 3, 6]) for _ in range(config.ITEM_COUNT)]
+        accepted, after = legacy_omni(counts, recipe, batches)
+        take, missing = allocate_ingredients(counts, recipe, batches, DEFAULT)
+        if missing is None:
+            assert accepted
+        if not accepted:
+            assert missing is not None
+            continue
+        consumed = sum(counts) - sum(after)
+        needed = sum(qty * batches for _, qty in recipe)
+        if consumed == needed:
+            assert missing is None
+            assert {i: n for i, n in take.items() if n} == {i: counts[i] - after[i] for i in range(config.ITEM_COUNT) if counts[i] != after[i]}
+        else:
+            assert consumed < needed and missing is not None
+            changed += 1
+    assert changed > 0 # 隨機資料中確實出現了行為改變的情況
+
+# --- 替代順序 ---
+T1 = ["wafer", "beam", "fuel"]
+
+def test_substitution_orders():
+    prices = [0] * config.ITEM_COUNT
+    prices[I["wafer"]], prices[I["beam"]], prices[I["fuel"]] = 1300, 900, 1300
+    tier = config.ITEM_TIERS[I["wafer"]]
+    ids = lambda order: [config.ITEM_IDS[i] for i in order(tier)]
+
+    assert ids(substitution_order(None)) == T1
+    assert ids(substitution_order(PREFER_DEFAULT)) == T1
+    assert ids(substitution_order(PREFER_CHEAPEST, prices)) == ["beam", "wafer", "fuel"]  # 同價依序號
+    assert ids(substitution_order(PREFER_PRICIEST, prices)) == ["wafer", "fuel", "beam"]
+    assert ids(substitution_order(["fuel"])) == ["fuel", "wafer", "beam"]                 # 列出的先用，其餘依序號
+    assert ids(substitution_order(["fuel", "processor", "beam"])) == ["fuel", "beam", "wafer"]
+
+def test_preference_decides_which_leftover_is_taken():
+    # 曲速引擎缺 1 個鋼樑，晶圓多 2 個、燃料 2 個都能補
+    recipe = config.RECIPES["warp_core"]
+    counts = counts_of(reactor=3, wafer=3, fuel=2)
+    prices = [0] * config.ITEM_COUNT
+    prices[I["wafer"]], prices[I["fuel"]] = 1500, 1000
+    taken = lambda pref: named(allocate_ingredients(counts, recipe, 1, substitution_order(pref, prices))[0])
+
+    assert taken(PREFER_DEFAULT) == {"reactor": 3, "wafer": 2}
+    assert taken(PREFER_CHEAPEST) == {"reactor": 3, "wafer": 1, "fuel": 1}
+    assert taken(PREFER_PRICIEST) == {"reactor": 3, "wafer": 2}
+    assert taken(["fuel"]) == {"reactor": 3, "wafer": 1, "fuel": 1}
+
+def test_check_preference():
+    assert check_preference(None) is None
+    assert check_preference(PREFER_CHEAPEST) is None
+    assert check_preference(["fuel", "wafer"]) is None
+    assert check_preference("newest") is not None
+    assert check_preference(["fuel", "unobtainium"]) is not None
+
+# --- 透過引擎：試算與實際生產扣除同樣的物品 ---
+def test_engine_preview_matches_production():
+    engine = GameEngine(seed=1)
+    engine.market_prices = {k: v["base_price"] for k, v in config.ITEMS.items()}
+    engine.market_prices["wafer"] = 5000
+    p = PlayerState(id="p", name="P", money=0, inventory={"reactor": 3, "wafer": 3, "fuel": 2},
+                    factories=[Factory(id="omni", tier=3, name="Omni Factory")])
+
+    ok, preview = engine.preview_production(p, "omni", "warp_core", 1, PREFER_PRICIEST)
+    assert ok, preview
+    assert preview["substituted"] == {"wafer": 1}
+    ok, msg = engine.process_production(p, "omni", "warp_core", 1, PREFER_PRICIEST)
+    assert ok, msg
+    assert {k: v for k, v in p.inventory.items() if v} == {"fuel": 2, "wafer": 1, "warp_core": 1}
+
+    q = PlayerState(id="q", name="Q", money=0, inventory={"reactor": 3, "fuel": 1},
+                    factories=[Factory(id="omni", tier=3, name="Omni Factory")])
+    ok, msg = engine.process_production(q, "omni", "warp_core", 1)
+    assert not ok
+    assert q.inventory.to_dict() == counts_to_dict(counts_of(reactor=3, fuel=1))